@@ -3,6 +3,10 @@ ASGI config for colorgrid_game project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn colorgrid_game.asgi:application``)
+to enable the room event stream at ``session/<code>/events/``; under WSGI the
+pages fall back to polling ``player_redirect_status``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,10 +60,18 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.InstrumentedDjangoTemplates',  # DjangoTemplates + render timing
         'DIRS': [BASE_DIR / "templates"],  # <--- this line enables your global templates folder
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are compiled once per process. Spelled out (instead of
+            # APP_DIRS) so production keeps the cached loader even if the list
+            # changes; during development the autoreloader resets it on edits.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -87,6 +96,120 @@ DATABASES = {
 }
 
 
+# Sessions
+# The session only identifies the player (code, player_id, name, device),
+# so it is kept in a signed cookie: polls resolve the player without
+# reading django_session. Use "django.contrib.sessions.backends.cache" to
+# keep the data server-side, or ".db" for the previous behaviour.
+# Compare them with: python manage.py benchmark session_backends
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+
+# Game rooms
+# InMemorySessionStore keeps rooms in the process and only works with a
+# single worker. To run several workers on one box, share the rooms through
+# SQLite instead:
+#     "BACKEND": "core.store.SQLiteSessionStore",
+#     "OPTIONS": {"path": BASE_DIR / "rooms.sqlite3"},
+
+GAME_SESSION_STORE = {
+    "BACKEND": "core.store.InMemorySessionStore",
+    "OPTIONS": {},
+}
+
+# Room codes are 7 characters: 6 for a number taken from a counter and
+# shuffled by a permutation keyed with KEY (SECRET_KEY by default), plus a
+# check character that turns typos into a 404 without any lookup. Workers
+# reserve counter blocks in the database, so codes are unique across
+# processes and restarts. Changing KEY starts a different permutation,
+# which may reuse codes of archived games.
+GAME_ROOM_CODES = {
+    "KEY": None,
+}
+
+# Rooms idle for more than IDLE_TTL seconds, and the least recently used
+# rooms beyond MAX_ROOMS, are archived to the database and dropped from the
+# store. A background thread sweeps every SWEEP_INTERVAL seconds (None
+# disables it; the cap is still enforced whenever a room is created).
+GAME_ROOM_EVICTION = {
+    "IDLE_TTL": 6 * 60 * 60,
+    "MAX_ROOMS": 5000,
+    "SWEEP_INTERVAL": 60,
+}
+
+# Rooms are written to the database in the background, batched every
+# FLUSH_INTERVAL seconds (or once MAX_PENDING rooms changed), and loaded
+# back from it when a code is missing from the store, e.g. after a restart.
+GAME_PERSISTENCE = {
+    "ENABLED": True,
+    "FLUSH_INTERVAL": 2.0,
+    "MAX_PENDING": 100,
+}
+
+# Every change of a room can also be appended to an event log under PATH
+# (one file per room), with a snapshot of the room every SNAPSHOT_EVERY
+# events. Rooms are then rebuilt from their latest snapshot and log tail
+# after a restart, before falling back to the database, and the log keeps
+# the full history of each game. FSYNC makes every append durable at the
+# cost of a disk flush per change. Inspect a room with:
+#     python manage.py room_log CODE
+GAME_EVENT_LOG = {
+    "ENABLED": False,
+    "PATH": BASE_DIR / "eventlog",
+    "SNAPSHOT_EVERY": 200,
+    "FSYNC": False,
+}
+
+# How guesses are scored: "grid" counts cells between the guess and the
+# target (the classic rule); "perceptual" uses the CIEDE2000 distance
+# between their colors, which suits gradient boards. Both record the color
+# distance of every move.
+GAME_SCORING = {
+    "METHOD": "grid",
+}
+
+# Rooms with more than PLAYERS players (an audience on their phones) get
+# the audience view: the TV board shows how many guesses each cell got
+# instead of the players' initials, and the scoreboard and results list
+# only the TOP_N best players. The TV swaps in the new board at most
+# once every BOARD_REFRESH_MS milliseconds, however fast guesses come in.
+GAME_LARGE_ROOMS = {
+    "PLAYERS": 30,
+    "TOP_N": 10,
+    "BOARD_REFRESH_MS": 1000,
+}
+
+# Request, template and store timings plus room figures, served in the
+# Prometheus text format at /metrics/. ALLOWED_IPS limits who may scrape
+# it (None allows everyone).
+GAME_METRICS = {
+    "ENABLED": True,
+    "ALLOWED_IPS": ["127.0.0.1", "::1"],
+}
+
+# Game events are logged as "event key=value ...". Only warnings are
+# shown by default, which keeps test and load test runs quiet; set
+# GAME_LOG_LEVEL=INFO to see game events. Hot-path debug messages are
+# sampled, so GAME_LOG_LEVEL=DEBUG stays usable under load.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "loggers": {
+        "core": {
+            "handlers": ["console"],
+            "level": os.environ.get("GAME_LOG_LEVEL", "WARNING"),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -0,0 +1,410 @@
+import json
+import random
+import tempfile
+import timeit
+import tracemalloc
+
+from django.conf import settings
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.html import conditional_escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .boardgrid import grid_parts, heatmap_overlay, moves_overlay, render_grid
+from .codes import CodeAllocator, normalize_code
+from .eventlog import EventLog
+from .palettes import Palette, _gradient_params, _gradient_python, generate_gradient, get_palette
+from .room import Move, Player, RoomState, Round
+from .scoring import delta_e_2000, hex_to_lab, np, score_guess, score_moves
+from .simulator import sample_scores, simulate_games
+from .store import InMemorySessionStore, get_session_store
+
+# -------------------------------------------------------------
+# Micro-benchmarks of the game hot paths, run with
+#     python manage.py benchmark [name ...]
+# Each benchmark returns a list of result rows (dicts).
+# -------------------------------------------------------------
+
+BENCHMARKS = {}
+
+
+def register(name):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def per_call_us(func, number=2000, repeat=5):
+    """Best time per call of ``func`` in microseconds."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return best / number * 1e6
+
+
+def build_room(players, moves_per_player=1):
+    """A room in its first round with ``players`` guessers plus host and explainer."""
+    room = RoomState()
+    room.add_player(Player(id="host", name="TV", device="tv", is_host=True))
+    room.add_player(Player(id="explainer", name="Eva"))
+    for i in range(players):
+        room.add_player(Player(id=f"p{i}", name=f"P{i}"))
+    room.add_round(Round(
+        round_number=1,
+        explainer_id="explainer",
+        target_row=2,
+        target_col=2,
+        short_hint="mar",
+        long_hint="azul do oceano",
+    ))
+    room.status = "in_game"
+    for attempt in range(1, moves_per_player + 1):
+        for i in range(players):
+            room.record_move(f"p{i}", attempt, 0, 0, distance=2, score=2, delta_e=12.5)
+    return room
+
+
+def legacy_layout(room):
+    """``room`` in the plain dict layout rooms were kept in before the slotted model."""
+    players = [p.to_dict() for p in room.players]
+    rounds = []
+    for r in room.rounds:
+        rounds.append({
+            "round_number": r.round_number,
+            "explainer_id": r.explainer_id,
+            "target_color": r.target_color,
+            "target_position": {"row": r.target_row, "col": r.target_col},
+            "short_hint": r.short_hint,
+            "long_hint": r.long_hint,
+            "moves": [
+                {
+                    "player_id": room.players[m.player].id,
+                    "attempt_number": m.attempt_number,
+                    "row": m.row, "col": m.col, "distance": m.distance,
+                    "delta_e": m.delta_e, "score": m.score,
+                }
+                for m in r.moves
+            ],
+        })
+    return {"mode": room.mode, "status": room.status, "players": players, "rounds": rounds}
+
+
+def legacy_is_round_over(room, current_round):
+    """The scan-based check views used before rounds tracked their progress."""
+    explainer_id = current_round["explainer_id"]
+    expected_players = [
+        p["id"] for p in room["players"]
+        if p["id"] != explainer_id and not p.get("is_host")
+    ]
+    moves = current_round.get("moves", [])
+    players_with_two_moves = {
+        pid for pid in expected_players
+        if len([m for m in moves if m["player_id"] == pid]) == 2
+    }
+    return len(players_with_two_moves) == len(expected_players)
+
+
+@register("round_over")
+def bench_round_over():
+    """is_round_over and attempt detection, scan vs incremental counters."""
+    rows = []
+    for players in (2, 5, 10, 20, 50):
+        room = build_room(players)
+        current = room.current_round
+        legacy_room = legacy_layout(room)
+        legacy_round = legacy_room["rounds"][-1]
+        last = f"p{players - 1}"
+        legacy = per_call_us(lambda: legacy_is_round_over(legacy_room, legacy_round))
+        incremental = per_call_us(lambda: room.is_round_over(current))
+        legacy_attempt = per_call_us(
+            lambda: len([m for m in legacy_round["moves"] if m["player_id"] == last])
+        )
+        incremental_attempt = per_call_us(lambda: room.attempts_of(last))
+        rows.append({
+            "players": players,
+            "round_over_scan_us": round(legacy, 3),
+            "round_over_counter_us": round(incremental, 3),
+            "round_over_speedup": round(legacy / incremental, 1),
+            "attempt_scan_us": round(legacy_attempt, 3),
+            "attempt_counter_us": round(incremental_attempt, 3),
+        })
+    return rows
+
+
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}
+
+
+@register("session_backends")
+def bench_session_backends():
+    """Requests per second of the redirect status poll under each session engine."""
+    rows = []
+    # Benchmark rooms stay out of the database.
+    with override_settings(GAME_PERSISTENCE={"ENABLED": False}):
+        for label, engine in SESSION_ENGINES.items():
+            with override_settings(SESSION_ENGINE=engine):
+                host = Client(HTTP_HOST="localhost")
+                host.post(reverse("create_session"), {"mode": "local", "name": "TV"})
+                code = host.session["code"]
+                player = Client(HTTP_HOST="localhost")
+                player.post(reverse("join_session", args=[code]), {"name": "Ana"})
+                url = reverse("player_redirect_status", args=[code])
+
+                us = per_call_us(lambda: player.get(url), number=200, repeat=3)
+                rows.append({
+                    "engine": label,
+                    "us_per_request": round(us, 1),
+                    "requests_per_s": round(1e6 / us),
+                })
+
+                get_session_store().delete(code)
+                store = import_string(engine + ".SessionStore")
+                for client in (host, player):
+                    store(client.cookies[settings.SESSION_COOKIE_NAME].value).delete()
+    return rows
+
+
+@register("scoring")
+def bench_scoring():
+    """Per-guess delta E: table lookup vs computing CIEDE2000 on the spot."""
+    rows = []
+    for size in (5, 15, 30):
+        # A private palette, so the table is not already built by the shared one.
+        palette = Palette(0, size, size, generate_gradient(0, size, size))
+        start = timeit.default_timer()
+        palette.delta_e
+        build_ms = (timeit.default_timer() - start) * 1000
+        target = (size // 2, size // 2)
+        lab_target = hex_to_lab(palette.color_at(size // 2, size // 2))
+        guess_color = palette.color_at(0, size - 1)
+        direct = per_call_us(lambda: delta_e_2000(lab_target, hex_to_lab(guess_color)))
+        lookup = per_call_us(lambda: score_guess(palette, target, 0, size - 1))
+        moves = [Move(0, 1, i % size, (i * 7) % size, 0, 0, None) for i in range(100)]
+        batch = per_call_us(lambda: score_moves(palette, target, moves), number=200)
+        rows.append({
+            "board": f"{size}x{size}",
+            "numpy": np is not None,
+            "table_build_ms": round(build_ms, 1),
+            "direct_us": round(direct, 2),
+            "lookup_us": round(lookup, 2),
+            "batch_100_moves_us": round(batch, 1),
+        })
+    return rows
+
+
+@register("palettes")
+def bench_palettes():
+    """Generating a gradient board, and fetching a shared one from the cache."""
+    rows = []
+    for size in ((5, 5), (30, 16), (30, 30)):
+        params = _gradient_params(7)
+        python = per_call_us(lambda: _gradient_python(*size, params), number=200)
+        generate = per_call_us(lambda: generate_gradient(7, *size), number=200)
+        get_palette(7, *size)
+        cached = per_call_us(lambda: get_palette(7, *size))
+        rows.append({
+            "board": "%dx%d" % size,
+            "numpy": np is not None,
+            "python_us": round(python, 1),
+            "generate_us": round(generate, 1),
+            "cache_hit_us": round(cached, 2),
+        })
+    return rows
+
+
+@register("eventlog")
+def bench_eventlog():
+    """Recording one change, and rebuilding a long game from the log."""
+    rows = []
+    for moves in (1000, 5000):
+        for snapshot_every in (200, 10 ** 9):
+            with tempfile.TemporaryDirectory() as path:
+                log = EventLog(path, snapshot_every=snapshot_every)
+                store = InMemorySessionStore()
+                store.recorder = log.record
+                store.add("BENCH1", build_room(players=20, moves_per_player=0))
+                start = timeit.default_timer()
+                for i in range(moves):
+                    with store.update("BENCH1") as room:
+                        room.record_move(f"p{i % 20}", 1, 0, 0, distance=2, score=2, delta_e=12.5)
+                record_us = (timeit.default_timer() - start) / moves * 1e6
+                recover = per_call_us(lambda: log.load("BENCH1"), number=5, repeat=3)
+                rows.append({
+                    "moves": moves,
+                    "snapshots": "every 200" if snapshot_every == 200 else "none",
+                    "record_us": round(record_us, 1),
+                    "recover_ms": round(recover / 1000, 2),
+                })
+    return rows
+
+
+def scan_board_grid(room, round_data):
+    """Board grid as rendered before the occupancy index: every move, then every cell."""
+    geometry, players = room.geometry, room.players
+    overlay = {}
+    for move in round_data.moves:
+        index = geometry.index(move.row, move.col)
+        initials = players[move.player].name[:2].upper()
+        overlay[index] = f"{overlay[index]} {initials}" if index in overlay else initials
+    palette = room.palette
+    parts = grid_parts(palette)
+    pieces = [parts[0]]
+    for index, part in enumerate(parts[1:]):
+        text = overlay.get(index)
+        if text:
+            pieces.append(conditional_escape(text))
+        pieces.append(part)
+    return mark_safe("".join(pieces))
+
+
+@register("board_render")
+def bench_board_render():
+    """TV board grid with every guess in: rescanning the moves vs the occupancy index."""
+    rows = []
+    # Rooms are square, so the 30x16 case runs on a 30x30 board (more cells).
+    for size, players in ((5, 25), (30, 100)):
+        room = build_room(players, moves_per_player=0)
+        room.start(size, 7)
+        room.add_round(Round(round_number=2, explainer_id="explainer"))
+        for attempt in (1, 2):
+            for i in range(players):
+                room.record_move(f"p{i}", attempt, (i * 7 + attempt) % size, (i * 3) % size,
+                                 distance=0, score=0)
+        current = room.current_round
+        assert scan_board_grid(room, current) == render_grid(room.palette, moves_overlay(room, current))
+        scan = per_call_us(lambda: scan_board_grid(room, current), number=500)
+        index = per_call_us(lambda: render_grid(room.palette, moves_overlay(room, current)), number=500)
+        rows.append({
+            "board": f"{size}x{size}",
+            "players": players,
+            "moves": len(current.moves),
+            "scan_us": round(scan, 1),
+            "index_us": round(index, 1),
+            "speedup": round(scan / index, 1),
+        })
+    return rows
+
+
+@register("audience")
+def bench_audience():
+    """Large rooms: recording a guess, and drawing the TV board as a heatmap."""
+    rows = []
+    for players in (50, 200, 500):
+        room = build_room(players, moves_per_player=0)
+        room.start(15, 7)
+        room.add_round(Round(round_number=2, explainer_id="explainer"))
+        start = timeit.default_timer()
+        for attempt in (1, 2):
+            for i in range(players):
+                room.record_move(f"p{i}", attempt, i % 15, (i * attempt) % 15, distance=1, score=3)
+        ingest = (timeit.default_timer() - start) / (2 * players) * 1e6
+        current = room.current_round
+        initials = per_call_us(lambda: render_grid(room.palette, moves_overlay(room, current)), number=200)
+        heatmap = per_call_us(lambda: render_grid(room.palette, heatmap_overlay(current)), number=200)
+        rows.append({
+            "players": players,
+            "numpy": np is not None,
+            "record_move_us": round(ingest, 2),
+            "initials_board_us": round(initials, 1),
+            "heatmap_board_us": round(heatmap, 1),
+        })
+    return rows
+
+
+@register("leaderboard")
+def bench_leaderboard():
+    """Score change and top 10 from the leaderboard vs sorting every player per poll."""
+    rows = []
+    for players in (50, 500, 5000):
+        room = build_room(players, moves_per_player=0)
+        rng = random.Random(players)
+        for i in range(players):
+            room.award_points(f"p{i}", rng.randrange(100))
+        player = room.get_player(f"p{players // 2}")
+        update = per_call_us(lambda: room.award_points(player.id, 1))
+        top = per_call_us(lambda: room.leaderboard.top(10))
+        rank = per_call_us(lambda: room.leaderboard.rank(player.index))
+        sort = per_call_us(
+            lambda: sorted((p for p in room.players if not p.is_host), key=lambda p: -p.points)[:10],
+            number=200,
+        )
+        rows.append({
+            "players": players,
+            "update_us": round(update, 2),
+            "top10_us": round(top, 2),
+            "rank_us": round(rank, 2),
+            "sort_all_us": round(sort, 1),
+        })
+    return rows
+
+
+@register("codes")
+def bench_codes():
+    """Allocating a room code, and rejecting or accepting a typed one."""
+    counter = iter(range(1, 10 ** 6))
+    allocator = CodeAllocator(b"bench", reserve=lambda: next(counter))
+    code = allocator.allocate()
+    typo = code[:-1] + ("0" if code[-1] != "0" else "1")
+    return [{
+        "allocate_us": round(per_call_us(allocator.allocate), 2),
+        "validate_us": round(per_call_us(lambda: normalize_code(code.lower())), 2),
+        "reject_typo_us": round(per_call_us(lambda: normalize_code(typo)), 2),
+    }]
+
+
+def allocated_bytes(build):
+    """Bytes still allocated by what ``build()`` returns."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        return tracemalloc.get_traced_memory()[0] - before, kept
+    finally:
+        tracemalloc.stop()
+
+
+@register("memory")
+def bench_memory():
+    """Bytes per room, slotted model vs the old dict layout, as loaded from the store."""
+    rows = []
+    for players, rounds in ((5, 5), (20, 10), (100, 10)):
+        room = build_room(players, moves_per_player=2)
+        for number in range(2, rounds + 1):
+            room.add_round(Round(round_number=number, explainer_id="explainer", target_row=2, target_col=2))
+            for attempt in (1, 2):
+                for i in range(players):
+                    room.record_move(f"p{i}", attempt, 0, 0, distance=2, score=2, delta_e=12.5)
+        # Both come back from JSON, like a room read from the shared store,
+        # so no string is shared between moves.
+        legacy_json = json.dumps(legacy_layout(room))
+        compact_json = json.dumps(room.to_dict())
+        legacy, _ = allocated_bytes(lambda: json.loads(legacy_json))
+        compact, _ = allocated_bytes(lambda: RoomState.from_dict(json.loads(compact_json)))
+        rows.append({
+            "players": players,
+            "moves": players * 2 * rounds,
+            "dict_bytes": legacy,
+            "slotted_bytes": compact,
+            "memory_ratio": round(legacy / compact, 1),
+            "dict_json_bytes": len(legacy_json),
+            "columnar_json_bytes": len(compact_json),
+        })
+    return rows
+
+
+@register("simulate")
+def bench_simulate():
+    """Synthetic games through the rules engine, and bulk-scored guesses."""
+    rows = []
+    for players in (4, 8):
+        report = simulate_games(500, players=players, seed=1)
+        rows.append({"run": f"games ({players} players)", "per_second": report["games_per_second"]})
+    guesses = 100_000
+    started = timeit.default_timer()
+    sample_scores(guesses, method="perceptual", seed=1)
+    rows.append({"run": "scored guesses", "per_second": round(2 * guesses / (timeit.default_timer() - started))})
+    return rows
@@ -0,0 +1,103 @@
+import threading
+import weakref
+
+from django.template.loader import render_to_string
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+
+# -------------------------------------------------------------
+# Board grid markup.
+# The labels and colored cells only depend on the palette, so
+# the grid template is rendered once per palette and split
+# around the content of each cell. A board page then only
+# fills in the guessed cells, read from the round's occupancy
+# index (or its heatmap in large rooms), and joins the pieces:
+# no work per empty cell or per move beyond the string join.
+# -------------------------------------------------------------
+
+GRID_TEMPLATE = "core/partials/board_grid.html"
+
+# Grid pieces by palette. Rooms hold their palette, so its markup stays
+# cached for as long as some room uses it.
+_grid_parts = weakref.WeakKeyDictionary()
+_grid_parts_lock = threading.Lock()
+
+# Stands in for the content of each cell while the grid is rendered.
+CELL_SLOT = "\x00"
+
+# Badges of the heatmap, from the least to the most guessed cells.
+HEAT_CLASSES = (
+    "bg-white/70 text-gray-900",
+    "bg-black/40 text-white",
+    "bg-black/60 text-white",
+    "bg-black/80 text-white ring-2 ring-white",
+)
+_HEAT_BADGES = tuple(f'<span class="rounded px-1 {classes}">%d</span>' for classes in HEAT_CLASSES)
+
+
+def cell_size(cols):
+    """Tailwind size of the cells: smaller on big boards so they still fit the TV."""
+    return "w-16 h-16" if cols <= 8 else "w-8 h-8" if cols <= 16 else "w-5 h-5"
+
+
+def grid_parts(palette):
+    """The grid markup of ``palette``, as the pieces between its cells' contents."""
+    parts = _grid_parts.get(palette)
+    if parts is None:
+        parts = _render_grid_parts(palette)
+        with _grid_parts_lock:
+            parts = _grid_parts.setdefault(palette, parts)
+    return parts
+
+
+def _render_grid_parts(palette):
+    geometry = palette.geometry
+    rows, cols = palette.rows, palette.cols
+    html = render_to_string(GRID_TEMPLATE, {
+        "column_count": cols + 1,
+        "col_labels": geometry.col_labels,
+        "rows": [
+            (label, palette.colors[r * cols:(r + 1) * cols])
+            for r, label in enumerate(geometry.row_labels)
+        ],
+        "cell_size": cell_size(cols),
+        "slot": CELL_SLOT,
+    })
+    return tuple(html.split(CELL_SLOT))
+
+
+def render_grid(palette, overlay=None):
+    """Grid of ``palette`` with ``overlay`` (cell index -> text) inside the cells."""
+    parts = grid_parts(palette)
+    if not overlay:
+        return mark_safe("".join(parts))
+    pieces = list(parts)
+    for index, text in overlay.items():
+        # The content of cell ``index`` follows the piece before it.
+        pieces[index] += conditional_escape(text)
+    return mark_safe("".join(pieces))
+
+
+def heatmap_overlay(round_data):
+    """Guess count badges on each guessed cell, shaded by how many guessed it.
+
+    Read from the round's heatmap, so it costs the same for ten guessers
+    or five hundred.
+    """
+    totals = round_data.heatmap.totals()
+    top = max(totals, default=0)
+    levels = len(_HEAT_BADGES)
+    return {
+        index: mark_safe(_HEAT_BADGES[(count * levels - 1) // top] % count)
+        for index, count in enumerate(totals) if count
+    }
+
+
+def moves_overlay(room, round_data):
+    """Initials of the players on each cell guessed in ``round_data``."""
+    players = room.players
+    return {
+        index: " ".join(players[p].name[:2].upper() for p in guessed)
+        for index, guessed in round_data.occupancy.items()
+    }
@@ -0,0 +1,133 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .models import CodeBlock
+
+# -------------------------------------------------------------
+# Room codes.
+# A code is a number written in Crockford's base 32 (no I, L,
+# O or U, so it reads unambiguously on a TV) plus a check
+# character. Numbers come from a counter that each worker
+# process advances through blocks reserved in the database,
+# so codes never repeat across workers or restarts, and are
+# shuffled by a keyed Feistel permutation, so consecutive rooms
+# get unrelated codes that cannot be guessed without the key.
+# Allocation is a lock, a counter step and four hash rounds:
+# no retries, however many rooms exist.
+# -------------------------------------------------------------
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_VALUE = {char: value for value, char in enumerate(ALPHABET)}
+# Letters people type for the digits they resemble.
+_CONFUSABLE = str.maketrans("OIL", "011")
+
+PAYLOAD_LENGTH = 6
+CODE_LENGTH = PAYLOAD_LENGTH + 1
+_HALF_BITS = PAYLOAD_LENGTH * 5 // 2
+_HALF_MASK = (1 << _HALF_BITS) - 1
+# About a billion codes.
+CODE_SPACE = 1 << (2 * _HALF_BITS)
+
+# Numbers reserved per database round trip. Fixed: the block
+# number alone must tell where its numbers start.
+BLOCK_SIZE = 1024
+
+FEISTEL_ROUNDS = 4
+
+
+def _check_char(payload):
+    """Luhn mod 32 check character of ``payload``."""
+    total, factor = 0, 2
+    for char in reversed(payload):
+        addend = factor * _VALUE[char]
+        total += addend // 32 + addend % 32
+        factor = 3 - factor
+    return ALPHABET[-total % 32]
+
+
+def normalize_code(text):
+    """Return the code typed as ``text``, or None if it cannot be a room code.
+
+    Case, spaces, dashes and O/I/L for 0/1 are forgiven; the check
+    character rejects typos without looking the room up.
+    """
+    if not text:
+        return None
+    code = text.upper().replace("-", "").replace(" ", "").translate(_CONFUSABLE)
+    if len(code) != CODE_LENGTH or any(char not in _VALUE for char in code):
+        return None
+    return code if _check_char(code[:-1]) == code[-1] else None
+
+
+def _reserve_block():
+    return CodeBlock.objects.create().pk
+
+
+class CodeAllocator:
+    """Hands out unique room codes, one counter step each."""
+
+    def __init__(self, key, reserve=_reserve_block):
+        # One keyed hash per round, copied for each use.
+        self._rounds = [
+            hashlib.blake2b(
+                key=hashlib.blake2b(key, digest_size=16, person=b"room-code-%d" % i).digest(),
+                digest_size=4,
+            )
+            for i in range(FEISTEL_ROUNDS)
+        ]
+        self._reserve = reserve
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def permute(self, number):
+        """Keyed bijection of ``range(CODE_SPACE)`` onto itself."""
+        left, right = number >> _HALF_BITS, number & _HALF_MASK
+        for keyed in self._rounds:
+            h = keyed.copy()
+            h.update(right.to_bytes(2, "big"))
+            left, right = right, left ^ (int.from_bytes(h.digest(), "big") & _HALF_MASK)
+        return (left << _HALF_BITS) | right
+
+    def encode(self, number):
+        payload = ""
+        for _ in range(PAYLOAD_LENGTH):
+            number, value = divmod(number, 32)
+            payload = ALPHABET[value] + payload
+        return payload + _check_char(payload)
+
+    def allocate(self):
+        with self._lock:
+            if self._next == self._end:
+                block = self._reserve()
+                self._next, self._end = block * BLOCK_SIZE, (block + 1) * BLOCK_SIZE
+            number = self._next
+            self._next += 1
+        if number >= CODE_SPACE:
+            raise RuntimeError("Room codes exhausted")
+        return self.encode(self.permute(number))
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_code_allocator():
+    """Return the process-wide allocator keyed by ``GAME_ROOM_CODES``."""
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                key = settings.GAME_ROOM_CODES.get("KEY") or settings.SECRET_KEY
+                _allocator = CodeAllocator(key.encode())
+    return _allocator
+
+
+@receiver(setting_changed)
+def _reset_allocator(setting, **kwargs):
+    global _allocator
+    if setting in ("GAME_ROOM_CODES", "SECRET_KEY"):
+        _allocator = None
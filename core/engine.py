@@ -0,0 +1,145 @@
+import random
+
+from .palettes import get_palette
+from .room import Round, is_guesser
+from .scoring import score_guess
+
+# -------------------------------------------------------------
+# Game rules.
+# Every state transition of a game (start, hints, guesses,
+# scoring, finalization, next round) is a plain function of a
+# RoomState, without any Django import, so the rules can be
+# tested and replayed in bulk (see core.simulator). Views parse
+# the request, call one of these inside a store update and turn
+# the outcome into a response.
+# -------------------------------------------------------------
+
+# As long as the hint columns of GameRound, so a room rebuilt from the
+# database shows the same hints as the live game.
+MAX_SHORT_HINT = 20
+MAX_LONG_HINT = 50
+# Likewise for the player and room columns.
+MAX_PLAYER_NAME = 50
+DEVICES = ("tv", "mobile", "desktop")
+MODES = ("local", "remote")
+
+
+class RuleError(Exception):
+    """An action the rules do not allow; the message is shown to the player."""
+
+
+def rotate_explainer(players, previous_explainer_id=None):
+    """Return the id of the next explainer in the list of non-host players."""
+    eligible_ids = [p.id for p in players if not p.is_host]
+    if not eligible_ids:
+        return None
+    if previous_explainer_id in eligible_ids:
+        return eligible_ids[(eligible_ids.index(previous_explainer_id) + 1) % len(eligible_ids)]
+    return eligible_ids[0]
+
+
+def explainer_bonus(score):
+    """Points the explainer earns for a guess worth ``score``."""
+    return max(score - 1, 0)
+
+
+def _add_round(room, round_number, explainer_id, rng):
+    row, col, color = room.palette.random_cell(rng)
+    return room.add_round(Round(
+        round_number=round_number,
+        explainer_id=explainer_id,
+        target_color=color,
+        target_row=row,
+        target_col=col,
+    ))
+
+
+def start_game(room, grid_size, palette_seed, rng=random):
+    """Leave the lobby with the first round; None if the game already started."""
+    if room.status == "in_game":
+        return None
+    palette = get_palette(palette_seed, grid_size)
+    room.start(grid_size, palette.seed)
+    return _add_round(room, len(room.rounds) + 1, rotate_explainer(room.players), rng)
+
+
+def next_round(room, rng=random):
+    """Start the next round, explained by the next player in turn."""
+    current = room.current_round
+    explainer_id = rotate_explainer(room.players, current.explainer_id)
+    return _add_round(room, current.round_number + 1, explainer_id, rng)
+
+
+def check_hints(short_hint, long_hint):
+    """Return the hints stripped, or raise RuleError."""
+    short_hint, long_hint = short_hint.strip(), long_hint.strip()
+    if not short_hint or " " in short_hint:
+        raise RuleError("A dica curta deve ser uma única palavra.")
+    if len(short_hint) > MAX_SHORT_HINT:
+        raise RuleError(f"A dica curta deve ter até {MAX_SHORT_HINT} caracteres.")
+    if not long_hint or len(long_hint) > MAX_LONG_HINT:
+        raise RuleError(f"A dica longa deve ter até {MAX_LONG_HINT} caracteres.")
+    return short_hint, long_hint
+
+
+def check_player(name, device):
+    """Return the player's name stripped and device, or raise RuleError."""
+    name = name.strip()
+    if not name:
+        raise RuleError("Informe seu nome.")
+    if len(name) > MAX_PLAYER_NAME:
+        raise RuleError(f"O nome deve ter até {MAX_PLAYER_NAME} caracteres.")
+    if device not in DEVICES:
+        raise RuleError("Aparelho inválido.")
+    return name, device
+
+
+def current_attempt(room, player_id, round_data=None):
+    """The attempt ``player_id`` may make now (1 or 2), or None.
+
+    Only guessers play, and only until the round is finalized. Each
+    attempt opens with its hint: the first with the short one, the
+    second with the long one.
+    """
+    round_data = round_data or room.current_round
+    player = room.get_player(player_id)
+    if player is None or round_data.scored or not is_guesser(player, round_data):
+        return None
+    attempts = room.attempts_of(player_id, round_data)
+    if attempts == 0 and round_data.short_hint:
+        return 1
+    if attempts == 1 and round_data.long_hint:
+        return 2
+    return None
+
+
+def is_round_over(room, round_data=None):
+    """True once every guesser made both attempts."""
+    return room.is_round_over(round_data)
+
+
+def play_move(room, player_id, row, col, method="grid"):
+    """Score and record a guess of ``player_id`` at (row, col); return its Move.
+
+    The explainer gets a bonus for every guess that scores, and the last
+    guess of the round finalizes it. Raise RuleError if no attempt is due.
+    """
+    round_data = room.current_round
+    attempt = current_attempt(room, player_id, round_data)
+    if attempt is None:
+        raise RuleError("Nenhum palpite disponível agora.")
+    distance, delta_e, score = score_guess(room.palette, round_data.target, row, col, method=method)
+    room.record_move(player_id, attempt, row, col, distance=distance, score=score, delta_e=delta_e)
+    if score > 0:
+        room.award_points(round_data.explainer_id, explainer_bonus(score))
+    if room.is_round_over(round_data):
+        room.finalize_round(round_data)
+    return round_data.moves[-1]
+
+
+def round_results(room, round_data=None):
+    """Results of a finished round, finalizing it if that was not done yet."""
+    round_data = round_data or room.current_round
+    if not room.is_round_over(round_data):
+        raise RuleError("A rodada ainda não terminou.")
+    return room.finalize_round(round_data)
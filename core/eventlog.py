@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .room import RoomState
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------
+# Append-only event log of every room (see GAME_EVENT_LOG).
+# Each store update appends one line to <code>.log:
+#     [version, modified, [[kind, data], ...]]
+# with the events recorded by RoomState during the update. Every
+# SNAPSHOT_EVERY events the whole room is written to <code>.snap
+# together with the log size at that point, so a room is rebuilt
+# from its latest snapshot plus the short tail after it. The log
+# itself is never rewritten: it is the room's full history.
+# -------------------------------------------------------------
+
+
+class EventLog:
+    """Per-room event files under ``path``, used as a store recorder and loader."""
+
+    def __init__(self, path, snapshot_every=200, fsync=False):
+        self.path = Path(path)
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Events appended since the latest snapshot, per room. A room missing
+        # here gets a snapshot on its next update.
+        self._since_snapshot = {}
+        self._lock = threading.Lock()
+
+    def _files(self, code):
+        return self.path / f"{code}.log", self.path / f"{code}.snap"
+
+    def _write(self, path, data, mode):
+        with open(path, mode) as fh:
+            fh.write(data.encode())
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+            return fh.tell()
+
+    # Recording -----------------------------------------------
+
+    def record(self, code, room):
+        """Append the events of the update that just changed ``room``.
+
+        Called by the store under the room's lock, so lines of one room are
+        written in order.
+        """
+        log_path, snap_path = self._files(code)
+        events = room.events or []
+        offset = None
+        if events:
+            line = json.dumps(
+                [room.version, room.modified, [[kind, data] for kind, data in events]],
+                separators=(",", ":"),
+            )
+            offset = self._write(log_path, line + "\n", "ab")
+        with self._lock:
+            since = self._since_snapshot.get(code)
+            due = since is None or since + len(events) >= self.snapshot_every
+            self._since_snapshot[code] = 0 if due else since + len(events)
+        if due:
+            if offset is None:
+                offset = log_path.stat().st_size if log_path.exists() else 0
+            self._snapshot(snap_path, room, offset)
+
+    def _snapshot(self, snap_path, room, offset):
+        data = json.dumps({"offset": offset, "room": room.to_dict()}, separators=(",", ":"))
+        tmp = snap_path.with_suffix(".snap.tmp")
+        self._write(tmp, data, "wb")
+        os.replace(tmp, snap_path)  # Readers see the old snapshot or the new one.
+
+    # Recovery ------------------------------------------------
+
+    def load(self, code):
+        """Rebuild room ``code`` from its snapshot and log tail, or return None."""
+        log_path, snap_path = self._files(code)
+        try:
+            snapshot = json.loads(snap_path.read_text())
+        except FileNotFoundError:
+            return None
+        room = RoomState.from_dict(snapshot["room"])
+        replayed = 0
+        for version, modified, events in self._read(log_path, snapshot["offset"]):
+            for kind, data in events:
+                room.apply_event(kind, data)
+                replayed += 1
+            room.version, room.modified = version, modified
+        room.last_active = time.time()
+        with self._lock:
+            self._since_snapshot[code] = replayed
+        return room
+
+    def _read(self, log_path, offset=0):
+        try:
+            fh = open(log_path, "rb")
+        except FileNotFoundError:
+            return
+        with fh:
+            fh.seek(offset)
+            for line in fh:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash: nothing after it was committed.
+                    logger.warning("Ignoring truncated event in %s", log_path)
+                    return
+
+    def history(self, code):
+        """Every update recorded for ``code``: ``(version, modified, events)``."""
+        return self._read(self._files(code)[0])
+
+    # Housekeeping --------------------------------------------
+
+    def archive(self, code):
+        """Move the files of an evicted room aside so it is not loaded from them."""
+        archive = self.path / "archive"
+        archive.mkdir(exist_ok=True)
+        stamp = int(time.time())
+        for path in self._files(code):
+            if path.exists():
+                os.replace(path, archive / f"{path.stem}.{stamp}{path.suffix}")
+        with self._lock:
+            self._since_snapshot.pop(code, None)
+
+
+_event_log = None
+_event_log_lock = threading.Lock()
+
+
+def get_event_log():
+    """Return the event log configured by ``GAME_EVENT_LOG``, or None if disabled."""
+    global _event_log
+    config = settings.GAME_EVENT_LOG
+    if not config.get("ENABLED"):
+        return None
+    if _event_log is None:
+        with _event_log_lock:
+            if _event_log is None:
+                _event_log = EventLog(
+                    config["PATH"],
+                    snapshot_every=config.get("SNAPSHOT_EVERY", 200),
+                    fsync=config.get("FSYNC", False),
+                )
+    return _event_log
+
+
+@receiver(setting_changed)
+def _reset_event_log(setting, **kwargs):
+    global _event_log
+    if setting == "GAME_EVENT_LOG":
+        _event_log = None
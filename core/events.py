@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+# -------------------------------------------------------------
+# In-process notification hub for room state changes.
+# Views publish after every mutation that can change where a
+# player should be (hint, move, round over, next round) and the
+# streaming endpoint wakes up the clients subscribed to the room.
+# -------------------------------------------------------------
+
+
+class Subscription:
+    """A single listener waiting for changes on one room."""
+
+    def __init__(self, code, loop):
+        self.code = code
+        self.loop = loop
+        # Only the fact that something changed matters, so pending
+        # notifications are coalesced into a single slot.
+        self.queue = asyncio.Queue(maxsize=1)
+
+    def notify(self):
+        if self.queue.empty():
+            self.queue.put_nowait(True)
+
+    async def wait(self, timeout):
+        """Return True if the room changed before ``timeout`` seconds."""
+        try:
+            await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class RoomEventBus:
+    """Thread-safe registry of subscriptions, keyed by session code."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, code):
+        subscription = Subscription(code, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(code, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.code)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.code]
+
+    def publish(self, code):
+        """Wake every subscriber of ``code``. Safe to call from sync views."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(code, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.notify)
+            except RuntimeError:
+                # Event loop already closed; the stream is going away.
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self, code=None):
+        with self._lock:
+            if code is not None:
+                return len(self._subscribers.get(code, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+
+room_events = RoomEventBus()
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from .eventlog import get_event_log
+from .persistence import archive_room
+from .store import get_session_store
+from .writebehind import get_write_behind
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------
+# Eviction of abandoned rooms.
+# Rooms idle for longer than IDLE_TTL, and the least recently
+# used ones beyond MAX_ROOMS, are dropped from the store and
+# archived to the ORM models (see GAME_ROOM_EVICTION).
+# -------------------------------------------------------------
+
+
+class RoomEvictor:
+    """Applies the idle TTL and room cap, optionally from a background thread."""
+
+    def __init__(self, idle_ttl=None, max_rooms=None, sweep_interval=None, archive=archive_room):
+        self.idle_ttl = idle_ttl
+        self.max_rooms = max_rooms
+        self.sweep_interval = sweep_interval
+        self.archive = archive
+        self.counters = {"idle": 0, "lru": 0, "archived": 0, "archive_failed": 0}
+        self._counters_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sweep(self, now=None):
+        """Evict idle rooms and enforce the cap. Return the evicted rooms."""
+        now = now or time.time()
+        idle_before = now - self.idle_ttl if self.idle_ttl else None
+        evicted = get_session_store().evict(idle_before=idle_before, max_rooms=self.max_rooms)
+        self._archive(evicted)
+        return evicted
+
+    def enforce_cap(self):
+        """Cheap check run after a room is created."""
+        store = get_session_store()
+        if self.max_rooms is None or len(store) <= self.max_rooms:
+            return []
+        evicted = store.evict(max_rooms=self.max_rooms)
+        self._archive(evicted)
+        return evicted
+
+    def _archive(self, evicted):
+        write_behind = get_write_behind()
+        event_log = get_event_log()
+        for code, room, reason in evicted:
+            if write_behind is not None:
+                write_behind.discard(code)  # The archive below writes it anyway.
+            try:
+                self.archive(code, room)
+            except Exception:
+                logger.exception("Could not archive evicted room %s", code)
+                outcome = "archive_failed"
+            else:
+                outcome = "archived"
+                if event_log is not None:
+                    # Archived: reload it from the database, not from its events.
+                    event_log.archive(code)
+            with self._counters_lock:
+                self.counters[reason] += 1
+                self.counters[outcome] += 1
+
+    # Background sweeper --------------------------------------
+
+    def start(self):
+        if not self.sweep_interval or (self._thread and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="room-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Room sweep failed")
+            finally:
+                close_old_connections()
+
+
+_evictor = None
+_evictor_lock = threading.Lock()
+
+
+def get_room_evictor():
+    """Return the evictor configured by ``GAME_ROOM_EVICTION``, starting its sweeper."""
+    global _evictor
+    if _evictor is None:
+        with _evictor_lock:
+            if _evictor is None:
+                config = settings.GAME_ROOM_EVICTION
+                _evictor = RoomEvictor(
+                    idle_ttl=config.get("IDLE_TTL"),
+                    max_rooms=config.get("MAX_ROOMS"),
+                    sweep_interval=config.get("SWEEP_INTERVAL"),
+                )
+                _evictor.start()
+    return _evictor
+
+
+@receiver(setting_changed)
+def _reset_room_evictor(setting, **kwargs):
+    global _evictor
+    if setting == "GAME_ROOM_EVICTION" and _evictor is not None:
+        _evictor.stop()
+        _evictor = None
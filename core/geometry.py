@@ -0,0 +1,71 @@
+import string
+from functools import lru_cache
+
+# -------------------------------------------------------------
+# Board geometry.
+# Everything that only depends on the board size (labels, cell
+# lookup, distance -> score table) is computed once per size and
+# cached, so parsing and scoring a guess are a couple of table
+# lookups whatever the board size. Colors live in core.palettes.
+# -------------------------------------------------------------
+
+MIN_SIZE = 3
+MAX_SIZE = 30
+DEFAULT_SIZE = 5
+
+# Points for a guess 0, 1 and 2 "steps" away from the target; further is 0.
+SCORE_BY_STEP = (4, 3, 2)
+
+
+def row_label(index):
+    """Spreadsheet-style row names: A..Z, then AA, AB..."""
+    letters = string.ascii_uppercase
+    if index < len(letters):
+        return letters[index]
+    return letters[index // len(letters) - 1] + letters[index % len(letters)]
+
+
+class BoardGeometry:
+    """Labels, cell lookup and scoring table of a ``rows`` x ``cols`` board."""
+
+    def __init__(self, rows, cols):
+        if not (MIN_SIZE <= rows <= MAX_SIZE and MIN_SIZE <= cols <= MAX_SIZE):
+            raise ValueError(f"Board size must be between {MIN_SIZE} and {MAX_SIZE}.")
+        self.rows = rows
+        self.cols = cols
+        self.row_labels = tuple(row_label(r) for r in range(rows))
+        self.col_labels = tuple(str(c + 1) for c in range(cols))
+        self.keys = tuple(f"{rl}{cl}" for rl in self.row_labels for cl in self.col_labels)
+        self._row_index = {label: r for r, label in enumerate(self.row_labels)}
+
+        # Only the target cell itself is worth full points. Other distances
+        # are counted in "steps": one cell on the classic board, growing
+        # with the board so a guess two steps away scores the same on any size.
+        step = max(1, round(max(rows, cols) / DEFAULT_SIZE))
+        steps = [0] + [-(-d // step) for d in range(1, max(rows, cols))]
+        self.score_table = tuple(
+            SCORE_BY_STEP[n] if n < len(SCORE_BY_STEP) else 0 for n in steps
+        )
+
+    def __len__(self):
+        return self.rows * self.cols
+
+    def parse(self, row, col):
+        """Turn form input ("C", "3") into a zero-based (row, col). Raise ValueError."""
+        r = self._row_index.get(str(row).strip().upper())
+        c = int(col) - 1
+        if r is None or not 0 <= c < self.cols:
+            raise ValueError(f"Cell {row}{col} is not on the board.")
+        return r, c
+
+    def index(self, row, col):
+        return row * self.cols + col
+
+    def key(self, row, col):
+        return self.keys[row * self.cols + col]
+
+
+@lru_cache(maxsize=None)
+def get_geometry(rows=DEFAULT_SIZE, cols=None):
+    """Shared geometry of a board; square when ``cols`` is omitted."""
+    return BoardGeometry(rows, rows if cols is None else cols)
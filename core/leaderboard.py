@@ -0,0 +1,67 @@
+from bisect import bisect_left, insort
+
+# -------------------------------------------------------------
+# Live ranking of the players of a room.
+# Entries are kept sorted as ``(-points, join index)``, so the
+# best player comes first and ties keep the join order. A score
+# change is a binary search, a removal and an insertion; the
+# top k and the rank of a player are read without sorting, so
+# scoreboard polls cost the same however many players a room
+# has.
+# -------------------------------------------------------------
+
+
+class Leaderboard:
+    """Players (by index in the room) ranked by points."""
+
+    __slots__ = ("_entries", "_points", "_baseline")
+
+    def __init__(self):
+        self._entries = []
+        self._points = {}
+        # Ranks at the last ``mark``, which deltas are measured against.
+        self._baseline = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, index):
+        return index in self._points
+
+    def add(self, index, points=0):
+        self._points[index] = points
+        insort(self._entries, (-points, index))
+
+    def set(self, index, points):
+        """Move player ``index`` to their new total."""
+        old = self._points[index]
+        if old == points:
+            return
+        del self._entries[bisect_left(self._entries, (-old, index))]
+        self._points[index] = points
+        insort(self._entries, (-points, index))
+
+    def rank(self, index):
+        """Rank of player ``index``; equal totals share a rank (1, 2, 2, 4)."""
+        return bisect_left(self._entries, (-self._points[index], -1)) + 1
+
+    def top(self, k=None):
+        """``(rank, index, points)`` of the best ``k`` players, or of all of them."""
+        entries = self._entries if k is None else self._entries[:k]
+        ranked = []
+        for position, (negated, index) in enumerate(entries, 1):
+            points = -negated
+            tied = ranked and ranked[-1][2] == points
+            ranked.append((ranked[-1][0] if tied else position, index, points))
+        return ranked
+
+    def mark(self):
+        """Remember the current ranks, e.g. when a round starts."""
+        self._baseline = {index: rank for rank, index, _ in self.top()}
+
+    def delta(self, index, rank=None):
+        """Places gained since the last ``mark``; None if the player was not ranked then."""
+        before = self._baseline.get(index)
+        if before is None:
+            return None
+        return before - (self.rank(index) if rank is None else rank)
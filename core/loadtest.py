@@ -0,0 +1,280 @@
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from .store import get_session_store
+
+# -------------------------------------------------------------
+# Load generator driving whole rooms through the view layer.
+# Each room runs the real lifecycle (create, joins, start, hint,
+# two moves per guesser, results, next round) with Django's test
+# client, so requests go through the full middleware stack.
+#
+# Time is virtual: between scripted actions every client issues
+# the polls its page would have sent in that interval, at the
+# cadence the templates use (hx-trigger), without sleeping.
+# Clients are assumed to have no event stream, which is the
+# worst case for the server.
+# -------------------------------------------------------------
+
+# Seconds between polls, as in the templates' hx-trigger.
+POLL_EVERY = {
+    "lobby": [("player_redirect_status", 3), ("players_list_partial", 5)],
+    "board": [("player_redirect_status", 3), ("board_live", 3), ("scoreboard_partial", 5)],
+    "submit_hint": [("player_redirect_status", 3)],
+    "waiting_hint": [("player_redirect_status", 2)],
+    "submit_move": [("player_redirect_status", 3)],
+    "rounds_results": [("player_redirect_status", 3)],
+}
+
+# Virtual seconds spent on each scripted action.
+THINK_TIME = {
+    "join": 2,
+    "hint": 15,
+    "move": 4,
+    "results": 10,
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LatencyRecorder:
+    """Latencies per endpoint (URL name), safe to share between threads."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok=True):
+        with self._lock:
+            self.samples[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self, wall_seconds):
+        endpoints = {}
+        for name in sorted(self.samples):
+            values = sorted(self.samples[name])
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "throughput_rps": round(len(values) / wall_seconds, 1),
+            }
+        total = sum(len(v) for v in self.samples.values())
+        return {
+            "endpoints": endpoints,
+            "total": {
+                "requests": total,
+                "errors": sum(self.errors.values()),
+                "wall_seconds": round(wall_seconds, 3),
+                "throughput_rps": round(total / wall_seconds, 1),
+            },
+        }
+
+
+class SimulatedClient:
+    """One browser: a test client plus the page it is currently on."""
+
+    def __init__(self, recorder, name):
+        self.client = Client()
+        self.recorder = recorder
+        self.name = name
+        self.page = None
+        self.page_args = ()
+
+    @property
+    def player_id(self):
+        return self.client.session.get("player_id")
+
+    def request(self, method, url, data=None):
+        start = time.perf_counter()
+        response = getattr(self.client, method)(url, data or {})
+        elapsed = time.perf_counter() - start
+        match = response.resolver_match
+        name = match.url_name if match else url
+        self.recorder.record(name, elapsed, ok=response.status_code < 400)
+        if response.status_code == 302:
+            self.open(response["Location"])
+        return response
+
+    def open(self, url):
+        """Navigate to ``url`` and remember which page polls from now on."""
+        response = self.request("get", url)
+        match = response.resolver_match
+        if match and match.url_name in POLL_EVERY:
+            self.page, self.page_args = match.url_name, match.kwargs
+        return response
+
+    def poll_urls(self, code):
+        for name, interval in POLL_EVERY.get(self.page, ()):
+            if name == "players_list_partial":
+                url = reverse(name)
+            else:
+                url = reverse(name, args=[code])
+            yield name, url, interval
+
+    def follow_redirect_status(self, response):
+        if response.resolver_match.url_name != "player_redirect_status":
+            return
+        if response.status_code != 200:
+            return
+        target = response.json().get("redirect_url")
+        if target and target != self._page_path():
+            self.open(target)
+
+    def _page_path(self):
+        if self.page is None:
+            return None
+        return reverse(self.page, kwargs=self.page_args)
+
+
+class RoomSimulation:
+    """Plays ``rounds`` rounds of one room with ``players`` phones and a TV."""
+
+    def __init__(self, recorder, players, rounds, seed):
+        self.recorder = recorder
+        self.players = players
+        self.rounds = rounds
+        self.random = random.Random(seed)
+        self.host = SimulatedClient(recorder, "TV")
+        self.phones = [SimulatedClient(recorder, f"P{i}") for i in range(players)]
+        self.code = None
+
+    @property
+    def everyone(self):
+        return [self.host, *self.phones]
+
+    def idle(self, seconds, clients=None):
+        """Issue every poll ``clients`` would send during ``seconds`` of virtual time."""
+        events = []
+        for client in clients or self.everyone:
+            for name, url, interval in client.poll_urls(self.code):
+                for tick in range(1, int(seconds // interval) + 1):
+                    events.append((tick * interval, client.name, client, url))
+        events.sort(key=lambda event: event[:2])
+        for _, _, client, url in events:
+            response = client.request("get", url)
+            client.follow_redirect_status(response)
+
+    def catch_up(self):
+        """Poll once from every client so everyone reaches the page of the new phase."""
+        for client in self.everyone:
+            for name, url, _ in client.poll_urls(self.code):
+                if name == "player_redirect_status":
+                    client.follow_redirect_status(client.request("get", url))
+
+    def run(self):
+        self.host.request("post", reverse("create_session"), {"mode": "local", "name": "TV"})
+        self.code = self.host.client.session["code"]
+
+        for phone in self.phones:
+            join_url = reverse("join_session", args=[self.code])
+            phone.request("get", join_url)
+            phone.request("post", join_url, {"name": phone.name})
+            self.idle(THINK_TIME["join"])
+
+        self.host.request("post", reverse("start_game"))
+        for number in range(1, self.rounds + 1):
+            self.play_round()
+            if number < self.rounds:
+                explainer = self.explainer()
+                explainer.request("post", reverse("next_round"))
+                self.catch_up()
+
+    def explainer(self):
+        # Read-only peek at the room, like a person looking at the TV.
+        explainer_id = get_session_store().peek(self.code).current_round.explainer_id
+        return next(p for p in self.phones if p.player_id == explainer_id)
+
+    def play_round(self):
+        self.catch_up()
+        explainer = self.explainer()
+        self.idle(THINK_TIME["hint"])
+        explainer.request(
+            "post", reverse("submit_hint", args=[self.code]),
+            {"short_hint": "mar", "long_hint": "azul do oceano"},
+        )
+        self.catch_up()
+
+        guessers = [p for p in self.phones if p is not explainer]
+        for attempt in range(2):
+            for guesser in guessers:
+                if guesser.page != "submit_move":
+                    guesser.open(reverse("submit_move"))
+                guesser.request("post", reverse("submit_move"), {
+                    "row": self.random.choice("ABCDE"),
+                    "col": self.random.choice("12345"),
+                })
+            self.idle(THINK_TIME["move"])
+
+        self.catch_up()
+        self.idle(THINK_TIME["results"])
+
+
+def run_loadtest(rooms=10, players=8, rounds=3, concurrency=1, seed=0):
+    """Play ``rooms`` rooms, ``concurrency`` at a time, and return the summary."""
+    recorder = LatencyRecorder()
+    pending = list(range(rooms))
+    lock = threading.Lock()
+    failures = []
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                index = pending.pop()
+            try:
+                RoomSimulation(recorder, players, rounds, seed=seed + index).run()
+            except Exception as exc:  # Keep the other rooms going; report at the end.
+                failures.append(repr(exc))
+
+    # The test client talks to "testserver".
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result = recorder.summary(time.perf_counter() - start)
+    result["config"] = {
+        "rooms": rooms, "players": players, "rounds": rounds,
+        "concurrency": concurrency, "seed": seed,
+    }
+    result["failed_rooms"] = failures
+    return result
+
+
+def compare(result, baseline):
+    """Rows comparing p95 and throughput of ``result`` with ``baseline``."""
+    rows = []
+    before = baseline.get("endpoints", {})
+    for name, now in result["endpoints"].items():
+        old = before.get(name)
+        if not old:
+            continue
+        rows.append({
+            "endpoint": name,
+            "p95_ms_before": old["p95_ms"],
+            "p95_ms_now": now["p95_ms"],
+            "p95_change_pct": round((now["p95_ms"] / old["p95_ms"] - 1) * 100, 1) if old["p95_ms"] else 0.0,
+            "rps_before": old["throughput_rps"],
+            "rps_now": now["throughput_rps"],
+        })
+    return rows
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Run micro-benchmarks of the game hot paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "names", nargs="*",
+            help=f"Benchmarks to run (default: all). Available: {', '.join(sorted(BENCHMARKS))}",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        names = options["names"] or sorted(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+        results = {name: BENCHMARKS[name]() for name in names}
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, rows in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if not rows:
+                continue
+            columns = list(rows[0])
+            widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+            self.stdout.write("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+            for row in rows:
+                self.stdout.write("  ".join(str(row[c]).rjust(w) for c, w in zip(columns, widths)))
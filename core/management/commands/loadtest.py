@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from core.loadtest import compare, run_loadtest
+
+
+class Command(BaseCommand):
+    help = "Play full rooms through the views and report latency per endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=10)
+        parser.add_argument("--players", type=int, default=8, help="Phones per room (at least 2).")
+        parser.add_argument("--rounds", type=int, default=3)
+        parser.add_argument("--concurrency", type=int, default=1, help="Rooms played in parallel threads.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this file (a baseline).")
+        parser.add_argument("--compare", help="Baseline JSON file to compare the results against.")
+        parser.add_argument(
+            "--with-persistence", action="store_true",
+            help="Keep the write-behind queue on (writes the rooms to the database).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        if options["players"] < 2:
+            raise CommandError("A room needs at least 2 players.")
+
+        params = {k: options[k] for k in ("rooms", "players", "rounds", "concurrency", "seed")}
+        if options["with_persistence"]:
+            result = run_loadtest(**params)
+        else:
+            with override_settings(GAME_PERSISTENCE={"ENABLED": False}):
+                result = run_loadtest(**params)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2)
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+        else:
+            self.write_table(result["endpoints"], key="endpoint")
+            total = result["total"]
+            self.stdout.write(
+                f"{total['requests']} requests, {total['errors']} errors, "
+                f"{total['wall_seconds']}s, {total['throughput_rps']} req/s"
+            )
+        for failure in result["failed_rooms"]:
+            self.stderr.write(f"Room failed: {failure}")
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                rows = compare(result, json.load(f))
+            self.stdout.write(self.style.MIGRATE_HEADING("Compared with baseline"))
+            self.write_table({row.pop("endpoint"): row for row in rows}, key="endpoint")
+
+    def write_table(self, rows_by_name, key):
+        rows = [{key: name, **row} for name, row in rows_by_name.items()]
+        if not rows:
+            return
+        columns = list(rows[0])
+        widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+        self.stdout.write("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+        for row in rows:
+            self.stdout.write("  ".join(str(row[c]).rjust(w) for c, w in zip(columns, widths)))
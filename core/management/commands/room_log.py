@@ -0,0 +1,34 @@
+import json
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.eventlog import get_event_log
+
+
+class Command(BaseCommand):
+    help = "Print the recorded history of a room from the event log."
+
+    def add_arguments(self, parser):
+        parser.add_argument("code", help="Room code.")
+        parser.add_argument("--state", action="store_true",
+                            help="Print the room rebuilt from its snapshot and log instead.")
+
+    def handle(self, *args, **options):
+        event_log = get_event_log()
+        if event_log is None:
+            raise CommandError("The event log is disabled (GAME_EVENT_LOG).")
+        code = options["code"].upper()
+
+        if options["state"]:
+            room = event_log.load(code)
+            if room is None:
+                raise CommandError(f"No snapshot for room {code}.")
+            self.stdout.write(json.dumps(room.to_dict(), indent=2, ensure_ascii=False))
+            return
+
+        for version, modified, events in event_log.history(code):
+            at = datetime.fromtimestamp(modified, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            for kind, data in events:
+                fields = " ".join(f"{key}={json.dumps(value, ensure_ascii=False)}" for key, value in data.items())
+                self.stdout.write(f"v{version} {at} {kind} {fields}")
@@ -0,0 +1,65 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.geometry import DEFAULT_SIZE, MAX_SIZE, MIN_SIZE
+from core.simulator import DEFAULT_SKILL, sample_scores, simulate_games
+
+
+class Command(BaseCommand):
+    help = "Play synthetic games through the game rules and print score statistics."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=1000, help="Games to play (default: 1000).")
+        parser.add_argument("--players", type=int, default=4, help="Players per game, host excluded.")
+        parser.add_argument("--rounds", type=int, help="Rounds per game (default: one per player).")
+        parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Board size.")
+        parser.add_argument("--palette", type=int, help="Palette seed (default: the classic board).")
+        parser.add_argument("--method", choices=("grid", "perceptual"),
+                            help="Scoring method (default: GAME_SCORING['METHOD']).")
+        parser.add_argument("--skill", default=",".join(str(s) for s in DEFAULT_SKILL),
+                            help="Spread of the guesses in cells, per attempt (default: %(default)s).")
+        parser.add_argument("--seed", type=int, help="Random seed, for repeatable runs.")
+        parser.add_argument("--guesses", type=int,
+                            help="Only score this many guesses per attempt, without playing games.")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        if not MIN_SIZE <= options["size"] <= MAX_SIZE:
+            raise CommandError(f"Board size must be between {MIN_SIZE} and {MAX_SIZE}.")
+        if options["players"] < 2:
+            raise CommandError("A game needs at least two players.")
+        try:
+            skill = [float(sigma) for sigma in options["skill"].split(",")]
+        except ValueError:
+            raise CommandError(f"Invalid skill: {options['skill']}")
+        common = {
+            "grid_size": options["size"],
+            "palette_seed": options["palette"],
+            "method": options["method"] or settings.GAME_SCORING["METHOD"],
+            "skill": skill,
+            "seed": options["seed"],
+        }
+        try:
+            if options["guesses"]:
+                results = {"scores": sample_scores(options["guesses"], **common)}
+            else:
+                results = simulate_games(
+                    options["games"], players=options["players"], rounds=options["rounds"], **common,
+                )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for key, value in results.items():
+            if key != "scores":
+                self.stdout.write(f"{key}: {value}")
+        self.stdout.write(self.style.MIGRATE_HEADING("points per attempt"))
+        for attempt, counts in results["scores"].items():
+            total = sum(counts.values())
+            shares = "  ".join(f"{points}: {n / total:6.1%}" for points, n in sorted(counts.items()))
+            self.stdout.write(f"attempt {attempt}  {shares}")
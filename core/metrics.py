@@ -0,0 +1,263 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------
+# Process-local metrics in the Prometheus text format.
+# Request, template and store timings are recorded as they
+# happen; room and background-thread figures are collected
+# when /metrics/ is scraped. With several worker processes
+# each one reports its own numbers.
+# -------------------------------------------------------------
+
+# Upper bounds in seconds, from a fast poll to a slow page.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {value:g}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels[name] for name in self.labels))
+        return series[-1] if series else 0
+
+    def render(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                labels = _format_labels(self.labels, key, [("le", f"{bound:g}")])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key, [("le", "+Inf")])
+            yield f"{self.name}_bucket{labels} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]:g}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}"
+
+
+class Gauge:
+    """Value read from ``collect()`` at scrape time.
+
+    ``collect`` returns a number, or a dict of label value tuples to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, collect, labels=(), kind="gauge"):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, key)} {value:g}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, collect, labels=(), kind="gauge"):
+        return self.register(Gauge(name, help, collect, labels, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception("Could not collect metric %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter(
+    "colorgrid_requests_total", "HTTP requests by route, method and status.",
+    labels=("route", "method", "status"),
+)
+REQUEST_LATENCY = registry.histogram(
+    "colorgrid_request_duration_seconds", "Time to produce the response, by route.",
+    labels=("route",),
+)
+TEMPLATE_RENDER = registry.histogram(
+    "colorgrid_template_render_seconds", "Time spent rendering page templates.",
+    labels=("template",),
+)
+STORE_OPERATIONS = registry.histogram(
+    "colorgrid_store_operation_seconds",
+    "Session store calls; 'update' is the wait for the room lock and the load.",
+    labels=("op",),
+)
+
+
+# Collected at scrape time ----------------------------------
+
+
+def _rooms():
+    from .store import get_session_store  # the store records into this module
+
+    return len(get_session_store())
+
+
+def _players():
+    from .store import get_session_store
+
+    store = get_session_store()
+    rooms = (store.peek(code) for code in store.codes())
+    return sum(len(room.players) for room in rooms if room is not None)
+
+
+def _evictor_counters():
+    from .eviction import get_room_evictor
+
+    return {(reason,): value for reason, value in get_room_evictor().counters.items()}
+
+
+def _write_behind_counters():
+    from .writebehind import get_write_behind
+
+    write_behind = get_write_behind()
+    if write_behind is None:
+        return {}
+    return {(name,): value for name, value in write_behind.counters.items()}
+
+
+registry.gauge("colorgrid_rooms", "Rooms in the session store.", _rooms)
+registry.gauge("colorgrid_players_online", "Players in the rooms of the session store.", _players)
+registry.gauge(
+    "colorgrid_evicted_rooms_total", "Rooms evicted and their archive outcome.",
+    _evictor_counters, labels=("outcome",), kind="counter",
+)
+registry.gauge(
+    "colorgrid_write_behind_total", "Write-behind flushes and rooms written.",
+    _write_behind_counters, labels=("event",), kind="counter",
+)
+
+
+# Template timing -------------------------------------------
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        name = self.template.origin.template_name or "<string>"
+        with TEMPLATE_RENDER.time(template=name):
+            return self.template.render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing every page render."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+# Logging ---------------------------------------------------
+
+
+def log_sampled(logger, level, rate, event, **fields):
+    """Log ``event`` with ``key=value`` fields for about ``rate`` of the calls.
+
+    Costs almost nothing when ``level`` is disabled, so it is safe on hot paths.
+    """
+    if not logger.isEnabledFor(level) or random.random() >= rate:
+        return
+    log_event(logger, level, event, **fields)
+
+
+def log_event(logger, level, event, **fields):
+    """Log ``event`` followed by its fields as ``key=value`` pairs."""
+    if not logger.isEnabledFor(level):
+        return
+    message = " ".join([event, *(f"{key}=%s" for key in fields)])
+    logger.log(level, message, *fields.values(), extra={"event": event, "fields": fields})
@@ -0,0 +1,37 @@
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import REQUEST_LATENCY, REQUESTS
+
+
+def _observe(request, response, elapsed):
+    match = getattr(request, "resolver_match", None)
+    route = match.url_name or match.view_name if match else "unmatched"
+    REQUEST_LATENCY.observe(elapsed, route=route)
+    REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Time every request by route. For streams this is the time to the headers."""
+    if not settings.GAME_METRICS.get("ENABLED"):
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            response = await get_response(request)
+            _observe(request, response, time.perf_counter() - start)
+            return response
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            response = get_response(request)
+            _observe(request, response, time.perf_counter() - start)
+            return response
+
+    return middleware
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gameround',
+            name='scored',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='gameround',
+            name='target_col',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gameround',
+            name='target_row',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='current_round',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='grid_size',
+            field=models.PositiveSmallIntegerField(default=5),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='status',
+            field=models.CharField(default='lobby', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='public_id',
+            field=models.CharField(blank=True, max_length=36),
+        ),
+        migrations.AddField(
+            model_name='playermove',
+            name='col',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playermove',
+            name='row',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='player',
+            unique_together={('session', 'public_id')},
+        ),
+    ]
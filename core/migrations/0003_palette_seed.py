@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_room_state_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='palette_seed',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_palette_seed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reserved_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_code_block'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='recent_requests',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='token',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -7,6 +7,13 @@ class GameSession(models.Model):
         ('remote', 'Remote')
     ])
     is_active = models.BooleanField(default=True)
+    status = models.CharField(max_length=10, default='lobby')
+    grid_size = models.PositiveSmallIntegerField(default=5)
+    # Seed of the generated palette; empty for the classic board
+    palette_seed = models.BigIntegerField(null=True, blank=True)
+    current_round = models.PositiveIntegerField(null=True, blank=True)
+    # Idempotency key -> player id of the last requests applied (see RoomState.requests)
+    recent_requests = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -14,6 +21,8 @@ class GameSession(models.Model):
 
 class Player(models.Model):
     session = models.ForeignKey(GameSession, on_delete=models.CASCADE, related_name='players')
+    # Id of the player in the in-memory room (stored in the Django session)
+    public_id = models.CharField(max_length=36, blank=True)
     name = models.CharField(max_length=50)
     score = models.IntegerField(default=0)
     device_type = models.CharField(max_length=10, choices=[
@@ -22,8 +31,13 @@ class Player(models.Model):
         ('desktop', 'Desktop')
     ])
     is_host = models.BooleanField(default=False)
+    # Device cookie of the browser that joined, to rebind it after a reload
+    token = models.CharField(max_length=32, blank=True)
     joined_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        unique_together = ('session', 'public_id')
+
     def __str__(self):
         return f"{self.name} ({self.session.code})"
     
@@ -31,6 +45,8 @@ class GameRound(models.Model):
     session = models.ForeignKey(GameSession, on_delete=models.CASCADE, related_name='rounds')
     round_number = models.IntegerField()
     target_color = models.CharField(max_length=7)  # Ex: '#FFAABB'
+    target_row = models.PositiveSmallIntegerField(default=0)
+    target_col = models.PositiveSmallIntegerField(default=0)
     explainer = models.ForeignKey(
         Player,
         on_delete=models.CASCADE,
@@ -38,6 +54,7 @@ class GameRound(models.Model):
     )
     short_hint = models.CharField(max_length=20, blank=True)
     long_hint = models.CharField(max_length=50, blank=True)
+    scored = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -54,6 +71,8 @@ class PlayerMove(models.Model):
         (2, 'Segunda tentativa')
     ])
     chosen_color = models.CharField(max_length=7)
+    row = models.PositiveSmallIntegerField(default=0)
+    col = models.PositiveSmallIntegerField(default=0)
     color_distance = models.FloatField()
     score = models.IntegerField(default=0)
     played_at = models.DateTimeField(auto_now_add=True)
@@ -63,3 +82,16 @@ class PlayerMove(models.Model):
 
     def __str__(self):
         return f"Tentativa {self.attempt_number} de {self.player.name} na rodada {self.round.round_number}"
+
+
+
+class CodeBlock(models.Model):
+    """A block of room code numbers reserved by one worker process.
+
+    Block ``pk`` covers the numbers from ``pk * BLOCK_SIZE`` (see
+    core.codes); the auto-increment keeps workers and restarts apart.
+    """
+    reserved_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Bloco de códigos {self.pk}"
@@ -0,0 +1,163 @@
+import colorsys
+import random
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+
+from .geometry import get_geometry
+from .scoring import DeltaETable
+
+try:
+    import numpy as np
+except ImportError:  # Optional: the pure-Python generator is used instead.
+    np = None
+
+# -------------------------------------------------------------
+# Board palettes.
+# A palette is generated from a seed and a board size: hue runs
+# across the columns and lightness down the rows, like the
+# classic Hues and Cues board, with the seed picking the hue
+# offset, direction, saturation and lightness range. Palettes
+# are immutable and cached by (seed, rows, cols), so every room
+# on the same preset shares a single object (and its delta E
+# table).
+# -------------------------------------------------------------
+
+# The original 5x5 board, still used for 5x5 games.
+CLASSIC_PALETTE = {
+    'A1': '#33FF57', 'A2': '#3357FF', 'A3': '#F39C12', 'A4': '#8E44AD', 'A5': '#1ABC9C',
+    'B1': '#2ECC71', 'B2': '#E74C3C', 'B3': '#3498DB', 'B4': '#9B59B6', 'B5': '#E67E22',
+    'C1': '#BDC3C7', 'C2': '#34495E', 'C3': '#16A085', 'C4': '#27AE60', 'C5': '#2980B9',
+    'D1': '#D35400', 'D2': '#7F8C8D', 'D3': '#C0392B', 'D4': '#F1C40F', 'D5': '#E84393',
+    'E1': '#6C5CE7', 'E2': '#00CEC9', 'E3': '#FD79A8', 'E4': '#FAB1A0', 'E5': '#FFFFFF'
+}
+
+# Recently used palettes, kept so rooms started on the same seed
+# share one. Each may hold a delta E table of at most DELTA_E_ROWS
+# rows of rows*cols floats (see core.scoring), about 115 KB for
+# 30x30. Rooms keep a reference to their own palette, so one in use
+# is never rebuilt however many rooms are live.
+PALETTE_CACHE_SIZE = 64
+
+# Largest seed drawn for a room that asks for its own palette.
+MAX_SEED = 2 ** 31 - 1
+
+# Seeds offered in the lobby; "classic" is the original 5x5 board
+# and "room" draws a new seed for the room.
+ROOM_PRESET = "room"
+PRESETS = {
+    "classic": None,
+    "gradient-1": 1,
+    "gradient-2": 2,
+    "gradient-3": 3,
+}
+
+
+class Palette:
+    """Immutable colors of a ``rows`` x ``cols`` board, shared between rooms."""
+
+    __slots__ = ("seed", "rows", "cols", "colors", "by_key", "geometry", "_delta_e", "_lock", "__weakref__")
+
+    def __init__(self, seed, rows, cols, colors):
+        self.seed = seed
+        self.rows = rows
+        self.cols = cols
+        self.geometry = get_geometry(rows, cols)
+        self.colors = tuple(colors)  # Row-major, like geometry.keys.
+        self.by_key = MappingProxyType(dict(zip(self.geometry.keys, self.colors)))
+        self._delta_e = None
+        self._lock = threading.Lock()
+
+    @property
+    def id(self):
+        return f"{'classic' if self.seed is None else self.seed}-{self.rows}x{self.cols}"
+
+    def color_at(self, row, col):
+        return self.colors[row * self.cols + col]
+
+    def random_cell(self, rng=random):
+        """Return ``(row, col, color)`` of a random cell."""
+        index = rng.randrange(len(self.colors))
+        row, col = divmod(index, self.cols)
+        return row, col, self.colors[index]
+
+    @property
+    def delta_e(self):
+        """Perceptual distances between the cells (see core.scoring)."""
+        if self._delta_e is None:
+            with self._lock:
+                if self._delta_e is None:
+                    self._delta_e = DeltaETable(self.colors)
+        return self._delta_e
+
+    def __len__(self):
+        return len(self.colors)
+
+    def __repr__(self):
+        return f"<Palette {self.id}>"
+
+
+_HEX = tuple("%02X" % i for i in range(256))
+
+
+def _gradient_params(seed):
+    rng = random.Random(seed)
+    return {
+        "hue": rng.random(),
+        "direction": rng.choice((1, -1)),
+        "saturation": 0.65 + 0.3 * rng.random(),
+        "light": 0.82 + 0.1 * rng.random(),
+        "dark": 0.18 + 0.1 * rng.random(),
+    }
+
+
+def _gradient_python(rows, cols, p):
+    colors = []
+    for r in range(rows):
+        lightness = p["light"] + (p["dark"] - p["light"]) * r / max(rows - 1, 1)
+        for c in range(cols):
+            hue = (p["hue"] + p["direction"] * c / cols) % 1.0
+            red, green, blue = colorsys.hls_to_rgb(hue, lightness, p["saturation"])
+            colors.append((round(red * 255), round(green * 255), round(blue * 255)))
+    return colors
+
+
+def _gradient_numpy(rows, cols, p):
+    # Branch-free HSL -> RGB: channel n is l - a * clip(min(k - 3, 9 - k), -1, 1)
+    # with k = (n + 12 * hue) % 12, for n = 0, 8, 4 (red, green, blue).
+    hue = (p["hue"] + p["direction"] * np.arange(cols) / cols) % 1.0
+    lightness = np.linspace(p["light"], p["dark"], rows)[:, None, None]
+    a = p["saturation"] * np.minimum(lightness, 1 - lightness)
+    k = (np.array([0, 8, 4])[None, :] + 12 * hue[:, None]) % 12  # (cols, 3)
+    rgb = lightness - a * np.clip(np.minimum(k - 3, 9 - k), -1, 1)
+    return np.rint(rgb * 255).astype(int).reshape(-1, 3).tolist()
+
+
+def generate_gradient(seed, rows, cols):
+    """Hex colors (row-major) of the gradient board for ``seed``."""
+    params = _gradient_params(seed)
+    build = _gradient_numpy if np is not None else _gradient_python
+    return ["#" + _HEX[r] + _HEX[g] + _HEX[b] for r, g, b in build(rows, cols, params)]
+
+
+def seed_for(preset, rng=random):
+    """Seed of the lobby choice ``preset``; unknown names get a room seed."""
+    if preset in PRESETS:
+        return PRESETS[preset]
+    return rng.randint(1, MAX_SEED)
+
+
+def get_palette(seed, rows, cols=None):
+    """Shared palette for ``seed``; None is the classic board (5x5 only)."""
+    cols = rows if cols is None else cols
+    if seed is None and (rows, cols) != (5, 5):
+        seed = 0
+    return _cached_palette(seed, rows, cols)
+
+
+@lru_cache(maxsize=PALETTE_CACHE_SIZE)
+def _cached_palette(seed, rows, cols):
+    if seed is None:
+        keys = get_geometry(rows, cols).keys
+        return Palette(None, rows, cols, (CLASSIC_PALETTE[key] for key in keys))
+    return Palette(seed, rows, cols, generate_gradient(seed, rows, cols))
@@ -0,0 +1,257 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import GameRound, GameSession, Player, PlayerMove
+from .room import MoveColumns, RoomState, Round
+from .room import Player as RoomPlayer
+
+# -------------------------------------------------------------
+# Bridge between in-memory rooms and the ORM models.
+# RoomWriter turns room snapshots into batched bulk_create /
+# bulk_update calls, only writing what changed since the last
+# write; load_room rebuilds a RoomState from the tables.
+# -------------------------------------------------------------
+
+
+class _SyncedRoom:
+    """What is already in the database for one room."""
+
+    def __init__(self, pk=None):
+        self.pk = pk
+        self.session_fields = None
+        self.players = {}  # public id -> [pk, score]
+        self.rounds = {}   # round number -> [pk, short hint, long hint, scored]
+        self.moves = defaultdict(int)  # round number -> moves written
+
+
+class RoomWriter:
+    """Writes rooms to the ORM models in a few bulk queries per batch."""
+
+    def __init__(self):
+        self._synced = {}
+        self._lock = threading.Lock()
+
+    def forget(self, codes):
+        with self._lock:
+            for code in codes:
+                self._synced.pop(code, None)
+
+    def write(self, rooms, active=True):
+        """Persist ``rooms``, a list of ``(code, RoomState)`` pairs."""
+        if not rooms:
+            return
+        with self._lock:
+            try:
+                with transaction.atomic():
+                    self._write(rooms, active)
+            except Exception:
+                # Our view of the tables may be wrong now; reload it next time.
+                for code, _ in rooms:
+                    self._synced.pop(code, None)
+                raise
+
+    def _write(self, rooms, active):
+        self._load_synced([code for code, _ in rooms if code not in self._synced])
+        synced = {code: self._synced[code] for code, _ in rooms}
+
+        # Sessions
+        new_sessions, changed_sessions = [], []
+        for code, room in rooms:
+            fields = (
+                room.mode, room.status, room.grid_size, room.palette_seed,
+                room.current_round_number, active, dict(room.requests),
+            )
+            state = synced[code]
+            if fields == state.session_fields:
+                continue
+            game = GameSession(
+                pk=state.pk, code=code, mode=room.mode, status=room.status,
+                grid_size=room.grid_size, palette_seed=room.palette_seed,
+                current_round=room.current_round_number,
+                is_active=active, recent_requests=fields[-1],
+            )
+            (changed_sessions if state.pk else new_sessions).append((state, game, fields))
+        GameSession.objects.bulk_create([game for _, game, _ in new_sessions])
+        GameSession.objects.bulk_update(
+            [game for _, game, _ in changed_sessions],
+            ["mode", "status", "grid_size", "palette_seed", "current_round", "is_active", "recent_requests"],
+        )
+        for state, game, fields in new_sessions + changed_sessions:
+            state.pk = game.pk
+            state.session_fields = fields
+
+        # Players
+        new_players, changed_players = [], []
+        for code, room in rooms:
+            state = synced[code]
+            for p in room.players:
+                score = p.points
+                known = state.players.get(p.id)
+                if known is None:
+                    new_players.append((state, p.id, Player(
+                        session_id=state.pk, public_id=p.id, name=p.name, score=score,
+                        device_type=p.device, is_host=p.is_host, token=p.token,
+                    )))
+                elif known[1] != score:
+                    known[1] = score
+                    changed_players.append(Player(pk=known[0], score=score))
+        Player.objects.bulk_create([obj for _, _, obj in new_players])
+        Player.objects.bulk_update(changed_players, ["score"])
+        for state, public_id, obj in new_players:
+            state.players[public_id] = [obj.pk, obj.score]
+
+        # Rounds
+        new_rounds, changed_rounds = [], []
+        for code, room in rooms:
+            state = synced[code]
+            for r in room.rounds:
+                explainer = state.players.get(r.explainer_id)
+                if explainer is None:
+                    continue  # No eligible explainer: cannot satisfy the FK.
+                values = [r.short_hint, r.long_hint, r.scored]
+                known = state.rounds.get(r.round_number)
+                if known is None:
+                    new_rounds.append((state, r.round_number, values, GameRound(
+                        session_id=state.pk, round_number=r.round_number,
+                        target_color=r.target_color,
+                        target_row=r.target_row,
+                        target_col=r.target_col,
+                        explainer_id=explainer[0],
+                        short_hint=values[0], long_hint=values[1], scored=values[2],
+                    )))
+                elif known[1:] != values:
+                    known[1:] = values
+                    changed_rounds.append(GameRound(
+                        pk=known[0], short_hint=values[0], long_hint=values[1], scored=values[2],
+                    ))
+        GameRound.objects.bulk_create([obj for _, _, _, obj in new_rounds])
+        GameRound.objects.bulk_update(changed_rounds, ["short_hint", "long_hint", "scored"])
+        for state, number, values, obj in new_rounds:
+            state.rounds[number] = [obj.pk, *values]
+
+        # Moves are append-only: write the tail of each round.
+        new_moves = []
+        for code, room in rooms:
+            state = synced[code]
+            for r in room.rounds:
+                known = state.rounds.get(r.round_number)
+                written = state.moves[r.round_number]
+                total = len(r.moves)
+                if known is None or written == total:
+                    continue
+                for i in range(written, total):
+                    m = r.moves[i]
+                    new_moves.append(PlayerMove(
+                        player_id=state.players[room.players[m.player].id][0], round_id=known[0],
+                        attempt_number=m.attempt_number,
+                        chosen_color=room.palette.color_at(m.row, m.col),
+                        row=m.row, col=m.col,
+                        color_distance=m.distance if m.delta_e is None else m.delta_e,
+                        score=m.score,
+                    ))
+                state.moves[r.round_number] = total
+        PlayerMove.objects.bulk_create(new_moves)
+
+    def _load_synced(self, codes):
+        """Read what the database already holds for rooms we have not written yet."""
+        if not codes:
+            return
+        games = GameSession.objects.filter(code__in=codes, is_active=True)
+        by_pk = {}
+        for game in games:
+            state = by_pk[game.pk] = _SyncedRoom(game.pk)
+            state.session_fields = (
+                game.mode, game.status, game.grid_size, game.palette_seed,
+                game.current_round, game.is_active, game.recent_requests,
+            )
+            self._synced[game.code] = state
+        for code in codes:
+            self._synced.setdefault(code, _SyncedRoom())
+        if not by_pk:
+            return
+
+        players = Player.objects.filter(session_id__in=by_pk)
+        for session_id, public_id, pk, score in players.values_list(
+            "session_id", "public_id", "pk", "score"
+        ):
+            by_pk[session_id].players[public_id] = [pk, score]
+
+        rounds = GameRound.objects.filter(session_id__in=by_pk)
+        number_of = {}
+        for session_id, number, pk, short_hint, long_hint, scored in rounds.values_list(
+            "session_id", "round_number", "pk", "short_hint", "long_hint", "scored"
+        ):
+            by_pk[session_id].rounds[number] = [pk, short_hint, long_hint, scored]
+            number_of[pk] = (session_id, number)
+
+        counts = (
+            PlayerMove.objects.filter(round_id__in=number_of)
+            .values("round_id").annotate(n=Count("id"))
+        )
+        for row in counts:
+            session_id, number = number_of[row["round_id"]]
+            by_pk[session_id].moves[number] = row["n"]
+
+
+room_writer = RoomWriter()
+
+
+def archive_room(code, room):
+    """Write ``room`` with its players, rounds and moves as an inactive GameSession."""
+    room_writer.write([(code, room)], active=False)
+    room_writer.forget([code])
+
+
+def load_room(code):
+    """Rebuild the active room ``code`` from the database, or return None."""
+    game = GameSession.objects.filter(code=code, is_active=True).first()
+    if game is None:
+        return None
+
+    room = RoomState(
+        mode=game.mode, status=game.status, grid_size=game.grid_size,
+        palette_seed=game.palette_seed,
+    )
+    players = {}
+    for player in game.players.order_by("pk"):
+        players[player.pk] = room.add_player(RoomPlayer(
+            id=player.public_id,
+            name=player.name,
+            device=player.device_type,
+            is_host=player.is_host,
+            points=0 if player.is_host else player.score,
+            token=player.token,
+        ))
+
+    moves = defaultdict(list)
+    for move in PlayerMove.objects.filter(round__session=game).order_by("pk"):
+        moves[move.round_id].append(move)
+
+    for game_round in game.rounds.order_by("round_number"):
+        columns = MoveColumns()
+        for move in moves[game_round.pk]:
+            # Only the color distance is stored; the cell distance follows from the target.
+            distance = max(
+                abs(move.row - game_round.target_row), abs(move.col - game_round.target_col)
+            )
+            columns.append(
+                players[move.player_id].index, move.attempt_number, move.row, move.col,
+                distance, move.score, move.color_distance,
+            )
+        room.add_round(Round(
+            round_number=game_round.round_number,
+            explainer_id=players[game_round.explainer_id].id,
+            target_color=game_round.target_color,
+            target_row=game_round.target_row,
+            target_col=game_round.target_col,
+            short_hint=game_round.short_hint,
+            long_hint=game_round.long_hint,
+            scored=game_round.scored,
+            moves=columns,
+        ))
+    room.current_round = room.get_round(game.current_round)
+    room.requests = dict(game.recent_requests)
+    return room
@@ -0,0 +1,592 @@
+import operator
+import time
+from array import array
+from dataclasses import asdict, dataclass, field
+from typing import NamedTuple
+
+from .geometry import get_geometry
+from .leaderboard import Leaderboard
+from .palettes import get_palette
+from .scoring import score_moves
+
+try:
+    import numpy as np
+except ImportError:  # Optional: the heatmap falls back to typed arrays.
+    np = None
+
+# -------------------------------------------------------------
+# In-memory state of one game room.
+# Players and rounds are small slotted objects, indexed by id /
+# round number, and the current round is held as a direct
+# reference, so views never scan the lists on the request path.
+# The moves of a round are kept column-wise in typed arrays
+# (a few bytes per move) and refer to players by their index in
+# the room; iterating them yields Move tuples built on the fly.
+#
+# Each round also tracks its progress incrementally:
+#   attempts  -> moves recorded so far per player index
+#   pending   -> guessers that still owe a move
+#   occupancy -> cell index -> indexes of the players who guessed it
+#   heatmap   -> guesses per cell and attempt, and score totals
+#                (current round only)
+# so completion and attempt checks are constant time, the TV
+# board only visits the cells that were guessed, and a room with
+# hundreds of guessers is summed up without looking at a move.
+#
+# Players other than the host are also ranked in a Leaderboard,
+# updated with every score change, with the ranks at the start
+# of the round kept so each player's rank change can be shown.
+#
+# When the last move of a round is in, the round is finalized in
+# the same store update: points are awarded and a results
+# snapshot is stored in the round, which results pages then
+# serve as is.
+#
+# Every change goes through a method of RoomState. While
+# ``events`` is a list (the store sets one up when an event log
+# is configured, see core.eventlog) each method also appends a
+# compact ``(kind, data)`` event, and ``apply_event`` replays
+# them.
+# -------------------------------------------------------------
+
+ATTEMPTS_PER_ROUND = 2
+
+# Idempotency keys remembered per room. Phones retry a POST within
+# seconds, so a few hundred cover every player of a big room.
+REMEMBERED_REQUESTS = 256
+
+
+@dataclass(slots=True)
+class Player:
+    id: str
+    name: str
+    device: str = "mobile"
+    is_host: bool = False
+    points: int = 0
+    # Random id of the browser that joined, which lets it reconnect.
+    token: str = ""
+    # Position in the room, which is how moves refer to the player.
+    index: int = 0
+
+    def to_dict(self):
+        return {
+            "id": self.id, "name": self.name, "device": self.device,
+            "is_host": self.is_host, "points": self.points, "token": self.token,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=data["id"], name=data.get("name", ""), device=data.get("device", "mobile"),
+            is_host=data.get("is_host", False), points=data.get("points", 0),
+            token=data.get("token", ""),
+        )
+
+
+class Move(NamedTuple):
+    player: int  # Index of the player in the room.
+    attempt_number: int
+    row: int
+    col: int
+    distance: int
+    score: int
+    delta_e: float | None
+
+
+# Moves recorded before the color distance was kept have no delta E.
+NO_DELTA_E = 0xFFFF
+
+
+class MoveColumns:
+    """The moves of a round as parallel typed arrays, one per field.
+
+    The delta E column holds hundredths, so it fits an unsigned short.
+    """
+
+    __slots__ = ("player", "attempt", "row", "col", "distance", "score", "delta_e")
+
+    TYPECODES = {
+        "player": "H", "attempt": "B", "row": "B", "col": "B",
+        "distance": "B", "score": "B", "delta_e": "H",
+    }
+
+    def __init__(self, columns=None):
+        for name, typecode in self.TYPECODES.items():
+            setattr(self, name, array(typecode, columns[name] if columns else ()))
+
+    def append(self, player, attempt_number, row, col, distance, score, delta_e=None):
+        self.player.append(player)
+        self.attempt.append(attempt_number)
+        self.row.append(row)
+        self.col.append(col)
+        self.distance.append(distance)
+        self.score.append(score)
+        self.delta_e.append(NO_DELTA_E if delta_e is None else round(delta_e * 100))
+
+    def __len__(self):
+        return len(self.player)
+
+    def __getitem__(self, i):
+        delta_e = self.delta_e[i]
+        return Move(
+            self.player[i], self.attempt[i], self.row[i], self.col[i],
+            self.distance[i], self.score[i], None if delta_e == NO_DELTA_E else delta_e / 100,
+        )
+
+    def __iter__(self):
+        for i in range(len(self.player)):
+            yield self[i]
+
+    def to_dict(self):
+        return {name: getattr(self, name).tolist() for name in self.TYPECODES}
+
+
+class Heatmap:
+    """Running aggregates of a round: guesses per cell for each attempt,
+    in arrays preallocated for the board, and the score totals.
+    """
+
+    __slots__ = ("counts", "guesses", "score_sum")
+
+    def __init__(self, cells):
+        if np is not None:
+            self.counts = [np.zeros(cells, dtype=np.uint32) for _ in range(ATTEMPTS_PER_ROUND)]
+        else:
+            self.counts = [array("I", bytes(4 * cells)) for _ in range(ATTEMPTS_PER_ROUND)]
+        self.guesses = 0
+        self.score_sum = 0
+
+    def add(self, attempt_number, cell, score):
+        self.counts[min(attempt_number, ATTEMPTS_PER_ROUND) - 1][cell] += 1
+        self.guesses += 1
+        self.score_sum += score
+
+    def totals(self):
+        """Guesses per cell, all attempts together."""
+        if np is not None:
+            return sum(self.counts).tolist()
+        return list(map(operator.add, *self.counts))
+
+    @property
+    def average_score(self):
+        return self.score_sum / self.guesses if self.guesses else 0.0
+
+
+@dataclass(slots=True, frozen=True)
+class PlayerResult:
+    player_id: str
+    name: str
+    rank: int
+    round_score: int
+    total_score: int
+    closest_delta_e: float | None
+
+
+@dataclass(slots=True)
+class Round:
+    round_number: int
+    explainer_id: str | None
+    target_color: str = ""
+    target_row: int = 0
+    target_col: int = 0
+    short_hint: str = ""
+    long_hint: str = ""
+    scored: bool = False
+    # Snapshot taken when the round is finalized: a tuple of PlayerResult.
+    results: tuple | None = None
+    moves: MoveColumns = field(default_factory=MoveColumns)
+    # Progress counters, rebuilt from the moves when a room is loaded.
+    attempts: bytearray = field(default_factory=bytearray)
+    pending: int = 0
+    occupancy: dict = field(default_factory=dict)
+    heatmap: Heatmap | None = None
+
+    @property
+    def target(self):
+        return self.target_row, self.target_col
+
+    def to_dict(self):
+        return {
+            "round_number": self.round_number,
+            "explainer_id": self.explainer_id,
+            "target_color": self.target_color,
+            "target": [self.target_row, self.target_col],
+            "short_hint": self.short_hint,
+            "long_hint": self.long_hint,
+            "scored": self.scored,
+            "results": None if self.results is None else [asdict(r) for r in self.results],
+            "moves": self.moves.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data, player_index=None):
+        """Build a round from ``to_dict`` output.
+
+        Rounds saved by older versions keep their moves as a list of dicts
+        keyed by player id; ``player_index`` maps those ids to indexes.
+        """
+        if "target" in data:
+            target_row, target_col = data["target"]
+        else:
+            position = data.get("target_position", {})
+            target_row, target_col = position.get("row", 0), position.get("col", 0)
+        moves = data.get("moves") or {}
+        if isinstance(moves, list):
+            columns = MoveColumns()
+            for m in moves:
+                columns.append(
+                    player_index[m["player_id"]], m.get("attempt_number", 1),
+                    m.get("row", 0), m.get("col", 0), m.get("distance", 0),
+                    m.get("score", 0), m.get("delta_e"),
+                )
+        else:
+            columns = MoveColumns(moves or None)
+        results = data.get("results")
+        return cls(
+            round_number=data["round_number"],
+            explainer_id=data.get("explainer_id"),
+            target_color=data.get("target_color", ""),
+            target_row=target_row,
+            target_col=target_col,
+            short_hint=data.get("short_hint", ""),
+            long_hint=data.get("long_hint", ""),
+            scored=data.get("scored", False),
+            results=None if results is None else tuple(PlayerResult(**r) for r in results),
+            moves=columns,
+        )
+
+
+def is_guesser(player, round_data):
+    """True if ``player`` has to guess in ``round_data``."""
+    return not player.is_host and player.id != round_data.explainer_id
+
+
+class RoomState:
+    """Players, rounds and status of a room with O(1) lookups."""
+
+    __slots__ = (
+        "mode", "status", "grid_size", "palette_seed", "last_active", "version", "modified",
+        "players", "rounds", "current_round", "_players_by_id", "_rounds_by_number", "events",
+        "leaderboard", "requests", "_players_by_token", "_palette", "edits",
+    )
+
+    def __init__(self, mode="local", status="lobby", grid_size=5, last_active=None,
+                 version=0, modified=None, palette_seed=None):
+        self.mode = mode
+        self.status = status
+        self.grid_size = grid_size
+        # None is the classic board (see core.palettes).
+        self.palette_seed = palette_seed
+        self._palette = None
+        # Wall-clock time of the last access, used to evict idle rooms.
+        self.last_active = last_active or time.time()
+        # Bumped by the store after every update; polled views derive their
+        # ETag / Last-Modified from it.
+        self.version = version
+        self.modified = modified or time.time()
+        self.players = []
+        self.rounds = []
+        self.current_round = None
+        self._players_by_id = {}
+        self._players_by_token = {}
+        self._rounds_by_number = {}
+        self.leaderboard = Leaderboard()
+        # Idempotency key -> id of the player whose request it applied,
+        # oldest first, at most REMEMBERED_REQUESTS of them.
+        self.requests = {}
+        # Events of the store update in progress, or None when not recorded.
+        self.events = None
+        # Changes made through the methods below; the store only saves
+        # (and bumps the version of) an update that changed this.
+        self.edits = 0
+
+    def mark_changed(self):
+        self.version += 1
+        self.modified = time.time()
+
+    @property
+    def geometry(self):
+        return get_geometry(self.grid_size)
+
+    @property
+    def palette(self):
+        """Colors of the board; shared with every room on the same seed and size.
+
+        Held by the room, so the palette (and its delta E table) lives as
+        long as the room, not only while it is in the shared cache.
+        """
+        if self._palette is None:
+            self._palette = get_palette(self.palette_seed, self.grid_size)
+        return self._palette
+
+    # Events --------------------------------------------------
+
+    def _emit(self, kind, **data):
+        self.edits += 1
+        if self.events is not None:
+            self.events.append((kind, data))
+
+    def apply_event(self, kind, data):
+        """Replay an event recorded by one of the methods below."""
+        REPLAY[kind](self, **data)
+
+    def start(self, grid_size, palette_seed):
+        """Leave the lobby on a ``grid_size`` board colored by ``palette_seed``."""
+        self._emit("start", grid_size=grid_size, palette_seed=palette_seed)
+        self.grid_size = grid_size
+        self.palette_seed = palette_seed
+        self._palette = get_palette(palette_seed, grid_size)
+        self.status = "in_game"
+
+    # Players -------------------------------------------------
+
+    def add_player(self, player):
+        self._emit("join", player=player.to_dict())
+        player.index = len(self.players)
+        self.players.append(player)
+        self._players_by_id[player.id] = player
+        if player.token:
+            self._players_by_token[player.token] = player
+        if not player.is_host:
+            self.leaderboard.add(player.index, player.points)
+        # Late joiners are expected to guess in the round in progress,
+        # unless it is already finalized.
+        round_data = self.current_round
+        if round_data and not round_data.scored and is_guesser(player, round_data):
+            round_data.pending += 1
+        return player
+
+    def get_player(self, player_id):
+        return self._players_by_id.get(player_id)
+
+    def player_for_token(self, token):
+        """The player who joined from the browser ``token``, or None."""
+        return self._players_by_token.get(token) if token else None
+
+    @property
+    def host(self):
+        return self.players[0] if self.players else None
+
+    def award_points(self, player_id, points):
+        """Give ``points`` to a player outside of their own moves (explainer bonus)."""
+        player = self._players_by_id.get(player_id)
+        if player is None:
+            return
+        self._emit("bonus", player_id=player_id, points=points)
+        player.points += points
+        if player.index in self.leaderboard:
+            self.leaderboard.set(player.index, player.points)
+
+    # Rounds --------------------------------------------------
+
+    def add_round(self, round_data):
+        """Append a round and make it the current one."""
+        self._emit("round", round_data=round_data.to_dict())
+        self._track_progress(round_data)
+        self.rounds.append(round_data)
+        self._rounds_by_number[round_data.round_number] = round_data
+        if self.current_round is not None:
+            self.current_round.heatmap = None
+        self.current_round = round_data
+        self._build_heatmap(round_data)
+        self.leaderboard.mark()
+        return round_data
+
+    def get_round(self, round_number):
+        return self._rounds_by_number.get(round_number)
+
+    def set_hints(self, round_number, short_hint, long_hint):
+        round_data = self._rounds_by_number[round_number]
+        self._emit("hint", round_number=round_number, short_hint=short_hint, long_hint=long_hint)
+        round_data.short_hint = short_hint
+        round_data.long_hint = long_hint
+
+    @property
+    def current_round_number(self):
+        return self.current_round.round_number if self.current_round else None
+
+    def _track_progress(self, round_data):
+        """Build the progress counters from the moves already in the round."""
+        attempts = bytearray(len(self.players))
+        occupancy = {}
+        cell_index = self.geometry.index
+        moves = round_data.moves
+        for index, row, col in zip(moves.player, moves.row, moves.col):
+            attempts[index] += 1
+            occupancy.setdefault(cell_index(row, col), []).append(index)
+        round_data.attempts = attempts
+        round_data.occupancy = occupancy
+        round_data.pending = 0 if round_data.scored else sum(
+            1 for p in self.players
+            if is_guesser(p, round_data) and attempts[p.index] < ATTEMPTS_PER_ROUND
+        )
+
+    def _build_heatmap(self, round_data):
+        """Aggregate the moves already in ``round_data`` (the current round)."""
+        heatmap = Heatmap(len(self.geometry))
+        cell_index = self.geometry.index
+        moves = round_data.moves
+        for attempt, row, col, score in zip(moves.attempt, moves.row, moves.col, moves.score):
+            heatmap.add(attempt, cell_index(row, col), score)
+        round_data.heatmap = heatmap
+
+    # Moves ---------------------------------------------------
+
+    def attempts_of(self, player_id, round_data=None):
+        """Number of moves ``player_id`` made in the round (current by default)."""
+        round_data = round_data or self.current_round
+        player = self._players_by_id.get(player_id)
+        if player is None or player.index >= len(round_data.attempts):
+            return 0
+        return round_data.attempts[player.index]
+
+    def record_move(self, player_id, attempt_number, row, col, distance, score, delta_e=None):
+        """Append a move to the current round and update its counters."""
+        self._emit("move", player_id=player_id, attempt_number=attempt_number, row=row, col=col,
+                   distance=distance, score=score, delta_e=delta_e)
+        round_data = self.current_round
+        player = self._players_by_id[player_id]
+        index = player.index
+        round_data.moves.append(index, attempt_number, row, col, distance, score, delta_e)
+        cell = self.geometry.index(row, col)
+        round_data.occupancy.setdefault(cell, []).append(index)
+        if round_data.heatmap is not None:
+            round_data.heatmap.add(attempt_number, cell, score)
+        attempts = round_data.attempts
+        if index >= len(attempts):
+            attempts.extend(bytes(index + 1 - len(attempts)))
+        attempts[index] += 1
+        # Only guessers are counted in ``pending`` (see _track_progress).
+        if attempts[index] == ATTEMPTS_PER_ROUND and is_guesser(player, round_data):
+            round_data.pending -= 1
+
+    def is_round_over(self, round_data=None):
+        round_data = round_data or self.current_round
+        return round_data.pending <= 0
+
+    # Results -------------------------------------------------
+
+    def finalize_round(self, round_data=None):
+        """Award the points of a finished round and snapshot its results.
+
+        Safe to call again: points are only awarded once, and the snapshot
+        of a finalized round is returned as is.
+        """
+        round_data = round_data or self.current_round
+        if not round_data.scored or round_data.results is None:
+            self._emit("finalize", round_number=round_data.round_number)
+        if not round_data.scored:
+            moves = round_data.moves
+            scored = set()
+            for index, score in zip(moves.player, moves.score):
+                self.players[index].points += score
+                scored.add(index)
+            for index in scored:
+                if index in self.leaderboard:
+                    self.leaderboard.set(index, self.players[index].points)
+            round_data.scored = True
+        if round_data.results is None:
+            round_data.results = self._results_snapshot(round_data)
+        return round_data.results
+
+    def _results_snapshot(self, round_data):
+        """Round score, total and rank of every player, best total first.
+
+        Moves saved without their delta E (by older versions) are scored
+        against the target in one batch, so every player who guessed gets
+        a closest color.
+        """
+        moves = list(round_data.moves)
+        unscored = [m for m in moves if m.delta_e is None]
+        if unscored:
+            rescored = iter(score_moves(self.palette, round_data.target, unscored))
+            moves = [m._replace(delta_e=next(rescored)[1]) if m.delta_e is None else m for m in moves]
+
+        round_scores, closest = {}, {}
+        for move in moves:
+            round_scores[move.player] = round_scores.get(move.player, 0) + move.score
+            closest[move.player] = min(closest.get(move.player, move.delta_e), move.delta_e)
+
+        results = []
+        for rank, index, _ in self.leaderboard.top():
+            player = self.players[index]
+            results.append(PlayerResult(
+                player_id=player.id,
+                name=player.name,
+                rank=rank,
+                round_score=round_scores.get(player.index, 0),
+                total_score=player.points,
+                closest_delta_e=closest.get(player.index),
+            ))
+        return tuple(results)
+
+    # Retried requests ----------------------------------------
+
+    def seen_request(self, key):
+        """Id of the player whose request ``key`` was already applied, or None."""
+        return self.requests.get(key) if key else None
+
+    def remember_request(self, key, player_id):
+        """Record that the request ``key`` of ``player_id`` was applied."""
+        self._emit("request", key=key, player_id=player_id)
+        self.requests[key] = player_id
+        if len(self.requests) > REMEMBERED_REQUESTS:
+            del self.requests[next(iter(self.requests))]
+
+    # Serialization -------------------------------------------
+
+    def to_dict(self):
+        """JSON-ready form, used by the shared store, snapshots and events."""
+        return {
+            "mode": self.mode,
+            "status": self.status,
+            "grid_size": self.grid_size,
+            "palette_seed": self.palette_seed,
+            "players": [p.to_dict() for p in self.players],
+            "rounds": [r.to_dict() for r in self.rounds],
+            "current_round": self.current_round_number,
+            "requests": self.requests,
+            "last_active": self.last_active,
+            "version": self.version,
+            "modified": self.modified,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        room = cls(
+            mode=data.get("mode", "local"),
+            status=data.get("status", "lobby"),
+            grid_size=data.get("grid_size", 5),
+            last_active=data.get("last_active"),
+            version=data.get("version", 0),
+            modified=data.get("modified"),
+            palette_seed=data.get("palette_seed"),
+        )
+        for player in data.get("players", []):
+            room.add_player(Player.from_dict(player))
+        player_index = {p.id: p.index for p in room.players}
+        for data_round in data.get("rounds", []):
+            round_data = Round.from_dict(data_round, player_index)
+            room._track_progress(round_data)
+            room.rounds.append(round_data)
+            room._rounds_by_number[round_data.round_number] = round_data
+        room.current_round = room.get_round(data.get("current_round"))
+        if room.current_round is not None:
+            room._build_heatmap(room.current_round)
+        room.leaderboard.mark()
+        room.requests = dict(data.get("requests", {}))
+        return room
+
+
+# Event kind -> how to replay it. The data of each event holds the
+# keyword arguments of the method that recorded it.
+REPLAY = {
+    "start": RoomState.start,
+    "join": lambda room, player: room.add_player(Player.from_dict(player)),
+    "bonus": RoomState.award_points,
+    "round": lambda room, round_data: room.add_round(Round.from_dict(round_data)),
+    "hint": RoomState.set_hints,
+    "move": RoomState.record_move,
+    "request": RoomState.remember_request,
+    "finalize": lambda room, round_number: room.finalize_round(room.get_round(round_number)),
+}
@@ -0,0 +1,244 @@
+import math
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without it rows of the table are computed on demand.
+    np = None
+
+# -------------------------------------------------------------
+# Perceptual color distance (CIELAB, CIEDE2000).
+# Each palette gets a DeltaETable of distances between its cells,
+# by rows: a row (one target against every cell) is computed the
+# first time the cell is a target, in one vectorized pass with
+# NumPy, and only the last DELTA_E_ROWS rows are kept. Scoring a
+# guess is then a lookup, and a round's moves can be scored in
+# one call. A whole matrix would be rows*cols squared floats,
+# 3 MB for a 30x30 board, for every palette in use.
+# -------------------------------------------------------------
+
+# Points by perceptual distance when GAME_SCORING["METHOD"] is
+# "perceptual": below the first bound 3 points, below the second 2.
+# Hitting the target cell itself is always worth 4.
+DELTA_E_POINTS = ((10.0, 3), (20.0, 2))
+EXACT_POINTS = 4
+
+# Rows kept by each DeltaETable; a round has a single target, so
+# this covers the recent rounds of every room on the palette.
+DELTA_E_ROWS = 32
+
+
+def hex_to_lab(color):
+    """CIELAB (D65) coordinates of an sRGB hex color such as "#33FF57"."""
+    color = color.lstrip("#")
+    rgb = [int(color[i:i + 2], 16) / 255 for i in (0, 2, 4)]
+    r, g, b = (c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4 for c in rgb)
+    x = (0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047
+    y = (0.2126729 * r + 0.7151522 * g + 0.0721750 * b) / 1.0
+    z = (0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883
+
+    def f(t):
+        return t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116
+
+    fx, fy, fz = f(x), f(y), f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def delta_e_2000(lab1, lab2):
+    """CIEDE2000 color difference between two CIELAB colors."""
+    L1, a1, b1 = lab1
+    L2, a2, b2 = lab2
+    c_bar = (math.hypot(a1, b1) + math.hypot(a2, b2)) / 2
+    g = 0.5 * (1 - math.sqrt(c_bar ** 7 / (c_bar ** 7 + 25 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = math.hypot(a1p, b1), math.hypot(a2p, b2)
+    h1p = math.degrees(math.atan2(b1, a1p)) % 360 if c1p else 0.0
+    h2p = math.degrees(math.atan2(b2, a2p)) % 360 if c2p else 0.0
+
+    dL = L2 - L1
+    dC = c2p - c1p
+    dh = h2p - h1p
+    if c1p * c2p == 0:
+        dh = 0.0
+    elif dh > 180:
+        dh -= 360
+    elif dh < -180:
+        dh += 360
+    dH = 2 * math.sqrt(c1p * c2p) * math.sin(math.radians(dh / 2))
+
+    L_bar = (L1 + L2) / 2
+    cp_bar = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    if c1p * c2p == 0:
+        h_bar = h_sum
+    elif abs(h1p - h2p) <= 180:
+        h_bar = h_sum / 2
+    elif h_sum < 360:
+        h_bar = (h_sum + 360) / 2
+    else:
+        h_bar = (h_sum - 360) / 2
+
+    t = (1 - 0.17 * math.cos(math.radians(h_bar - 30))
+         + 0.24 * math.cos(math.radians(2 * h_bar))
+         + 0.32 * math.cos(math.radians(3 * h_bar + 6))
+         - 0.20 * math.cos(math.radians(4 * h_bar - 63)))
+    d_theta = 30 * math.exp(-(((h_bar - 275) / 25) ** 2))
+    r_c = 2 * math.sqrt(cp_bar ** 7 / (cp_bar ** 7 + 25 ** 7))
+    s_l = 1 + 0.015 * (L_bar - 50) ** 2 / math.sqrt(20 + (L_bar - 50) ** 2)
+    s_c = 1 + 0.045 * cp_bar
+    s_h = 1 + 0.015 * cp_bar * t
+    r_t = -math.sin(math.radians(2 * d_theta)) * r_c
+    return math.sqrt(
+        (dL / s_l) ** 2 + (dC / s_c) ** 2 + (dH / s_h) ** 2 + r_t * (dC / s_c) * (dH / s_h)
+    )
+
+
+def delta_e_2000_matrix(labs):
+    """Pairwise CIEDE2000 of an (n, 3) array of CIELAB colors, with NumPy."""
+    labs = np.asarray(labs, dtype=np.float64)
+    return delta_e_2000_arrays(labs[:, None, :], labs[None, :, :])
+
+
+def delta_e_2000_arrays(labs1, labs2):
+    """CIEDE2000 between (..., 3) arrays of CIELAB colors, broadcast, with NumPy."""
+    labs1 = np.asarray(labs1, dtype=np.float64)
+    labs2 = np.asarray(labs2, dtype=np.float64)
+    L1, a1, b1 = (labs1[..., i] for i in range(3))
+    L2, a2, b2 = (labs2[..., i] for i in range(3))
+    c_bar = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    g = 0.5 * (1 - np.sqrt(c_bar ** 7 / (c_bar ** 7 + 25 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.where(c1p == 0, 0.0, np.degrees(np.arctan2(b1, a1p)) % 360)
+    h2p = np.where(c2p == 0, 0.0, np.degrees(np.arctan2(b2, a2p)) % 360)
+    zero = (c1p * c2p) == 0
+
+    dL = L2 - L1
+    dC = c2p - c1p
+    dh = h2p - h1p
+    dh = np.where(dh > 180, dh - 360, np.where(dh < -180, dh + 360, dh))
+    dh = np.where(zero, 0.0, dh)
+    dH = 2 * np.sqrt(c1p * c2p) * np.sin(np.radians(dh / 2))
+
+    L_bar = (L1 + L2) / 2
+    cp_bar = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_bar = np.where(
+        np.abs(h1p - h2p) <= 180, h_sum / 2,
+        np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2),
+    )
+    h_bar = np.where(zero, h_sum, h_bar)
+
+    t = (1 - 0.17 * np.cos(np.radians(h_bar - 30))
+         + 0.24 * np.cos(np.radians(2 * h_bar))
+         + 0.32 * np.cos(np.radians(3 * h_bar + 6))
+         - 0.20 * np.cos(np.radians(4 * h_bar - 63)))
+    d_theta = 30 * np.exp(-(((h_bar - 275) / 25) ** 2))
+    r_c = 2 * np.sqrt(cp_bar ** 7 / (cp_bar ** 7 + 25 ** 7))
+    s_l = 1 + 0.015 * (L_bar - 50) ** 2 / np.sqrt(20 + (L_bar - 50) ** 2)
+    s_c = 1 + 0.045 * cp_bar
+    s_h = 1 + 0.015 * cp_bar * t
+    r_t = -np.sin(np.radians(2 * d_theta)) * r_c
+    return np.sqrt(
+        (dL / s_l) ** 2 + (dC / s_c) ** 2 + (dH / s_h) ** 2 + r_t * (dC / s_c) * (dH / s_h)
+    ).astype(np.float32)
+
+
+class DeltaETable:
+    """CIEDE2000 between cells of a palette, by cell index, a row per target."""
+
+    def __init__(self, colors, max_rows=DELTA_E_ROWS):
+        self.labs = [hex_to_lab(color) for color in colors]
+        self._array = np.asarray(self.labs, dtype=np.float64) if np is not None else None
+        self.max_rows = max_rows
+        # Target -> row, oldest first.
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def row(self, target):
+        """Distances from cell ``target`` to every cell."""
+        row = self._rows.get(target)
+        if row is None:
+            if self._array is not None:
+                row = delta_e_2000_arrays(self._array[target], self._array)
+            else:
+                lab = self.labs[target]
+                row = [delta_e_2000(lab, other) for other in self.labs]
+            with self._lock:
+                while len(self._rows) >= self.max_rows:
+                    del self._rows[next(iter(self._rows))]
+                row = self._rows.setdefault(target, row)
+        return row
+
+    def distance(self, target, guess):
+        return float(self.row(target)[guess])
+
+    def distances(self, target, guesses):
+        """Distances from ``target`` to each of the ``guesses``, in one pass."""
+        row = self.row(target)
+        if self._array is not None:
+            return row[list(guesses)].tolist()
+        return [row[guess] for guess in guesses]
+
+    def pairs(self, targets, guesses):
+        """Distances of many ``(target, guess)`` pairs given as index arrays, with NumPy."""
+        if self._array is None:
+            raise RuntimeError("DeltaETable.pairs needs NumPy.")
+        return delta_e_2000_arrays(self._array[targets], self._array[guesses])
+
+
+def points_for(method, geometry, grid_distance, delta_e):
+    if method == "perceptual":
+        if grid_distance == 0:
+            return EXACT_POINTS
+        for bound, points in DELTA_E_POINTS:
+            if delta_e < bound:
+                return points
+        return 0
+    return geometry.score_table[grid_distance]
+
+
+def points_for_many(method, geometry, grid_distances, delta_es):
+    """``points_for`` over NumPy arrays of grid distances and delta E, with NumPy."""
+    grid_distances = np.asarray(grid_distances)
+    if method == "perceptual":
+        delta_es = np.round(np.asarray(delta_es), 2)
+        points = np.zeros(grid_distances.shape, dtype=np.int64)
+        for bound, value in reversed(DELTA_E_POINTS):
+            points[delta_es < bound] = value
+        points[grid_distances == 0] = EXACT_POINTS
+        return points
+    return np.asarray(geometry.score_table, dtype=np.int64)[grid_distances]
+
+
+def score_guess(palette, target, row, col, method="grid"):
+    """Return ``(grid distance, delta E, points)`` of a guess at (row, col).
+
+    ``target`` is the ``(row, col)`` of the target cell.
+    """
+    geometry = palette.geometry
+    target_row, target_col = target
+    grid_distance = max(abs(target_row - row), abs(target_col - col))
+    delta_e = round(palette.delta_e.distance(
+        geometry.index(target_row, target_col), geometry.index(row, col)
+    ), 2)
+    return grid_distance, delta_e, points_for(method, geometry, grid_distance, delta_e)
+
+
+def score_moves(palette, target, moves, method="grid"):
+    """Score all ``moves`` (anything with ``row`` and ``col``) against ``target`` at once.
+
+    Returns a ``(grid distance, delta E, points)`` tuple per move. Results
+    of a round use it for moves saved without their delta E.
+    """
+    geometry = palette.geometry
+    target_row, target_col = target
+    deltas = palette.delta_e.distances(
+        geometry.index(target_row, target_col), [geometry.index(m.row, m.col) for m in moves]
+    )
+    results = []
+    for move, delta_e in zip(moves, deltas):
+        grid_distance = max(abs(target_row - move.row), abs(target_col - move.col))
+        delta_e = round(delta_e, 2)
+        results.append((grid_distance, delta_e, points_for(method, geometry, grid_distance, delta_e)))
+    return results
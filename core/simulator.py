@@ -0,0 +1,131 @@
+import random
+import time
+from collections import Counter
+
+from . import engine
+from .geometry import DEFAULT_SIZE
+from .palettes import get_palette
+from .room import ATTEMPTS_PER_ROUND, Player, RoomState
+from .scoring import EXACT_POINTS, np, points_for_many, score_guess
+
+# -------------------------------------------------------------
+# Batch simulator.
+# Plays synthetic games through core.engine, with the same rule
+# code the site runs, to balance the scoring tables and to see
+# how a rule change moves the numbers before shipping it. A
+# synthetic guesser aims at the target and misses by a Gaussian
+# number of cells per axis, less on the second attempt, when
+# the long hint is out.
+#     python manage.py simulate --games 5000 --players 6
+# ``sample_scores`` skips the rooms and scores guesses in bulk
+# (vectorized with NumPy) when only the score distribution of
+# a table matters.
+# -------------------------------------------------------------
+
+# Standard deviation of a guess around the target, in cells, per attempt.
+DEFAULT_SKILL = (2.0, 1.0)
+
+
+def _check_skill(skill):
+    skill = tuple(float(sigma) for sigma in skill)
+    if len(skill) != ATTEMPTS_PER_ROUND or any(sigma < 0 for sigma in skill):
+        raise ValueError(f"Skill must be {ATTEMPTS_PER_ROUND} non-negative spreads, one per attempt.")
+    return skill
+
+
+def simulate_games(games, players=4, rounds=None, grid_size=DEFAULT_SIZE, palette_seed=None,
+                   method="grid", skill=DEFAULT_SKILL, seed=None):
+    """Play ``games`` whole games of ``players`` guessers and return their statistics.
+
+    Every player explains ``rounds`` rounds in turn (one each by default).
+    """
+    skill = _check_skill(skill)
+    rounds = rounds or players
+    rng = random.Random(seed)
+    palette = get_palette(palette_seed, grid_size)
+    palette.delta_e  # Colors converted once, before the clock starts.
+    last = grid_size - 1
+    ids = [f"p{i}" for i in range(players)]
+
+    scores = {attempt: Counter() for attempt in range(1, ATTEMPTS_PER_ROUND + 1)}
+    total_points = winner_points = winner_margin = 0
+    started = time.perf_counter()
+    for _ in range(games):
+        room = RoomState()
+        room.add_player(Player(id="host", name="TV", is_host=True))
+        for player_id in ids:
+            room.add_player(Player(id=player_id, name=player_id))
+        engine.start_game(room, grid_size, palette.seed, rng)
+        for number in range(rounds):
+            current = engine.next_round(room, rng) if number else room.current_round
+            room.set_hints(current.round_number, "dica", "dica longa")
+            target_row, target_col = current.target
+            for attempt, sigma in enumerate(skill, 1):
+                counts = scores[attempt]
+                for player_id in ids:
+                    if player_id == current.explainer_id:
+                        continue
+                    row = min(max(round(rng.gauss(target_row, sigma)), 0), last)
+                    col = min(max(round(rng.gauss(target_col, sigma)), 0), last)
+                    counts[engine.play_move(room, player_id, row, col, method).score] += 1
+        top = room.leaderboard.top(2)
+        total_points += sum(player.points for player in room.players)
+        winner_points += top[0][2]
+        winner_margin += top[0][2] - (top[1][2] if len(top) > 1 else 0)
+    seconds = time.perf_counter() - started
+
+    guesses = sum(sum(counts.values()) for counts in scores.values())
+    guess_points = sum(score * n for counts in scores.values() for score, n in counts.items())
+    return {
+        "games": games,
+        "players": players,
+        "rounds": rounds,
+        "moves": guesses,
+        "seconds": round(seconds, 3),
+        "games_per_second": round(games / seconds) if seconds else None,
+        "points_per_guess": round(guess_points / guesses, 3) if guesses else 0,
+        "explainer_bonus_per_round": round((total_points - guess_points) / (games * rounds), 3) if games else 0,
+        "winner_points": round(winner_points / games, 2) if games else 0,
+        "winner_margin": round(winner_margin / games, 2) if games else 0,
+        "scores": {attempt: dict(sorted(counts.items())) for attempt, counts in scores.items()},
+    }
+
+
+def sample_scores(guesses, grid_size=DEFAULT_SIZE, palette_seed=None, method="grid",
+                  skill=DEFAULT_SKILL, seed=None):
+    """Score ``guesses`` synthetic guesses per attempt at random targets.
+
+    Returns ``{attempt: {points: count}}``. With NumPy all the guesses of
+    an attempt are drawn and scored as arrays; without it they go through
+    ``score_guess`` one by one.
+    """
+    skill = _check_skill(skill)
+    palette = get_palette(palette_seed, grid_size)
+    geometry = palette.geometry
+    last = grid_size - 1
+
+    if np is None:
+        rng = random.Random(seed)
+        results = {}
+        for attempt, sigma in enumerate(skill, 1):
+            counts = Counter()
+            for _ in range(guesses):
+                target_row, target_col, _color = palette.random_cell(rng)
+                row = min(max(round(rng.gauss(target_row, sigma)), 0), last)
+                col = min(max(round(rng.gauss(target_col, sigma)), 0), last)
+                counts[score_guess(palette, (target_row, target_col), row, col, method)[2]] += 1
+            results[attempt] = dict(sorted(counts.items()))
+        return results
+
+    generator = np.random.default_rng(seed)
+    results = {}
+    for attempt, sigma in enumerate(skill, 1):
+        targets = generator.integers(len(palette), size=guesses)
+        target_rows, target_cols = np.divmod(targets, geometry.cols)
+        rows = np.clip(np.rint(target_rows + generator.normal(0, sigma, guesses)), 0, last).astype(np.intp)
+        cols = np.clip(np.rint(target_cols + generator.normal(0, sigma, guesses)), 0, last).astype(np.intp)
+        distances = np.maximum(np.abs(target_rows - rows), np.abs(target_cols - cols))
+        delta_es = palette.delta_e.pairs(targets, rows * geometry.cols + cols) if method == "perceptual" else None
+        counts = np.bincount(points_for_many(method, geometry, distances, delta_es), minlength=EXACT_POINTS + 1)
+        results[attempt] = {points: int(n) for points, n in enumerate(counts) if n}
+    return results
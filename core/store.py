@@ -0,0 +1,526 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .eventlog import get_event_log
+from .metrics import STORE_OPERATIONS
+from .persistence import load_room
+from .room import RoomState
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------
+# Room storage backends.
+# Views never keep rooms around themselves: they read through
+# ``get`` and mutate inside ``update`` so the same code works
+# whether rooms live in this process or are shared between
+# several worker processes.
+# -------------------------------------------------------------
+
+
+class SessionStore:
+    """Interface implemented by every room storage backend."""
+
+    # Optional ``loader(code) -> RoomState | None`` used to rehydrate rooms
+    # that are missing from the store, e.g. after a restart.
+    loader = None
+
+    # Optional ``recorder(code, room)`` called after every saved change,
+    # still under the room's lock, with the events of the change in
+    # ``room.events`` (see core.eventlog).
+    recorder = None
+
+    def get(self, code):
+        """Return the room stored under ``code`` or None."""
+        raise NotImplementedError
+
+    def peek(self, code):
+        """Like ``get`` but without counting as an access or rehydrating."""
+        raise NotImplementedError
+
+    def snapshot(self, code):
+        """Copy of the room taken under its lock, or None.
+
+        Unlike ``peek``, safe to read on another thread while the room
+        keeps being updated, e.g. to write it to the database.
+        """
+        raise NotImplementedError
+
+    def add(self, code, room):
+        """Store a new room. Return False if ``code`` is already taken."""
+        raise NotImplementedError
+
+    @contextmanager
+    def read(self, code):
+        """Like ``get``, but the room cannot change while the block runs.
+
+        For reads that walk the room's indexes (occupancy, leaderboard),
+        which an update on another thread would otherwise tear. Keep the
+        block short: updates of the room wait for it.
+        """
+        raise NotImplementedError
+        yield
+
+    @contextmanager
+    def update(self, code):
+        """Yield the room for in-place changes, saved atomically on exit.
+
+        Yields None when the room does not exist. Only a block that
+        changed the room (see ``RoomState.edits``) and exited normally
+        is saved, recorded and bumps the room's version; if the block
+        raises, nothing is saved.
+        """
+        raise NotImplementedError
+        yield
+
+    def delete(self, code):
+        raise NotImplementedError
+
+    def codes(self):
+        """Return the codes of all stored rooms."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def evict(self, idle_before=None, max_rooms=None):
+        """Remove idle and least recently used rooms.
+
+        Rooms not accessed since the ``idle_before`` timestamp are removed,
+        then the least recently used ones until at most ``max_rooms`` are
+        left. Return the removed rooms as ``(code, room, reason)`` tuples,
+        with ``reason`` either "idle" or "lru".
+        """
+        raise NotImplementedError
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __len__(self):
+        return len(self.codes())
+
+    def _begin_recording(self, room):
+        if self.recorder is not None and room is not None:
+            room.events = []
+
+    def _record(self, code, room):
+        if self.recorder is None or room is None:
+            return
+        try:
+            self.recorder(code, room)
+        except Exception:
+            # The change itself is kept; it still reaches the database.
+            logger.exception("Could not record the changes of room %s", code)
+        finally:
+            room.events = None
+
+
+class InMemorySessionStore(SessionStore):
+    """Rooms kept in a process-local dict. Only valid for a single worker.
+
+    Each room has its own lock, so ``update`` serializes mutations of one
+    room while different rooms proceed in parallel. Rooms are kept in
+    least-recently-used order so eviction never scans fresh rooms.
+    """
+
+    def __init__(self):
+        self._rooms = OrderedDict()
+        self._locks = {}
+        # Guards the two dicts themselves, never held while a room is updated.
+        self._registry_lock = threading.Lock()
+
+    def _room_lock(self, code):
+        with self._registry_lock:
+            lock = self._locks.get(code)
+            if lock is None:
+                lock = self._locks[code] = threading.RLock()
+            return lock
+
+    def _touch(self, code, room):
+        room.last_active = time.time()
+        with self._registry_lock:
+            if code in self._rooms:
+                self._rooms.move_to_end(code)
+
+    def _load(self, code):
+        if self.loader is None:
+            return None
+        room = self.loader(code)
+        if room is None:
+            return None
+        with self._registry_lock:
+            # Another thread may have loaded it meanwhile; keep the first.
+            return self._rooms.setdefault(code, room)
+
+    def get(self, code):
+        room = self._rooms.get(code)
+        if room is None:
+            return self._load(code)
+        self._touch(code, room)
+        return room
+
+    def peek(self, code):
+        return self._rooms.get(code)
+
+    @contextmanager
+    def read(self, code):
+        room = self.get(code)
+        if room is None:
+            yield None
+            return
+        with self._room_lock(code):
+            yield room
+
+    def snapshot(self, code):
+        with self._room_lock(code):
+            room = self._rooms.get(code)
+            return RoomState.from_dict(room.to_dict()) if room is not None else None
+
+    def add(self, code, room):
+        with self._registry_lock:
+            if code in self._rooms:
+                return False
+            self._rooms[code] = room
+        self._record(code, room)
+        return True
+
+    @contextmanager
+    def update(self, code):
+        with self._room_lock(code):
+            room = self._rooms.get(code)
+            if room is not None:
+                self._touch(code, room)
+            else:
+                room = self._load(code)
+            if room is None:
+                yield None
+                return
+            self._begin_recording(room)
+            edits = room.edits
+            try:
+                yield room
+            except BaseException:
+                # Not counted as a change: the rules (core.engine) check
+                # everything before they change a room.
+                room.events = None
+                raise
+            if room.edits == edits:
+                room.events = None
+                return
+            room.mark_changed()
+            self._record(code, room)
+
+    def delete(self, code):
+        with self._room_lock(code):
+            with self._registry_lock:
+                self._rooms.pop(code, None)
+                self._locks.pop(code, None)
+
+    def codes(self):
+        with self._registry_lock:
+            return list(self._rooms)
+
+    def clear(self):
+        with self._registry_lock:
+            self._rooms.clear()
+            self._locks.clear()
+
+    def evict(self, idle_before=None, max_rooms=None):
+        with self._registry_lock:
+            candidates = []
+            overflow = len(self._rooms) - max_rooms if max_rooms is not None else 0
+            for code, room in self._rooms.items():
+                if idle_before is not None and room.last_active < idle_before:
+                    candidates.append((code, "idle"))
+                elif len(candidates) < overflow:
+                    candidates.append((code, "lru"))
+                else:
+                    break
+
+        evicted = []
+        for code, reason in candidates:
+            # Wait for any update in progress before dropping the room.
+            with self._room_lock(code):
+                with self._registry_lock:
+                    room = self._rooms.get(code)
+                    if room is None:
+                        continue
+                    if reason == "idle" and room.last_active >= idle_before:
+                        continue  # Touched while we were waiting.
+                    del self._rooms[code]
+                    self._locks.pop(code, None)
+            evicted.append((code, room, reason))
+        return evicted
+
+    def __contains__(self, code):
+        return code in self._rooms or self._load(code) is not None
+
+    def __len__(self):
+        return len(self._rooms)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Rooms serialized to a SQLite database in WAL mode.
+
+    Every worker process on the box opens the same file, so a phone can
+    hit any worker. ``update`` runs inside ``BEGIN IMMEDIATE`` which
+    makes the read-modify-write of a room atomic across processes.
+    SQLite has a single writer, so updates of different rooms are
+    serialized too; they are short enough that this is not a problem.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = str(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rooms ("
+                " code TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS rooms_updated_at ON rooms (updated_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly below.
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def peek(self, code):
+        row = self._connection().execute(
+            "SELECT data FROM rooms WHERE code = ?", (code,)
+        ).fetchone()
+        return RoomState.from_dict(json.loads(row[0])) if row else None
+
+    def snapshot(self, code):
+        # Every read deserializes a fresh copy.
+        return self.peek(code)
+
+    @contextmanager
+    def read(self, code):
+        yield self.get(code)
+
+    def get(self, code):
+        room = self.peek(code)
+        if room is None and self.loader is not None:
+            room = self.loader(code)
+            if room is not None and not self.add(code, room):
+                room = self.peek(code)
+        return room
+
+    def add(self, code, room):
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO rooms (code, data, updated_at) VALUES (?, ?, ?)",
+            (code, json.dumps(room.to_dict()), time.time()),
+        )
+        if cursor.rowcount != 1:
+            return False
+        self._record(code, room)
+        return True
+
+    @contextmanager
+    def update(self, code):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM rooms WHERE code = ?", (code,)).fetchone()
+            if row:
+                room = RoomState.from_dict(json.loads(row[0]))
+            else:
+                room = self.loader(code) if self.loader is not None else None
+                if room is not None:
+                    conn.execute(
+                        "INSERT INTO rooms (code, data, updated_at) VALUES (?, ?, ?)",
+                        (code, json.dumps(room.to_dict()), time.time()),
+                    )
+            self._begin_recording(room)
+            edits = room.edits if room is not None else None
+            yield room
+            if room is not None and room.edits == edits:
+                room.events = None
+            elif room is not None:
+                room.last_active = time.time()
+                room.mark_changed()
+                conn.execute(
+                    "UPDATE rooms SET data = ?, updated_at = ? WHERE code = ?",
+                    (json.dumps(room.to_dict()), time.time(), code),
+                )
+                self._record(code, room)  # Before COMMIT: still holding the write lock.
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def delete(self, code):
+        self._connection().execute("DELETE FROM rooms WHERE code = ?", (code,))
+
+    def codes(self):
+        return [row[0] for row in self._connection().execute("SELECT code FROM rooms")]
+
+    def clear(self):
+        self._connection().execute("DELETE FROM rooms")
+
+    def evict(self, idle_before=None, max_rooms=None):
+        # Reads do not write to the database, so a room's age here is the
+        # time since its last update rather than its last access.
+        conn = self._connection()
+        evicted = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if idle_before is not None:
+                rows = conn.execute(
+                    "DELETE FROM rooms WHERE updated_at < ? RETURNING code, data", (idle_before,)
+                ).fetchall()
+                evicted += [(code, data, "idle") for code, data in rows]
+            if max_rooms is not None:
+                rows = conn.execute(
+                    "DELETE FROM rooms WHERE code IN ("
+                    " SELECT code FROM rooms ORDER BY updated_at"
+                    " LIMIT max((SELECT COUNT(*) FROM rooms) - ?, 0))"
+                    " RETURNING code, data",
+                    (max_rooms,),
+                ).fetchall()
+                evicted += [(code, data, "lru") for code, data in rows]
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return [
+            (code, RoomState.from_dict(json.loads(data)), reason)
+            for code, data, reason in evicted
+        ]
+
+    def __contains__(self, code):
+        found = self._connection().execute(
+            "SELECT 1 FROM rooms WHERE code = ?", (code,)
+        ).fetchone() is not None
+        return found or self.get(code) is not None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM rooms").fetchone()[0]
+
+
+class TimedSessionStore(SessionStore):
+    """Wraps a backend and records how long each call takes (see core.metrics)."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def _timed(self, op, *args, **kwargs):
+        with STORE_OPERATIONS.time(op=op):
+            return getattr(self.backend, op)(*args, **kwargs)
+
+    def get(self, code):
+        return self._timed("get", code)
+
+    def peek(self, code):
+        return self._timed("peek", code)
+
+    def snapshot(self, code):
+        return self._timed("snapshot", code)
+
+    @contextmanager
+    def read(self, code):
+        start = time.perf_counter()
+        with self.backend.read(code) as room:
+            STORE_OPERATIONS.observe(time.perf_counter() - start, op="read")
+            yield room
+
+    def add(self, code, room):
+        return self._timed("add", code, room)
+
+    @contextmanager
+    def update(self, code):
+        start = time.perf_counter()
+        with self.backend.update(code) as room:
+            STORE_OPERATIONS.observe(time.perf_counter() - start, op="update")
+            yield room
+            start = time.perf_counter()
+        STORE_OPERATIONS.observe(time.perf_counter() - start, op="commit")
+
+    def delete(self, code):
+        return self._timed("delete", code)
+
+    def codes(self):
+        return self._timed("codes")
+
+    def clear(self):
+        return self._timed("clear")
+
+    def evict(self, idle_before=None, max_rooms=None):
+        return self._timed("evict", idle_before=idle_before, max_rooms=max_rooms)
+
+    def __contains__(self, code):
+        with STORE_OPERATIONS.time(op="contains"):
+            return code in self.backend
+
+    def __len__(self):
+        return len(self.backend)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Return the process-wide store configured by ``GAME_SESSION_STORE``."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = settings.GAME_SESSION_STORE
+                backend = import_string(config["BACKEND"])
+                store = backend(**config.get("OPTIONS", {}))
+                loaders = []
+                event_log = get_event_log()
+                if event_log is not None:
+                    store.recorder = event_log.record
+                    loaders.append(event_log.load)
+                if settings.GAME_PERSISTENCE.get("ENABLED"):
+                    loaders.append(load_room)
+                if loaders:
+                    store.loader = _first_found(loaders)
+                if settings.GAME_METRICS.get("ENABLED"):
+                    store = TimedSessionStore(store)
+                _store = store
+    return _store
+
+
+def _first_found(loaders):
+    """A loader trying ``loaders`` in order: the event log, then the database."""
+    if len(loaders) == 1:
+        return loaders[0]
+
+    def load(code):
+        for loader in loaders:
+            room = loader(code)
+            if room is not None:
+                return room
+        return None
+
+    return load
+
+
+@receiver(setting_changed)
+def _reset_session_store(setting, **kwargs):
+    global _store
+    if setting in ("GAME_SESSION_STORE", "GAME_PERSISTENCE", "GAME_METRICS", "GAME_EVENT_LOG"):
+        _store = None
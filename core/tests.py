@@ -1,3 +1,1274 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from . import engine, views
+from .boardgrid import grid_parts, render_grid
+from .codes import ALPHABET, BLOCK_SIZE, CODE_LENGTH, CodeAllocator, normalize_code
+from .eventlog import EventLog, get_event_log
+from .events import RoomEventBus
+from .geometry import get_geometry
+from .leaderboard import Leaderboard
+from .loadtest import run_loadtest
+from .metrics import REQUEST_LATENCY, log_sampled
+from .eviction import RoomEvictor
+from .models import CodeBlock, GameSession, PlayerMove
+from .persistence import room_writer
+from .room import REMEMBERED_REQUESTS, Move, Player, RoomState, Round
+from . import palettes
+from .palettes import CLASSIC_PALETTE, generate_gradient, get_palette
+from .simulator import sample_scores, simulate_games
+from .scoring import DeltaETable, delta_e_2000, delta_e_2000_matrix, hex_to_lab, np, score_guess, score_moves
+from .store import InMemorySessionStore, SQLiteSessionStore, get_session_store
+from .writebehind import get_write_behind
+
+# Tests flush explicitly: a background flusher would write to the test
+# database from another thread.
+MANUAL_FLUSH = {"ENABLED": True, "FLUSH_INTERVAL": None, "MAX_PENDING": None}
+
+
+def create_room(player_names=("Ana", "Bia")):
+    """Create a room through the views and return (code, host, players)."""
+    host = Client()
+    host.post(reverse("create_session"), {"mode": "local", "name": "TV"})
+    code = host.session["code"]
+
+    players = []
+    for name in player_names:
+        client = Client()
+        client.post(reverse("join_session", args=[code]), {"name": name})
+        players.append(client)
+    return code, host, players
+
+
+def play_round(code, players):
+    """Drive one full round: hints, then two guesses from every guesser."""
+    room = get_session_store().get(code)
+    current = room.current_round
+    by_id = {c.session["player_id"]: c for c in players}
+    explainer = by_id[current.explainer_id]
+    explainer.post(
+        reverse("submit_hint", args=[code]),
+        {"short_hint": "mar", "long_hint": "azul do oceano"},
+    )
+    for client in players:
+        if client is explainer:
+            continue
+        client.post(reverse("submit_move"), {"row": "A", "col": "1"})
+        client.post(reverse("submit_move"), {"row": "C", "col": "3"})
+    return explainer
+
+
+class RoomStateTests(TestCase):
+    def test_indexes_survive_serialization(self):
+        room = RoomState(mode="remote")
+        room.add_player(Player(id="h", name="TV", is_host=True))
+        room.add_player(Player(id="a", name="Ana"))
+        for number in (1, 2, 3):
+            room.add_round(Round(round_number=number, explainer_id="a"))
+
+        restored = RoomState.from_dict(json.loads(json.dumps(room.to_dict())))
+        self.assertEqual(restored.mode, "remote")
+        self.assertEqual(restored.get_player("a").name, "Ana")
+        self.assertEqual(restored.host.id, "h")
+        self.assertIs(restored.current_round, restored.get_round(3))
+        self.assertIsNone(restored.get_round(4))
+
+    def test_moves_are_stored_column_wise(self):
+        room = RoomState()
+        room.add_player(Player(id="e", name="Eva"))
+        room.add_player(Player(id="a", name="Ana"))
+        current = room.add_round(Round(round_number=1, explainer_id="e", target_row=2, target_col=3))
+        room.record_move("a", 1, 0, 4, distance=2, score=2, delta_e=12.34)
+        room.record_move("a", 2, 2, 3, distance=0, score=4, delta_e=0.0)
+
+        self.assertEqual(current.moves.row.tolist(), [0, 2])
+        self.assertEqual(current.moves[0], Move(1, 1, 0, 4, 2, 2, 12.34))
+        data = json.loads(json.dumps(room.to_dict()))
+        self.assertEqual(data["rounds"][0]["moves"]["score"], [2, 4])
+        restored = RoomState.from_dict(data)
+        self.assertEqual(list(restored.current_round.moves), list(current.moves))
+        self.assertEqual(restored.current_round.target, (2, 3))
+        self.assertEqual(restored.attempts_of("a"), 2)
+
+        # The occupancy index is kept up to date, and rebuilt on load.
+        room.record_move("e", 1, 2, 3, distance=0, score=4)
+        self.assertEqual(current.occupancy, {4: [1], 13: [1, 0]})
+        self.assertEqual(RoomState.from_dict(room.to_dict()).current_round.occupancy, current.occupancy)
+
+
+    def test_round_progress_is_tracked_incrementally(self):
+        room = RoomState()
+        room.add_player(Player(id="h", name="TV", is_host=True))
+        room.add_player(Player(id="e", name="Eva"))
+        room.add_player(Player(id="a", name="Ana"))
+        current = room.add_round(Round(round_number=1, explainer_id="e"))
+        self.assertEqual(current.pending, 1)
+
+        room.add_player(Player(id="b", name="Bia"))
+        for player_id in ("a", "a", "b"):
+            room.record_move(player_id, 1, 0, 0, distance=2, score=0)
+        self.assertEqual(room.attempts_of("a"), 2)
+        self.assertFalse(room.is_round_over())
+
+        room.record_move("b", 2, 0, 0, distance=2, score=0)
+        self.assertTrue(room.is_round_over())
+
+    def test_moves_of_the_host_and_the_explainer_do_not_close_the_round(self):
+        room = RoomState()
+        room.add_player(Player(id="h", name="TV", is_host=True))
+        room.add_player(Player(id="e", name="Eva"))
+        room.add_player(Player(id="c", name="Caio"))
+        current = room.add_round(Round(round_number=1, explainer_id="e"))
+        for player_id in ("h", "h", "e", "e"):
+            room.record_move(player_id, 1, 0, 0, distance=2, score=0)
+        self.assertEqual(current.pending, 1)
+        self.assertFalse(room.is_round_over())
+
+        room.record_move("c", 1, 0, 0, distance=2, score=0)
+        room.record_move("c", 2, 0, 0, distance=2, score=0)
+        self.assertTrue(room.is_round_over())
+
+    def test_rooms_saved_in_the_dict_layout_still_load(self):
+        data = {
+            "players": [{"id": "e", "name": "Eva"}, {"id": "a", "name": "Ana"}],
+            "rounds": [{
+                "round_number": 1,
+                "explainer_id": "e",
+                "target_position": {"row": 1, "col": 2},
+                "moves": [{"player_id": "a", "score": 1}, {"player_id": "a", "delta_e": 3.5}],
+            }],
+            "current_round": 1,
+        }
+        room = RoomState.from_dict(data)
+        self.assertEqual(room.current_round.target, (1, 2))
+        self.assertEqual([(m.score, m.delta_e) for m in room.current_round.moves], [(1, None), (0, 3.5)])
+        self.assertEqual(room.attempts_of("a"), 2)
+        self.assertTrue(room.is_round_over())
+
+        # The move saved without a delta E is scored when results are taken.
+        (_, missing, _), = score_moves(room.palette, (1, 2), [room.current_round.moves[0]])
+        results = {r.player_id: r for r in room.finalize_round()}
+        self.assertEqual(results["a"].closest_delta_e, min(missing, 3.5))
+        self.assertIsNone(results["e"].closest_delta_e)
+
+    def test_finalized_round_is_scored_once(self):
+        room = RoomState()
+        room.add_player(Player(id="h", name="TV", is_host=True))
+        for player_id, name in (("e", "Eva"), ("a", "Ana"), ("b", "Bia"), ("c", "Caio")):
+            room.add_player(Player(id=player_id, name=name))
+        room.award_points("e", 3)
+        room.add_round(Round(round_number=1, explainer_id="e"))
+        for player_id, score, delta_e in (("a", 2, 12.5), ("a", 1, 8.0), ("b", 3, 4.0), ("b", 0, 30.0),
+                                          ("c", 0, 40.0), ("c", 0, 35.0)):
+            room.record_move(player_id, 1, 0, 0, distance=0, score=score, delta_e=delta_e)
+        self.assertTrue(room.is_round_over())
+
+        results = room.finalize_round()
+        self.assertIs(room.finalize_round(), results)
+        self.assertEqual(room.get_player("a").points, 3)
+        self.assertEqual(
+            [(r.name, r.rank, r.round_score, r.closest_delta_e) for r in results],
+            [("Eva", 1, 0, None), ("Ana", 1, 3, 8.0), ("Bia", 1, 3, 4.0), ("Caio", 4, 0, 35.0)],
+        )
+
+        # A late joiner neither reopens nor changes a finalized round.
+        room.add_player(Player(id="d", name="Davi"))
+        self.assertTrue(room.is_round_over())
+        restored = RoomState.from_dict(json.loads(json.dumps(room.to_dict())))
+        self.assertTrue(restored.is_round_over())
+        self.assertEqual(restored.finalize_round(), results)
+        self.assertEqual(restored.get_player("b").points, 3)
+
+
+
+class GameEngineTests(TestCase):
+    def test_a_game_is_played_through_the_rules(self):
+        room = RoomState()
+        room.add_player(Player(id="h", name="TV", is_host=True))
+        for player_id in ("e", "a", "b"):
+            room.add_player(Player(id=player_id, name=player_id))
+        first = engine.start_game(room, 5, None, random.Random(1))
+        self.assertEqual(first.explainer_id, "e")
+        self.assertIsNone(engine.start_game(room, 5, None))
+
+        self.assertIsNone(engine.current_attempt(room, "a"))
+        with self.assertRaises(engine.RuleError):
+            engine.play_move(room, "a", 0, 0)
+        with self.assertRaises(engine.RuleError):
+            engine.check_hints("duas palavras", "ok")
+        with self.assertRaises(engine.RuleError):
+            engine.check_hints("x" * (engine.MAX_SHORT_HINT + 1), "ok")
+        self.assertEqual(engine.check_player(" Ana ", "mobile"), ("Ana", "mobile"))
+        for name, device in (("", "mobile"), ("x" * (engine.MAX_PLAYER_NAME + 1), "mobile"), ("Ana", "phone")):
+            with self.assertRaises(engine.RuleError):
+                engine.check_player(name, device)
+        room.set_hints(1, *engine.check_hints(" mar ", "azul do oceano"))
+        with self.assertRaises(engine.RuleError):
+            engine.round_results(room)
+
+        target_row, target_col = first.target
+        move = engine.play_move(room, "a", target_row, target_col)
+        self.assertEqual((move.attempt_number, move.score), (1, 4))
+        self.assertEqual(room.get_player("e").points, engine.explainer_bonus(4))
+        self.assertEqual(engine.current_attempt(room, "a"), 2)
+        for player_id in ("e", "h"):
+            with self.assertRaises(engine.RuleError):
+                engine.play_move(room, player_id, 0, 0)
+        for player_id in ("b", "a", "b"):
+            engine.play_move(room, player_id, target_row, target_col)
+        self.assertIsNotNone(first.results)
+        self.assertEqual(engine.round_results(room), first.results)
+
+        # Nobody guesses in a finalized round, not even a late joiner.
+        room.add_player(Player(id="c", name="c"))
+        self.assertIsNone(engine.current_attempt(room, "c"))
+        with self.assertRaises(engine.RuleError):
+            engine.play_move(room, "c", target_row, target_col)
+        self.assertEqual(first.pending, 0)
+        self.assertEqual(room.get_player("e").points, 4 * engine.explainer_bonus(4))
+
+        self.assertEqual(engine.next_round(room).explainer_id, "a")
+
+    def test_simulated_games_follow_the_scoring_table(self):
+        report = simulate_games(50, players=3, seed=7)
+        self.assertEqual(report["moves"], 50 * 3 * 2 * 2)
+        self.assertEqual(sum(sum(c.values()) for c in report["scores"].values()), report["moves"])
+        # Perfect guessers score the exact cell every time.
+        perfect = simulate_games(5, players=3, skill=(0, 0), seed=7)
+        self.assertEqual(perfect["scores"], {1: {4: 30}, 2: {4: 30}})
+        self.assertEqual(perfect["explainer_bonus_per_round"], 4 * engine.explainer_bonus(4))
+
+        sample = sample_scores(2000, method="perceptual", skill=(0, 0), seed=7)
+        self.assertEqual(sample, {1: {4: 2000}, 2: {4: 2000}})
+        spread = sample_scores(2000, seed=7)
+        self.assertEqual(sum(spread[1].values()), 2000)
+        self.assertGreater(spread[2].get(4, 0), spread[1].get(4, 0))
+
+
+class BoardGeometryTests(TestCase):
+    def test_classic_board_keeps_its_palette_and_scores(self):
+        geometry = get_geometry(5)
+        self.assertIs(geometry, get_geometry(5))
+        palette = get_palette(None, 5)
+        self.assertEqual(dict(palette.by_key), CLASSIC_PALETTE)
+        target = (2, 2)
+        scores = [score_guess(palette, target, 2, c)[2] for c in range(5)]
+        self.assertEqual(scores, [2, 3, 4, 3, 2])
+        self.assertEqual(score_guess(palette, target, 0, 4)[::2], (2, 2))
+        self.assertEqual(geometry.parse("c", "3"), (2, 2))
+        for bad in (("F", "1"), ("A", "6"), ("A", "x"), (None, "1")):
+            with self.assertRaises(ValueError):
+                geometry.parse(*bad)
+
+    def test_large_boards(self):
+        geometry = get_geometry(30, 16)
+        self.assertEqual(len(geometry), 480)
+        self.assertEqual(geometry.row_labels[-1], "AD")
+        self.assertEqual(geometry.parse("AD", "16"), (29, 15))
+        self.assertEqual(geometry.key(29, 15), "AD16")
+        self.assertEqual(len(geometry.score_table), 30)
+        self.assertEqual(geometry.score_table[0], 4)
+        self.assertEqual(geometry.score_table[-1], 0)
+        with self.assertRaises(ValueError):
+            get_geometry(31)
+
+    @override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+    def test_game_on_a_big_board(self):
+        get_session_store().clear()
+        code, host, players = create_room()
+        host.post(reverse("start_game"), {"grid_size": 12, "palette": "gradient-2"})
+        room = get_session_store().get(code)
+        self.assertEqual((room.grid_size, room.palette_seed), (12, 2))
+        self.assertIs(room.palette, get_palette(2, 12))
+        target_row, target_col = room.current_round.target
+        self.assertEqual(room.current_round.target_color, room.palette.color_at(target_row, target_col))
+
+        by_id = {c.session["player_id"]: c for c in players}
+        explainer = by_id[room.current_round.explainer_id]
+        explainer.post(reverse("submit_hint", args=[code]), {"short_hint": "a", "long_hint": "b"})
+        guesser = next(c for c in players if c is not explainer)
+        label = get_geometry(12).row_labels[target_row]
+        guesser.post(reverse("submit_move"), {"row": label, "col": target_col + 1})
+        move = room.current_round.moves[0]
+        self.assertEqual((move.distance, move.delta_e, move.score), (0, 0.0, 4))
+
+        response = host.get(reverse("board", args=[code]))
+        self.assertContains(response, ">L<", html=False)
+        initials = room.players[move.player].name[:2].upper()
+        self.assertContains(response, f'{room.current_round.target_color};">{initials}</div>', html=False)
+
+    def test_grid_markup_is_rendered_once_per_palette(self):
+        palette = get_palette(5, 30, 16)
+        parts = grid_parts(palette)
+        self.assertEqual(len(parts), len(palette) + 1)
+        self.assertIs(grid_parts(palette), parts)
+        html = render_grid(palette, {0: "<AN>", 479: "BI"})
+        self.assertIn('&lt;AN&gt;</div>', html)
+        self.assertIn(f'{palette.color_at(29, 15)};">BI</div>', html)
+        self.assertEqual(html.count("</div>"), "".join(parts).count("</div>"))
+
+
+class PerceptualScoringTests(TestCase):
+    def test_ciede2000_reference_pairs(self):
+        # Pairs 1, 7 and 17 of Sharma, Wu and Dalal (2005).
+        pairs = [
+            ((50.0, 2.6772, -79.7751), (50.0, 0.0, -82.7485), 2.0425),
+            ((50.0, 0.0, 0.0), (50.0, -1.0, 2.0), 2.3669),
+            ((50.0, 2.5, 0.0), (73.0, 25.0, -18.0), 27.1492),
+        ]
+        for lab1, lab2, expected in pairs:
+            self.assertAlmostEqual(delta_e_2000(lab1, lab2), expected, places=4)
+        white = hex_to_lab("#FFFFFF")
+        self.assertAlmostEqual(white[0], 100.0, places=2)
+
+    def test_table_lookups_match_direct_computation(self):
+        palette = get_palette(1, 6)
+        table = DeltaETable(palette.colors)
+        labs = [hex_to_lab(c) for c in palette.colors]
+        self.assertAlmostEqual(table.distance(3, 17), delta_e_2000(labs[3], labs[17]), places=3)
+        self.assertEqual(table.distance(5, 5), 0.0)
+        self.assertEqual(
+            [round(d, 3) for d in table.distances(3, [0, 17, 3])],
+            [round(table.distance(3, g), 3) for g in (0, 17, 3)],
+        )
+
+    def test_table_keeps_a_bounded_number_of_rows(self):
+        table = DeltaETable(get_palette(2, 30).colors, max_rows=4)
+        first = table.row(0)
+        self.assertIs(table.row(0), first)
+        for target in range(1, 10):
+            table.distance(target, 0)
+        self.assertEqual(len(table._rows), 4)
+        self.assertEqual(list(table.row(0)), list(first))
+
+    @skipUnless(np, "NumPy is not installed")
+    def test_numpy_matrix_matches_the_scalar_formula(self):
+        labs = [hex_to_lab(c) for c in CLASSIC_PALETTE.values()]
+        matrix = delta_e_2000_matrix(labs)
+        table = DeltaETable(CLASSIC_PALETTE.values())
+        for i in (0, 7, 24):
+            for j in (3, 12, 24):
+                self.assertAlmostEqual(float(matrix[i, j]), delta_e_2000(labs[i], labs[j]), places=3)
+                self.assertEqual(table.distance(i, j), float(matrix[i, j]))
+        self.assertEqual(table.pairs(np.array([0, 7]), np.array([3, 24])).tolist(),
+                         [matrix[0, 3], matrix[7, 24]])
+
+    def test_round_is_scored_in_one_batch(self):
+        palette = get_palette(3, 12)
+        target = (4, 4)
+        moves = [Move(0, 1, 4, 4, 0, 0, None), Move(0, 1, 5, 4, 0, 0, None), Move(0, 1, 11, 0, 0, 0, None)]
+        batch = score_moves(palette, target, moves, method="perceptual")
+        self.assertEqual(batch, [score_guess(palette, target, m.row, m.col, "perceptual") for m in moves])
+        self.assertEqual(batch[0], (0, 0.0, 4))
+        self.assertEqual(batch[1][2], 3)  # One shade darker: perceptually close.
+        self.assertEqual(batch[2][2], 0)
+
+
+class PaletteTests(TestCase):
+    def test_palettes_are_reproducible_and_shared(self):
+        palette = get_palette(42, 30, 16)
+        self.assertIs(palette, get_palette(42, 30, 16))
+        self.assertEqual(list(palette.colors), generate_gradient(42, 30, 16))
+        self.assertEqual((len(palette), palette.id), (480, "42-30x16"))
+        self.assertEqual(palette.by_key["AD16"], palette.color_at(29, 15))
+        self.assertNotEqual(palette.colors, get_palette(43, 30, 16).colors)
+        self.assertIs(get_palette(None, 5), get_palette(None, 5, 5))
+        self.assertEqual(get_palette(None, 12).seed, 0)  # The classic board is 5x5 only.
+        with self.assertRaises(TypeError):
+            palette.by_key["A1"] = "#000000"
+
+    def test_rooms_keep_their_palette_when_the_cache_turns_over(self):
+        room = RoomState()
+        room.start(12, 77)
+        palette, table, parts = room.palette, room.palette.delta_e, grid_parts(room.palette)
+        for seed in range(1000, 1000 + palettes.PALETTE_CACHE_SIZE + 1):
+            get_palette(seed, 12)
+        self.assertIsNot(get_palette(77, 12), palette)  # Evicted from the shared cache...
+        self.assertIs(room.palette, palette)  # ...but not from the room.
+        self.assertIs(room.palette.delta_e, table)
+        self.assertIs(grid_parts(room.palette), parts)
+
+    def test_room_presets(self):
+        self.assertEqual(palettes.seed_for("gradient-1"), 1)
+        self.assertIsNone(palettes.seed_for("classic"))
+        seed = palettes.seed_for(palettes.ROOM_PRESET, rng=random.Random(5))
+        self.assertEqual(seed, palettes.seed_for("unknown", rng=random.Random(5)))
+        self.assertTrue(1 <= seed <= palettes.MAX_SEED)
+
+    @skipUnless(np, "NumPy is not installed")
+    def test_numpy_generator_matches_pure_python(self):
+        for seed, rows, cols in ((1, 5, 5), (9, 30, 16), (123, 3, 30)):
+            params = palettes._gradient_params(seed)
+            vectorized = palettes._gradient_numpy(rows, cols, params)
+            reference = palettes._gradient_python(rows, cols, params)
+            for a, b in zip(vectorized, reference):
+                self.assertLessEqual(max(abs(x - y) for x, y in zip(a, b)), 1)
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class LeaderboardTests(TestCase):
+    def test_ranks_follow_every_score_change(self):
+        board = Leaderboard()
+        for index in range(5):
+            board.add(index)
+        board.mark()
+        board.set(3, 4)
+        board.set(1, 2)
+        board.set(4, 2)
+        self.assertEqual(board.top(), [(1, 3, 4), (2, 1, 2), (2, 4, 2), (4, 0, 0), (4, 2, 0)])
+        self.assertEqual(board.top(2), [(1, 3, 4), (2, 1, 2)])
+        self.assertEqual([board.rank(i) for i in range(5)], [4, 2, 4, 1, 2])
+        self.assertEqual(board.delta(3), 0)  # Everyone was tied first.
+        self.assertEqual(board.delta(0), -3)
+        board.add(5, 1)
+        self.assertIsNone(board.delta(5))
+        self.assertEqual(board.rank(0), 5)
+
+    def test_json_ranking_with_rank_changes(self):
+        get_session_store().clear()
+        code, host, players = create_room(("Ana", "Bia", "Caio"))
+        host.post(reverse("start_game"))
+        explainer = play_round(code, players)
+        room = get_session_store().get(code)
+        url = reverse("leaderboard", args=[code])
+
+        data = explainer.get(url, {"top": 2}).json()
+        self.assertEqual(data["players"], 3)
+        self.assertEqual([p["rank"] for p in data["top"]], [p.rank for p in room.current_round.results[:2]])
+        self.assertEqual(data["me"]["id"], room.current_round.explainer_id)
+        self.assertEqual(data["me"]["points"], room.get_player(data["me"]["id"]).points)
+        self.assertEqual(host.get(url).json()["me"], None)
+
+        # Unchanged room: the poll is answered from the ETag.
+        response = host.get(url, HTTP_IF_NONE_MATCH=host.get(url)["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH, GAME_LARGE_ROOMS={"PLAYERS": 3, "TOP_N": 2, "BOARD_REFRESH_MS": 1000})
+class LargeRoomTests(TestCase):
+    def test_audience_rooms_show_a_heatmap_and_the_top_players(self):
+        get_session_store().clear()
+        code, host, players = create_room(("Ana", "Bia", "Caio"))
+        host.post(reverse("start_game"))
+        explainer = play_round(code, players)
+        room = get_session_store().get(code)
+        heatmap = room.current_round.heatmap
+        self.assertEqual((heatmap.guesses, heatmap.score_sum), (4, sum(room.current_round.moves.score)))
+        # Everyone guessed A1, then C3.
+        self.assertEqual((heatmap.counts[0][0], heatmap.counts[1][12], sum(heatmap.totals())), (2, 2, 4))
+
+        response = host.get(reverse("board", args=[code]))
+        self.assertContains(response, "4 palpites")
+        self.assertContains(response, ">2</span>", count=2, html=False)
+        self.assertNotContains(response, ">AN<", html=False)
+        # The TV swaps in the live fragment, throttled, instead of reloading.
+        self.assertContains(response, "const refreshMs = 1000;")
+        live = host.get(reverse("board_live", args=[code]))
+        self.assertContains(live, "4 palpites")
+        self.assertNotContains(live, "<html")
+        self.assertEqual(host.get(reverse("board_live", args=[code]), HTTP_IF_NONE_MATCH=live["ETag"]).status_code, 304)
+
+        response = explainer.get(reverse("rounds_results", args=[code]))
+        self.assertEqual(len(response.context["players_data"]), 2)
+        scoreboard = host.get(reverse("scoreboard_partial", args=[code]))
+        self.assertEqual(len(scoreboard.context["leaderboard"]), 2)
+        self.assertContains(scoreboard, "1º")
+
+        # Only the current round keeps its heatmap, and it survives a reload.
+        explainer.post(reverse("next_round"))
+        room = get_session_store().get(code)
+        self.assertIsNone(room.get_round(1).heatmap)
+        restored = RoomState.from_dict(room.to_dict())
+        self.assertEqual(restored.current_round.heatmap.guesses, 0)
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class RoomCodeTests(TestCase):
+    def test_workers_never_hand_out_the_same_code(self):
+        # Two processes sharing the database: blocks keep their counters apart.
+        worker_a, worker_b = CodeAllocator(b"key"), CodeAllocator(b"key")
+        codes = [worker.allocate() for _ in range(BLOCK_SIZE + 10) for worker in (worker_a, worker_b)]
+        self.assertEqual(len(set(codes)), len(codes))
+        self.assertTrue(all(normalize_code(code) == code for code in codes))
+        self.assertEqual(CodeBlock.objects.count(), 4)
+
+        permutation = CodeAllocator(b"other key").permute
+        self.assertEqual(len({permutation(n) for n in range(5000)}), 5000)
+
+    def test_typed_codes_are_normalized_and_checked(self):
+        code = CodeAllocator(b"key").encode(123456789)
+        typed = code.lower().replace("0", "o").replace("1", "l")
+        self.assertEqual(normalize_code(f" {typed[:3]}-{typed[3:]} "), code)
+        # Any single wrong character is caught by the check character.
+        for i in range(CODE_LENGTH):
+            for char in ALPHABET:
+                if char != code[i]:
+                    self.assertIsNone(normalize_code(code[:i] + char + code[i + 1:]))
+        self.assertIsNone(normalize_code(code[:-1]))
+        self.assertIsNone(normalize_code("ABCU12Z"))
+
+    def test_join_accepts_the_code_as_typed(self):
+        get_session_store().clear()
+        code, host, players = create_room(())
+        url = reverse("join_session", args=[code.lower()])
+        self.assertRedirects(Client().get(url), reverse("join_session", args=[code]),
+                             fetch_redirect_response=False)
+        bad = code[:-1] + next(c for c in ALPHABET if c != code[-1])
+        with mock.patch("core.views.get_session_store") as store:
+            response = Client().post(reverse("join_session", args=[bad]), {"name": "Ana"})
+        self.assertEqual(response.status_code, 404)
+        store.assert_not_called()
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class RetriedRequestTests(TestCase):
+    def test_retried_joins_and_returning_devices_keep_one_player(self):
+        get_session_store().clear()
+        code, host, players = create_room(())
+        url = reverse("join_session", args=[code])
+        phone = Client()
+        phone.post(url, {"name": "Ana", "idempotency_key": "k1"})
+        phone.post(url, {"name": "Ana", "idempotency_key": "k1"})
+        # The answer (and its cookies) got lost: the retry still finds the player.
+        Client().post(url, {"name": "Ana", "idempotency_key": "k1"})
+        room = get_session_store().get(code)
+        self.assertEqual(len(room.players), 2)
+        player = room.players[1]
+
+        # A browser that lost its session gets its player back from the join link.
+        returning = Client()
+        returning.cookies[views.DEVICE_COOKIE] = phone.cookies[views.DEVICE_COOKIE].value
+        self.assertRedirects(returning.get(url), reverse("lobby"), fetch_redirect_response=False)
+        self.assertEqual(returning.session["player_id"], player.id)
+        self.assertEqual(len(get_session_store().get(code).players), 2)
+
+    def test_devices_reconnect_to_rooms_reloaded_from_the_database(self):
+        get_session_store().clear()
+        code, host, players = create_room(())
+        url = reverse("join_session", args=[code])
+        phone = Client()
+        phone.post(url, {"name": "Ana", "idempotency_key": "k1"})
+        player_id = phone.session["player_id"]
+        get_write_behind().flush()
+
+        get_session_store().clear()
+        room_writer.forget([code])
+
+        returning = Client()
+        returning.cookies[views.DEVICE_COOKIE] = phone.cookies[views.DEVICE_COOKIE].value
+        self.assertRedirects(returning.get(url), reverse("lobby"), fetch_redirect_response=False)
+        self.assertEqual(returning.session["player_id"], player_id)
+        Client().post(url, {"name": "Ana", "idempotency_key": "k1"})
+        self.assertEqual([p.id for p in get_session_store().get(code).players[1:]], [player_id])
+
+    def test_retried_guesses_are_counted_once(self):
+        get_session_store().clear()
+        code, host, players = create_room(("Ana", "Bia"))
+        host.post(reverse("start_game"))
+        room = get_session_store().get(code)
+        by_id = {c.session["player_id"]: c for c in players}
+        explainer = by_id[room.current_round.explainer_id]
+        guesser = next(c for c in players if c is not explainer)
+        hints = {"short_hint": "mar", "long_hint": "azul do oceano", "idempotency_key": "h1"}
+        explainer.post(reverse("submit_hint", args=[code]), hints)
+        explainer.post(reverse("submit_hint", args=[code]), hints)
+
+        version = get_session_store().get(code).version
+        for _ in range(3):
+            response = guesser.post(reverse("submit_move"), {"row": "A", "col": "1", "idempotency_key": "m1"})
+            self.assertRedirects(response, reverse("waiting_hint"), fetch_redirect_response=False)
+        room = get_session_store().get(code)
+        self.assertEqual(room.attempts_of(guesser.session["player_id"]), 1)
+        # Retries were answered from the cache, without another update.
+        self.assertEqual(room.version, version + 1)
+
+    def test_remembered_requests_are_bounded_and_persisted(self):
+        room = RoomState()
+        room.add_player(Player(id="a", name="Ana", token="t"))
+        for i in range(REMEMBERED_REQUESTS + 10):
+            room.remember_request(f"k{i}", "a")
+        self.assertEqual(len(room.requests), REMEMBERED_REQUESTS)
+        self.assertIsNone(room.seen_request("k0"))
+        restored = RoomState.from_dict(json.loads(json.dumps(room.to_dict())))
+        self.assertEqual(restored.seen_request(f"k{REMEMBERED_REQUESTS}"), "a")
+        self.assertEqual(restored.player_for_token("t").id, "a")
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = Path(self.tmpdir.name) / "rooms.sqlite3"
+
+    def test_sqlite_rooms_are_shared_between_store_instances(self):
+        worker_a = SQLiteSessionStore(self.path)
+        worker_b = SQLiteSessionStore(self.path)
+
+        self.assertTrue(worker_a.add("ABC123", RoomState()))
+        self.assertFalse(worker_b.add("ABC123", RoomState()))
+
+        with worker_b.update("ABC123") as room:
+            room.add_player(Player(id="p1", name="Ana"))
+        self.assertEqual(worker_a.get("ABC123").get_player("p1"), Player(id="p1", name="Ana"))
+
+    def test_sqlite_update_is_discarded_on_error(self):
+        store = SQLiteSessionStore(self.path)
+        store.add("ABC123", RoomState())
+        with self.assertRaises(RuntimeError):
+            with store.update("ABC123") as room:
+                room.status = "in_game"
+                raise RuntimeError
+        self.assertEqual(store.get("ABC123").status, "lobby")
+
+    def test_full_round_through_the_sqlite_store(self):
+        backend = {
+            "BACKEND": "core.store.SQLiteSessionStore",
+            "OPTIONS": {"path": self.path},
+        }
+        with override_settings(GAME_SESSION_STORE=backend):
+            code, host, players = create_room()
+            host.post(reverse("start_game"))
+            explainer = play_round(code, players)
+
+            response = explainer.get(reverse("rounds_results", args=[code]))
+            self.assertEqual(response.status_code, 200)
+            room = SQLiteSessionStore(self.path).get(code)
+            self.assertTrue(room.current_round.scored)
+            self.assertEqual(len(room.current_round.moves), 2)
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class RoomEvictionTests(TestCase):
+    def setUp(self):
+        get_session_store().clear()
+
+    def test_idle_rooms_are_archived_and_dropped(self):
+        with mock.patch("core.store.time.time", return_value=time.time() - 120):
+            code, host, players = create_room()
+            host.post(reverse("start_game"))
+            play_round(code, players)
+        fresh_code, _, _ = create_room()
+
+        evictor = RoomEvictor(idle_ttl=60)
+        evicted = evictor.sweep()
+
+        self.assertEqual([c for c, _, _ in evicted], [code])
+        self.assertNotIn(code, get_session_store())
+        self.assertIn(fresh_code, get_session_store())
+        game = GameSession.objects.get(code=code)
+        self.assertFalse(game.is_active)
+        self.assertEqual(game.players.count(), 3)
+        self.assertEqual(game.rounds.count(), 1)
+        self.assertEqual(PlayerMove.objects.filter(round__session=game).count(), 2)
+        self.assertEqual(evictor.counters["idle"], 1)
+        self.assertEqual(evictor.counters["archived"], 1)
+
+    def test_least_recently_used_rooms_go_first_over_the_cap(self):
+        store = InMemorySessionStore()
+        for code in ("ROOM01", "ROOM02", "ROOM03"):
+            store.add(code, RoomState())
+        store.get("ROOM01")
+
+        evicted = store.evict(max_rooms=2)
+        self.assertEqual([(c, reason) for c, _, reason in evicted], [("ROOM02", "lru")])
+        self.assertEqual(store.codes(), ["ROOM03", "ROOM01"])
+
+    def test_sqlite_store_evicts_rooms_not_updated_recently(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = SQLiteSessionStore(Path(tmpdir) / "rooms.sqlite3")
+            store.add("OLD001", RoomState())
+            cutoff = time.time() + 1
+            evicted = store.evict(idle_before=cutoff)
+            self.assertEqual([(c, reason) for c, _, reason in evicted], [("OLD001", "idle")])
+            self.assertEqual(len(store), 0)
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class EventLogTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.config = {"ENABLED": True, "PATH": self.tmpdir.name, "SNAPSHOT_EVERY": 5}
+
+    def state(self, room):
+        data = json.loads(json.dumps(room.to_dict()))
+        del data["last_active"]
+        return data
+
+    def test_rooms_are_rebuilt_from_snapshot_and_tail(self):
+        with override_settings(GAME_EVENT_LOG=self.config):
+            code, host, players = create_room()
+            host.post(reverse("start_game"), {"palette": "gradient-1"})
+            explainer = play_round(code, players)
+            explainer.post(reverse("next_round"))
+            room = get_session_store().get(code)
+
+            kinds = [kind for _, _, events in get_event_log().history(code) for kind, _ in events]
+            self.assertEqual(kinds[:4], ["join", "join", "start", "round"])
+            self.assertEqual(kinds.count("move"), 2)
+            self.assertEqual(kinds[-2:], ["finalize", "round"])
+
+            # A fresh process: nothing in memory, no database row.
+            get_session_store().clear()
+            with mock.patch("core.store.load_room", return_value=None):
+                restored = get_session_store().get(code)
+            self.assertEqual(self.state(restored), self.state(room))
+            self.assertLess(get_event_log()._since_snapshot[code], 5)
+            self.assertEqual(host.get(reverse("board", args=[code])).status_code, 200)
+
+    def test_long_games_replay_only_the_tail(self):
+        log = EventLog(self.tmpdir.name, snapshot_every=200)
+        store = InMemorySessionStore()
+        store.recorder = log.record
+        room = RoomState()
+        room.add_player(Player(id="e", name="Eva"))
+        store.add("LONG01", room)
+        for number in range(1, 301):
+            with store.update("LONG01") as room:
+                room.add_round(Round(round_number=number, explainer_id="e"))
+                room.add_player(Player(id=f"p{number}", name="P"))
+                for attempt in range(1, 11):
+                    room.record_move(f"p{number}", attempt, 0, 0, distance=2, score=1, delta_e=5.0)
+
+        restored = log.load("LONG01")
+        self.assertEqual(self.state(restored), self.state(room))
+        self.assertLess(log._since_snapshot["LONG01"], 200)
+
+    def test_a_truncated_last_line_is_ignored(self):
+        log = EventLog(self.tmpdir.name)
+        store = InMemorySessionStore()
+        store.recorder = log.record
+        store.add("CRASH1", RoomState())
+        with store.update("CRASH1") as room:
+            room.add_player(Player(id="a", name="Ana"))
+        with open(Path(self.tmpdir.name) / "CRASH1.log", "ab") as fh:
+            fh.write(b'[3,1.0,[["join",{"player":{"id":"b"')
+        restored = EventLog(self.tmpdir.name).load("CRASH1")
+        self.assertEqual([p.id for p in restored.players], ["a"])
+        self.assertEqual(restored.version, room.version)
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        get_session_store().clear()
+
+    def test_flush_writes_changed_rooms_only(self):
+        code, host, players = create_room()
+        host.post(reverse("start_game"))
+        play_round(code, players)
+
+        write_behind = get_write_behind()
+        self.assertEqual(write_behind.flush(), 1)
+        game = GameSession.objects.get(code=code, is_active=True)
+        self.assertEqual(game.status, "in_game")
+        self.assertEqual(game.players.count(), 3)
+        self.assertEqual(game.rounds.count(), 1)
+        self.assertEqual(PlayerMove.objects.filter(round__session=game).count(), 2)
+
+        # Nothing left to write, and a room without changes costs no query.
+        self.assertEqual(write_behind.flush(), 0)
+        write_behind.mark_dirty(code)
+        with self.assertNumQueries(2):  # Savepoint and release only.
+            write_behind.flush()
+
+        players[0].get(reverse("rounds_results", args=[code]))
+        write_behind.flush()
+        self.assertTrue(game.rounds.get().scored)
+        room = get_session_store().get(code)
+        self.assertEqual(
+            {p.public_id: p.score for p in game.players.filter(is_host=False)},
+            {p.id: p.points for p in room.players[1:]},
+        )
+
+    def test_players_the_database_cannot_hold_are_refused_at_submission(self):
+        code, host, players = create_room(("Ana",))
+        url = reverse("join_session", args=[code])
+        long_name = "x" * (engine.MAX_PLAYER_NAME + 1)
+        self.assertEqual(Client().post(url, {"name": long_name}).status_code, 400)
+        self.assertEqual(Client().post(url, {"name": "Bia", "device": "smartwatch"}).status_code, 400)
+        self.assertEqual(Client().post(reverse("create_session"), {"name": long_name}).status_code, 400)
+        self.assertEqual(Client().post(reverse("create_session"), {"mode": "online"}).status_code, 400)
+        self.assertEqual(len(get_session_store().get(code).players), 2)
+
+        Client().post(url, {"name": "  " + "y" * engine.MAX_PLAYER_NAME + "  ", "device": "desktop"})
+        get_write_behind().flush()
+        game = GameSession.objects.get(code=code)
+        self.assertEqual(game.players.get(device_type="desktop").name, "y" * engine.MAX_PLAYER_NAME)
+
+    def test_rooms_are_written_from_a_snapshot_and_flushed_on_stop(self):
+        code, host, players = create_room()
+        queue = get_write_behind()
+        live = get_session_store().peek(code)
+        with mock.patch.object(queue.writer, "write") as write:
+            queue.flush()
+        ((written_code, written),) = write.call_args[0][0]
+        self.assertEqual(written_code, code)
+        self.assertIsNot(written, live)
+        self.assertEqual(written.to_dict(), live.to_dict())
+
+        Client().post(reverse("join_session", args=[code]), {"name": "Caio"})
+        queue.stop()
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(GameSession.objects.get(code=code).players.count(), 4)
+
+    def test_results_of_a_reloaded_room_are_finalized_once(self):
+        code, host, players = create_room()
+        host.post(reverse("start_game"))
+        explainer = play_round(code, players)
+        get_write_behind().flush()
+        get_session_store().clear()
+        room_writer.forget([code])
+
+        # Reloaded from the database: the round is scored but has no snapshot yet.
+        reloaded = get_session_store().get(code)
+        self.assertIsNone(reloaded.current_round.results)
+        points = [p.points for p in reloaded.players]
+        response = explainer.get(reverse("rounds_results", args=[code]))
+        self.assertEqual(response.status_code, 200)
+        room = get_session_store().get(code)
+        self.assertIsNotNone(room.current_round.results)
+        self.assertEqual([p.points for p in room.players], points)
+
+        # Evicted between the read and the update: a 404, not a crash.
+        get_session_store().clear()
+        room_writer.forget([code])
+        get_session_store().get(code)
+        with mock.patch.object(get_session_store(), "update") as update:
+            update.return_value.__enter__.return_value = None
+            response = explainer.get(reverse("rounds_results", args=[code]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_rooms_are_reloaded_after_a_restart(self):
+        code, host, players = create_room()
+        host.post(reverse("start_game"))
+        explainer = play_round(code, players)
+        get_write_behind().flush()
+
+        get_session_store().clear()
+        room_writer.forget([code])
+
+        response = explainer.get(reverse("rounds_results", args=[code]))
+        self.assertEqual(response.status_code, 200)
+        room = get_session_store().get(code)
+        self.assertEqual([p.name for p in room.players], ["TV", "Ana", "Bia"])
+        self.assertTrue(room.is_round_over())
+        guesser = next(p for p in room.players[1:] if p.id != room.current_round.explainer_id)
+        self.assertEqual(room.attempts_of(guesser.id), 2)
+
+        explainer.post(reverse("next_round"))
+        get_write_behind().flush()
+        self.assertEqual(GameSession.objects.get(code=code).players.count(), 3)
+        self.assertEqual(GameSession.objects.get(code=code).rounds.count(), 2)
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class LoadTestTests(TestCase):
+    def setUp(self):
+        get_session_store().clear()
+
+    def test_full_rooms_run_without_errors(self):
+        result = run_loadtest(rooms=2, players=3, rounds=2, concurrency=2)
+        self.assertEqual(result["failed_rooms"], [])
+        self.assertEqual(result["total"]["errors"], 0)
+        endpoints = result["endpoints"]
+        self.assertEqual(endpoints["create_session"]["requests"], 2)
+        self.assertEqual(endpoints["next_round"]["requests"], 2)
+        # Two moves from each of the 2 guessers, per round and room.
+        self.assertGreaterEqual(endpoints["submit_move"]["requests"], 2 * 2 * 2 * 2)
+        self.assertGreater(endpoints["player_redirect_status"]["requests"], 50)
+        self.assertGreater(endpoints["board_live"]["requests"], 0)
+        json.dumps(result)
+
+    def test_guesser_done_with_the_round_stays_on_the_waiting_page(self):
+        code, host, players = create_room(("Ana", "Bia", "Caio"))
+        host.post(reverse("start_game"))
+        room = get_session_store().get(code)
+        by_id = {c.session["player_id"]: c for c in players}
+        explainer = by_id[room.current_round.explainer_id]
+        explainer.post(
+            reverse("submit_hint", args=[code]),
+            {"short_hint": "mar", "long_hint": "azul do oceano"},
+        )
+        guesser = next(c for c in players if c is not explainer)
+        guesser.post(reverse("submit_move"), {"row": "A", "col": "1"})
+        guesser.post(reverse("submit_move"), {"row": "B", "col": "2"})
+
+        response = guesser.get(reverse("waiting_hint"))
+        self.assertEqual(response.status_code, 200)
+        status = guesser.get(reverse("player_redirect_status", args=[code])).json()
+        self.assertEqual(status["redirect_url"], reverse("waiting_hint"))
+
+    def test_the_host_is_never_sent_to_guess(self):
+        code, host, players = create_room(("Ana", "Bia"))
+        host.post(reverse("start_game"))
+        explainer = get_session_store().get(code).current_round.explainer_id
+        by_id = {c.session["player_id"]: c for c in players}
+        by_id[explainer].post(
+            reverse("submit_hint", args=[code]),
+            {"short_hint": "mar", "long_hint": "azul do oceano"},
+        )
+
+        self.assertRedirects(host.post(reverse("start_game")), reverse("board", args=[code]),
+                             fetch_redirect_response=False)
+        self.assertEqual(host.get(reverse("waiting_hint")).status_code, 200)
+        for _ in range(2):
+            host.post(reverse("submit_move"), {"row": "A", "col": "1"})
+        room = get_session_store().get(code)
+        self.assertEqual(len(room.current_round.moves), 0)
+        self.assertFalse(room.is_round_over())
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class MetricsTests(TestCase):
+    def setUp(self):
+        get_session_store().clear()
+
+    def test_metrics_endpoint_reports_routes_templates_and_rooms(self):
+        before = REQUEST_LATENCY.count(route="scoreboard_partial")
+        code, host, players = create_room()
+        host.get(reverse("scoreboard_partial", args=[code]))
+        self.assertEqual(REQUEST_LATENCY.count(route="scoreboard_partial"), before + 1)
+
+        body = Client(REMOTE_ADDR="127.0.0.1").get(reverse("metrics")).content.decode()
+        self.assertIn('colorgrid_requests_total{route="join_session",method="POST",status="302"}', body)
+        self.assertIn('colorgrid_request_duration_seconds_bucket{route="scoreboard_partial",le="+Inf"}', body)
+        self.assertIn('colorgrid_template_render_seconds_count{template="core/lobby.html"}', body)
+        self.assertIn('colorgrid_store_operation_seconds_count{op="update"}', body)
+        self.assertIn("colorgrid_rooms 1\n", body)
+        self.assertIn("colorgrid_players_online 3\n", body)
+
+    def test_metrics_are_only_served_to_allowed_addresses(self):
+        response = Client(REMOTE_ADDR="10.0.0.7").get(reverse("metrics"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_debug_logging_is_sampled(self):
+        logger = logging.getLogger("core.test")
+        logger.setLevel(logging.DEBUG)
+        with self.assertNoLogs(logger):
+            log_sampled(logger, logging.DEBUG, 0.0, "poll", code="ABC123")
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            log_sampled(logger, logging.DEBUG, 1.0, "poll", code="ABC123")
+        self.assertEqual(logs.records[0].getMessage(), "poll code=ABC123")
+        self.assertEqual(logs.records[0].fields, {"code": "ABC123"})
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class ConcurrentMoveTests(TestCase):
+    def setUp(self):
+        get_session_store().clear()
+        self.factory = RequestFactory()
+        # Switch threads mid-request to surface races.
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-4)
+
+    def make_room(self, code, guessers):
+        players = [{"id": "host", "name": "TV", "device": "tv", "is_host": True}]
+        players.append({"id": "explainer", "name": "Eva", "device": "mobile", "is_host": False})
+        players += [
+            {"id": f"p{i}", "name": f"P{i}", "device": "mobile", "is_host": False}
+            for i in range(guessers)
+        ]
+        get_session_store().add(code, RoomState.from_dict({
+            "mode": "local",
+            "players": players,
+            "rounds": [{
+                "round_number": 1,
+                "explainer_id": "explainer",
+                "target_color": CLASSIC_PALETTE["C3"],
+                "target_position": {"row": 2, "col": 2},
+                "short_hint": "mar",
+                "long_hint": "azul do oceano",
+                "moves": [],
+            }],
+            "status": "in_game",
+            "grid_size": 5,
+            "current_round": 1,
+        }))
+
+    def tap(self, code, player_id, row, col):
+        request = self.factory.post("/", {"row": row, "col": col})
+        request.session = {"code": code, "player_id": player_id}
+        return views.submit_move_view(request)
+
+    def test_hammering_submit_move_keeps_score_invariants(self):
+        guessers = 8
+        codes = ["ROOM01", "ROOM02", "ROOM03"]
+        for code in codes:
+            self.make_room(code, guessers)
+
+        # Four concurrent taps per player and room, each retried a few times.
+        jobs = [(code, f"p{i}") for code in codes for i in range(guessers) for _ in range(4)]
+        barrier = threading.Barrier(len(jobs))
+        errors = []
+
+        def hammer(code, player_id):
+            rng = random.Random(f"{code}{player_id}")
+            barrier.wait()
+            try:
+                for _ in range(3):
+                    self.tap(code, player_id, rng.choice("ABCDE"), rng.randint(1, 5))
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=hammer, args=job) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        for code in codes:
+            room = get_session_store().get(code)
+            current = room.current_round
+            for i in range(guessers):
+                index = room.get_player(f"p{i}").index
+                attempts = sorted(m.attempt_number for m in current.moves if m.player == index)
+                self.assertEqual(attempts, [1, 2])
+            explainer = room.get_player("explainer")
+            expected_bonus = sum(max(m.score - 1, 0) for m in current.moves)
+            self.assertEqual(explainer.points, expected_bonus)
+            self.assertTrue(views.is_round_over(room, current))
+
+            # Finalized by the last move: points awarded once, results served read-only.
+            self.assertTrue(current.scored)
+            for i in range(guessers):
+                player = room.get_player(f"p{i}")
+                scores = [m.score for m in current.moves if m.player == player.index]
+                self.assertEqual(player.points, sum(scores))
+            version = room.version
+            request = self.factory.get("/")
+            request.session = {"code": code, "player_id": "p0"}
+            for _ in range(3):
+                self.assertEqual(views.rounds_results_view(request, code).status_code, 200)
+            self.assertEqual(room.version, version)
+
+    def test_reads_hold_off_updates_of_the_room(self):
+        store = InMemorySessionStore()
+        store.add("ROOM01", RoomState())
+
+        def join():
+            with store.update("ROOM01") as room:
+                room.add_player(Player(id="a", name="Ana"))
+
+        with store.read("ROOM01") as room:
+            writer = threading.Thread(target=join)
+            writer.start()
+            writer.join(0.2)
+            # The leaderboard and occupancy index cannot change under the reader.
+            self.assertTrue(writer.is_alive())
+            self.assertEqual(len(room.leaderboard), 0)
+        writer.join(5)
+        self.assertEqual(len(store.get("ROOM01").leaderboard), 1)
+
+    def test_board_grid_is_rendered_outside_the_room_lock(self):
+        code, host, players = create_room(("Ana", "Bia"))
+        host.post(reverse("start_game"))
+        store = get_session_store()
+        locked = []
+
+        def probe():
+            lock = store._room_lock(code)
+            acquired = lock.acquire(blocking=False)
+            if acquired:
+                lock.release()
+            locked.append(not acquired)
+
+        def render_grid(palette, overlay=None):
+            prober = threading.Thread(target=probe)
+            prober.start()
+            prober.join()
+            return ""
+
+        with mock.patch.object(views, "render_grid", render_grid):
+            self.assertEqual(host.get(reverse("board_live", args=[code])).status_code, 200)
+        self.assertEqual(locked, [False])
+
+    def test_rooms_are_locked_independently(self):
+        store = InMemorySessionStore()
+        store.add("ROOM01", RoomState())
+        store.add("ROOM02", RoomState())
+        holding = threading.Event()
+        release = threading.Event()
+
+        def hold_first_room():
+            with store.update("ROOM01"):
+                holding.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold_first_room)
+        holder.start()
+        holding.wait(5)
+
+        def touch_second_room():
+            with store.update("ROOM02"):
+                pass
+
+        other = threading.Thread(target=touch_second_room)
+        other.start()
+        other.join(1)
+        self.assertFalse(other.is_alive())
+
+        release.set()
+        holder.join()
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class ConditionalPollingTests(TestCase):
+    def setUp(self):
+        get_session_store().clear()
+
+    def test_unchanged_room_answers_304_without_rendering(self):
+        code, host, players = create_room()
+        url = reverse("scoreboard_partial", args=[code])
+        response = host.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        etag = response["ETag"]
+
+        response = host.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertTemplateNotUsed(response, "core/partials/scoreboard.html")
+
+        Client().post(reverse("join_session", args=[code]), {"name": "Caio"})
+        response = host.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Caio")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_every_update_bumps_the_version(self):
+        code, host, players = create_room()
+        version = get_session_store().get(code).version
+        host.post(reverse("start_game"))
+        self.assertEqual(get_session_store().get(code).version, version + 1)
+
+        status_url = reverse("player_redirect_status", args=[code])
+        response = players[0].get(status_url)
+        self.assertEqual(
+            players[0].get(status_url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304
+        )
+
+    def test_requests_that_change_nothing_keep_the_version(self):
+        code, host, players = create_room()
+        host.post(reverse("start_game"))
+        store = get_session_store()
+        version = store.get(code).version
+        guesser = next(c for c in players if c.session["player_id"] != store.get(code).current_round.explainer_id)
+        with mock.patch("core.views.room_events.publish") as publish:
+            host.post(reverse("start_game"))  # Already started.
+            self.assertEqual(guesser.post(reverse("next_round")).status_code, 403)
+            guesser.post(reverse("submit_move"), {"row": "A", "col": "1"})  # No hint yet.
+        publish.assert_not_called()
+        self.assertEqual(store.get(code).version, version)
+
+        with self.assertRaises(RuntimeError):
+            with store.update(code):
+                raise RuntimeError
+        self.assertEqual(store.get(code).version, version)
+
+
+@override_settings(GAME_PERSISTENCE=MANUAL_FLUSH)
+class RoomEventsTests(TestCase):
+    def setUp(self):
+        get_session_store().clear()
+
+    def test_publish_wakes_subscribers_of_the_room_only(self):
+        bus = RoomEventBus()
+
+        async def scenario():
+            watched = bus.subscribe("ROOM1")
+            other = bus.subscribe("ROOM2")
+            bus.publish("ROOM1")
+            self.assertTrue(await watched.wait(1))
+            self.assertFalse(await other.wait(0.01))
+            bus.unsubscribe(watched)
+            bus.unsubscribe(other)
+            self.assertEqual(bus.subscriber_count(), 0)
+
+        asyncio.run(scenario())
+
+    def test_stream_is_declined_under_wsgi(self):
+        code, host, _ = create_room()
+        response = host.get(reverse("room_events", args=[code]))
+        self.assertEqual(response.status_code, 204)
+
+    def test_polling_fallback_still_answers(self):
+        code, host, players = create_room()
+        host.post(reverse("start_game"))
+        response = players[1].get(reverse("player_redirect_status", args=[code]))
+        self.assertEqual(response.json(), {"redirect_url": reverse("waiting_hint")})
+
+    def test_polling_does_not_touch_the_database(self):
+        code, host, players = create_room()
+        host.post(reverse("start_game"))
+        with self.assertNumQueries(0):
+            players[1].get(reverse("player_redirect_status", args=[code]))
+            players[1].get(reverse("players_list_partial"))
+
+    async def test_stream_sends_state_on_connect_and_on_change(self):
+        code, host, players = await sync_to_async(create_room)()
+        await sync_to_async(host.post)(reverse("start_game"))
+        explainer = players[0]
+
+        client = AsyncClient()
+        client.cookies = players[1].cookies
+        response = await client.get(reverse("room_events", args=[code]))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+
+        async def next_state():
+            while True:
+                chunk = (await anext(chunks)).decode()
+                if chunk.startswith("event: state"):
+                    return json.loads(chunk.split("data: ", 1)[1])
+
+        self.assertEqual(await next_state(), {"redirect_url": reverse("waiting_hint")})
+
+        await sync_to_async(explainer.post)(
+            reverse("submit_hint", args=[code]),
+            {"short_hint": "mar", "long_hint": "azul do oceano"},
+        )
+        self.assertEqual(await asyncio.wait_for(next_state(), 5), {"redirect_url": reverse("submit_move")})
+        await chunks.aclose()
+
+    async def test_long_poll_is_answered_when_the_hint_arrives(self):
+        code, host, players = await sync_to_async(create_room)()
+        await sync_to_async(host.post)(reverse("start_game"))
+        explainer = players[0]
+
+        client = AsyncClient()
+        client.cookies = players[1].cookies
+        url = reverse("player_redirect_wait", args=[code])
+        waiting = asyncio.create_task(client.get(url, {"current": reverse("waiting_hint")}))
+        await asyncio.sleep(0.2)
+        self.assertFalse(waiting.done())
+
+        await sync_to_async(explainer.post)(
+            reverse("submit_hint", args=[code]),
+            {"short_hint": "mar", "long_hint": "azul do oceano"},
+        )
+        response = await asyncio.wait_for(waiting, 5)
+        self.assertEqual(response.json()["redirect_url"], reverse("submit_move"))
+
+        # A client that sends a stale version is answered at once.
+        response = await client.get(url, {"current": reverse("submit_move"), "version": "0"})
+        self.assertEqual(response.json()["redirect_url"], reverse("submit_move"))
+
+    def test_long_poll_is_declined_under_wsgi(self):
+        code, host, players = create_room()
+        response = players[0].get(reverse("player_redirect_wait", args=[code]))
+        self.assertEqual(response.status_code, 204)
@@ -5,12 +5,16 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('new/', views.new_game, name='new_game'),
     path('board/<str:code>/', views.board, name='board'),
+    path('board/<str:code>/live/', views.board_live_view, name='board_live'),
     path('game/', views.remote_game, name='remote_game'),
     # Multiplayer session URLs
     path('session/create/', views.create_session_view, name='create_session'),
     path('session/join/<str:code>/', views.join_session_view, name='join_session'),
     path("session/<str:code>/redirect_check/", views.player_redirect_status_view, name="player_redirect_status"),
+    path("session/<str:code>/redirect_wait/", views.player_redirect_wait_view, name="player_redirect_wait"),
+    path("session/<str:code>/events/", views.room_events_view, name="room_events"),
     path("session/<code>/scoreboard/", views.scoreboard_partial, name="scoreboard_partial"),
+    path("session/<str:code>/leaderboard/", views.leaderboard_view, name="leaderboard"),
     path("session/submit_move/", views.submit_move_view, name="submit_move"),
     path('session/<str:session_code>/submit_hint/', views.submit_hint_view, name='submit_hint'),
     path('session/lobby/', views.lobby_view, name='lobby'),
@@ -19,4 +23,5 @@ urlpatterns = [
     path('session/waiting_hint/', views.waiting_hint_view, name='waiting_hint'),
     path("session/<str:code>/results/", views.rounds_results_view, name="rounds_results"),
     path("session/next/", views.next_round_view, name="next_round"),
+    path("metrics/", views.metrics_view, name="metrics"),
 ]
\ No newline at end of file
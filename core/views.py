@@ -1,70 +1,123 @@
+from asgiref.sync import sync_to_async
+import asyncio
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, HttpResponseForbidden
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.http import JsonResponse
 from django.urls.exceptions import NoReverseMatch
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from .models import GameSession, Player
+from . import engine
+from .codes import get_code_allocator, normalize_code
+from .eviction import get_room_evictor
+from .events import room_events
+from .boardgrid import heatmap_overlay, moves_overlay, render_grid
+from .geometry import DEFAULT_SIZE, MAX_SIZE, MIN_SIZE
+from .palettes import ROOM_PRESET, seed_for
+from .engine import is_round_over
+from .room import ATTEMPTS_PER_ROUND, Player, RoomState
+from .metrics import log_event, log_sampled, registry
+from .store import get_session_store
+from .writebehind import get_write_behind
+from datetime import datetime, timezone
+import json
+import logging
 import uuid
-import random
-import string
 
 # -------------------------------------------------------------
-# Global in-memory storage for active game sessions.
-# Each key is a session code and the value stores information
-# such as mode, players, rounds and status.
+# Active game sessions live in the configured SessionStore
+# (see GAME_SESSION_STORE). Each room is a RoomState keyed by
+# its session code and stores information such as mode,
+# players, rounds and status.
 # -------------------------------------------------------------
-ACTIVE_SESSIONS = {}
-
-# Utility helpers
-GRID_MAP = {
-    'A1': '#33FF57', 'A2': '#3357FF', 'A3': '#F39C12', 'A4': '#8E44AD', 'A5': '#1ABC9C',
-    'B1': '#2ECC71', 'B2': '#E74C3C', 'B3': '#3498DB', 'B4': '#9B59B6', 'B5': '#E67E22',
-    'C1': '#BDC3C7', 'C2': '#34495E', 'C3': '#16A085', 'C4': '#27AE60', 'C5': '#2980B9',
-    'D1': '#D35400', 'D2': '#7F8C8D', 'D3': '#C0392B', 'D4': '#F1C40F', 'D5': '#E84393',
-    'E1': '#6C5CE7', 'E2': '#00CEC9', 'E3': '#FD79A8', 'E4': '#FAB1A0', 'E5': '#FFFFFF'
-}
-
-def generate_session_code():
-    """Return a unique 6-8 char session code."""
-    length = random.randint(6, 8)
-    chars = string.ascii_uppercase + string.digits
-    while True:
-        code = ''.join(random.choices(chars, k=length))
-        if code not in ACTIVE_SESSIONS:
-            return code
-
-
-def rotate_explainer(players, previous_explainer_id=None):
-    """Return the id of the next explainer in the list of non-host players."""
-    if not players:
-        return None
 
-    eligible_ids = [p["id"] for p in players if not p.get("is_host")]
-    if not eligible_ids:
-        return None
 
-    if previous_explainer_id in eligible_ids:
-        next_idx = (eligible_ids.index(previous_explainer_id) + 1) % len(eligible_ids)
-    else:
-        next_idx = 0
-    return eligible_ids[next_idx]
-
-def is_round_over(session, current_round):
-    explainer_id = current_round["explainer_id"]
-    expected_players = [
-        p["id"] for p in session["players"]
-        if p["id"] != explainer_id and not p.get("is_host")
-    ]
-    moves = current_round.get("moves", [])
+logger = logging.getLogger(__name__)
+
+# Share of hot-path debug messages (polls) that are actually logged.
+DEBUG_LOG_SAMPLE_RATE = 0.01
+
+# Seconds between keep-alive comments on idle event streams.
+EVENTS_KEEPALIVE_SECONDS = 15
+# How long a long-poll request is held open, and how often it re-reads the
+# room meanwhile to catch changes made by other worker processes.
+LONGPOLL_TIMEOUT_SECONDS = 25
+LONGPOLL_RECHECK_SECONDS = 5
+
+def is_large_room(session):
+    """True when the TV shows the audience view (see GAME_LARGE_ROOMS)."""
+    return len(session.players) > settings.GAME_LARGE_ROOMS["PLAYERS"]
+
 
-    players_with_two_moves = {
-        pid for pid in expected_players
-        if len([m for m in moves if m["player_id"] == pid]) == 2
+def ranking_entry(session, rank, index, points):
+    player = session.players[index]
+    return {
+        "id": player.id,
+        "name": player.name,
+        "rank": rank,
+        "points": points,
+        "delta": session.leaderboard.delta(index, rank),
     }
 
-    return len(players_with_two_moves) == len(expected_players)
+
+def ranking(session, top=None):
+    """The ``top`` best players (all by default), read from the room's leaderboard."""
+    return [
+        ranking_entry(session, rank, index, points)
+        for rank, index, points in session.leaderboard.top(top)
+    ]
+
+
+def room_changed(code, notify=True):
+    """Call after a store update commits: wake listeners and queue the room for the DB."""
+    if notify:
+        room_events.publish(code)
+    write_behind = get_write_behind()
+    if write_behind is not None:
+        write_behind.mark_dirty(code)
+
+
+# -------------------------------------------------------------
+# Retried requests.
+# Phones on venue Wi-Fi resend POSTs whose answer got lost. Each
+# form carries a fresh idempotency key (or the client sends an
+# Idempotency-Key header); the room remembers the last keys it
+# applied, so a retry is answered from that cache instead of
+# adding a player or a guess twice. A long-lived cookie
+# identifies the browser, so a phone that opens the join link
+# again gets its player back.
+# -------------------------------------------------------------
+
+DEVICE_COOKIE = "colorgrid_device"
+DEVICE_COOKIE_AGE = 365 * 24 * 60 * 60
+
+
+def idempotency_key(request):
+    """Key the client sent to make this POST safe to retry, or None."""
+    key = request.headers.get("Idempotency-Key") or request.POST.get("idempotency_key")
+    return key[:64] if key else None
+
+
+def device_token(request):
+    """Token of this browser from its device cookie, or None."""
+    token = request.COOKIES.get(DEVICE_COOKIE, "")
+    return token if len(token) == 32 else None
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def bind_player(request, code, player):
+    request.session["player_id"] = player.id
+    request.session["name"] = player.name
+    request.session["device"] = player.device
+    request.session["code"] = code
+
 
 def remote_game(request):
     return render(request, "core/remote_game.html")
@@ -97,37 +150,131 @@ def new_game(request):
 
     return redirect("home")
 
-def board(request, code):
-    session = ACTIVE_SESSIONS.get(code)
-    if not session:
-        return HttpResponse("Sessão não encontrada", status=404)
-
-    round_number = session.get("current_round")
-    round_data = next((r for r in session["rounds"] if r["round_number"] == round_number), None)
+def _board_context(code):
+    """Context of the live part of the TV board, or an error response."""
+    # As jogadas e as estatísticas são copiadas com a sala travada (um
+    # palpite em andamento mudaria o índice de ocupação no meio da leitura);
+    # a grade é montada depois, sem segurar os palpites da sala
+    with get_session_store().read(code) as session:
+        if not session:
+            return HttpResponse("Sessão não encontrada", status=404)
+        context = _board_live_context(code, session)
+    if isinstance(context, HttpResponse):
+        return context
+    # A grade é renderizada uma vez por paleta; só as jogadas mudam
+    context["grid"] = render_grid(context.pop("palette"), context.pop("overlay"))
+    return context
+
+
+def _board_live_context(code, session):
+    round_data = session.current_round
     if not round_data:
         return HttpResponse("Rodada não encontrada", status=404)
 
-    color_map = GRID_MAP
-
-    context = {
+    # Com plateia grande, o tabuleiro mostra quantos palpites cada casa
+    # recebeu em vez das iniciais de cada jogador
+    large = is_large_room(session)
+    return {
         "code": code,
-        "round": round_data,
-        "players": session["players"],
+        "round": {
+            "round_number": round_data.round_number,
+            "short_hint": round_data.short_hint,
+            "long_hint": round_data.long_hint,
+        },
         "is_round_over": is_round_over(session, round_data),
-        "color_map": color_map,
-        "LETTERS": ["A", "B", "C", "D", "E"],
-        "NUMBERS": ["1", "2", "3", "4", "5"],
+        "palette": session.palette,
+        # Um dicionário novo a cada leitura: pode ser usado fora da trava
+        "overlay": heatmap_overlay(round_data) if large else moves_overlay(session, round_data),
+        "heatmap": {
+            "guesses": round_data.heatmap.guesses,
+            "average_score": round_data.heatmap.average_score,
+        } if large else None,
+        # Com plateia grande, as jogadas chegam mais rápido do que a TV precisa mostrar
+        "refresh_ms": settings.GAME_LARGE_ROOMS["BOARD_REFRESH_MS"] if large else 0,
     }
+
+
+def board(request, code):
+    context = _board_context(code)
+    if isinstance(context, HttpResponse):
+        return context
     return render(request, "core/board.html", context)
 
-def scoreboard_partial(request, code):
-    print("🔁 scoreboard_partial foi chamado!")
-    session = ACTIVE_SESSIONS.get(code)
-    if not session:
-        return HttpResponse("Sessão não encontrada", status=404)
+# -------------------------------------------------------------
+# Conditional GETs for polled endpoints.
+# Every store update that changes a room bumps its version, so clients that
+# already hold the current version get a 304 without the view
+# (or its template) running at all.
+# -------------------------------------------------------------
+
+def _polled_room(request, code=None):
+    if not hasattr(request, "_polled_room"):
+        code = code or request.session.get("code")
+        request._polled_room = get_session_store().get(code) if code else None
+    return request._polled_room
 
-    players = session.get("players", [])
-    return render(request, "core/partials/scoreboard.html", {"players": players})
+def room_etag(request, code=None):
+    room = _polled_room(request, code)
+    if room is None:
+        return None
+    return f'"{room.version}-{int(room.modified * 1e6)}"'
+
+def room_last_modified(request, code=None):
+    room = _polled_room(request, code)
+    if room is None:
+        return None
+    return datetime.fromtimestamp(room.modified, tz=timezone.utc)
+
+def room_conditional(view):
+    """Answer 304 while the room is unchanged; browsers must revalidate every poll."""
+    view = condition(etag_func=room_etag, last_modified_func=room_last_modified)(view)
+    return cache_control(no_cache=True)(view)
+
+@room_conditional
+def board_live_view(request, code):
+    """Hints, stats and grid of the TV board, swapped in by htmx on room changes."""
+    context = _board_context(code)
+    if isinstance(context, HttpResponse):
+        return context
+    return render(request, "core/partials/board_live.html", context)
+
+
+@room_conditional
+def scoreboard_partial(request, code):
+    # O ranking é copiado com a sala travada e renderizado depois
+    with get_session_store().read(code) as session:
+        if not session:
+            return HttpResponse("Sessão não encontrada", status=404)
+        log_sampled(logger, logging.DEBUG, DEBUG_LOG_SAMPLE_RATE, "scoreboard_partial",
+                    code=code, players=len(session.players), version=session.version)
+        top = settings.GAME_LARGE_ROOMS["TOP_N"] if is_large_room(session) else None
+        leaderboard = ranking(session, top)
+    return render(request, "core/partials/scoreboard.html", {"leaderboard": leaderboard})
+
+
+@room_conditional
+def leaderboard_view(request, code):
+    """Ranking as JSON, with each player's rank change since the round started."""
+    try:
+        top = max(int(request.GET.get("top", 10)), 0)
+    except ValueError:
+        top = 10
+
+    with get_session_store().read(code) as session:
+        if not session:
+            return JsonResponse({"error": "Sessão não encontrada"}, status=404)
+        me = None
+        player = session.get_player(request.session.get("player_id"))
+        if player is not None and player.index in session.leaderboard:
+            rank = session.leaderboard.rank(player.index)
+            me = ranking_entry(session, rank, player.index, player.points)
+        data = {
+            "version": session.version,
+            "players": len(session.leaderboard),
+            "top": ranking(session, top),
+            "me": me,
+        }
+    return JsonResponse(data)
 
 
 
@@ -141,24 +288,24 @@ def create_session_view(request):
     if request.method == "POST":
         # Mode defaults to "local" if not provided
         mode = request.POST.get("mode", "local")
-        name = request.POST.get("name", "Host")
+        if mode not in engine.MODES:
+            return HttpResponse("Modo de jogo inválido.", status=400)
+        try:
+            name, _ = engine.check_player(request.POST.get("name", "Host"), "tv")
+        except engine.RuleError as exc:
+            return HttpResponse(str(exc), status=400)
 
-        code = generate_session_code()
         player_id = str(uuid.uuid4())
+        room = RoomState(mode=mode)
+        room.add_player(Player(id=player_id, name=name, device="tv", is_host=True))
 
-        ACTIVE_SESSIONS[code] = {
-            "mode": mode,
-            "players": [
-                {
-                    "id": player_id,
-                    "name": name,
-                    "device": "tv",
-                    "is_host": True,
-                }
-            ],
-            "rounds": [],
-            "status": "lobby",
-        }
+        # Codes never repeat; the store only refuses one if the code key
+        # changed while rooms from before were still around.
+        code = get_code_allocator().allocate()
+        while not get_session_store().add(code, room):
+            code = get_code_allocator().allocate()
+        room_changed(code, notify=False)
+        get_room_evictor().enforce_cap()
 
         request.session["player_id"] = player_id
         request.session["name"] = name
@@ -171,58 +318,88 @@ def create_session_view(request):
 
 
 def join_session_view(request, code):
-    session = ACTIVE_SESSIONS.get(code)
+    # Códigos digitados errado são recusados sem consultar as salas
+    typed, code = code, normalize_code(code)
+    if code is None:
+        return HttpResponse("Sessão não encontrada", status=404)
+    if code != typed:
+        return redirect("join_session", code=code)
+
+    store = get_session_store()
+    session = store.get(code)
     if not session:
         return HttpResponse("Sessão não encontrada", status=404)
 
+    # Reconexão: este aparelho já tem um jogador na sala
+    token = device_token(request)
+    player = session.player_for_token(token)
+    if player is not None:
+        bind_player(request, code, player)
+        return redirect(get_redirect_url(code, player.id) or "lobby")
+
     if request.method == "POST":
         name = request.POST.get("name")
         if not name:
             return redirect("join_session", code=code)
-
-        player_id = str(uuid.uuid4())
-        device = request.POST.get("device", "mobile")
-
-        session["players"].append({
-            "id": player_id,
-            "name": name,
-            "device": device,
-            "is_host": False,
-        })
-
-        request.session["player_id"] = player_id
-        request.session["name"] = name
-        request.session["device"] = device
-        request.session["code"] = code
-
-        return redirect("lobby")
+        # Validado aqui: o gravador em segundo plano não pode recusar o jogador
+        try:
+            name, device = engine.check_player(name, request.POST.get("device", "mobile"))
+        except engine.RuleError as exc:
+            return HttpResponse(str(exc), status=400)
+
+        # Reenvio de um POST cuja resposta (e o cookie) se perdeu
+        key = idempotency_key(request)
+        player = session.get_player(session.seen_request(key))
+        if player is None:
+            with store.update(code) as session:
+                if not session:
+                    return HttpResponse("Sessão não encontrada", status=404)
+                player = session.player_for_token(token) or session.get_player(session.seen_request(key))
+                joined = player is None
+                if joined:
+                    player = session.add_player(Player(
+                        id=str(uuid.uuid4()), name=name, device=device, token=token or uuid.uuid4().hex,
+                    ))
+                    if key:
+                        session.remember_request(key, player.id)
+            if joined:
+                room_changed(code)
+
+        bind_player(request, code, player)
+        response = redirect("lobby")
+        response.set_cookie(DEVICE_COOKIE, player.token, max_age=DEVICE_COOKIE_AGE, httponly=True, samesite="Lax")
+        return response
 
     # NOVO: Exibe o formulário se o request for GET
-    return render(request, "core/join.html", {"code": code})
+    return render(request, "core/join.html", {"code": code, "idempotency_key": new_idempotency_key()})
 
 
 def lobby_view(request):
     """Display the waiting room with current players."""
     code = request.session.get("code")
-    session = ACTIVE_SESSIONS.get(code)
+    session = get_session_store().get(code)
     if not session:
         return HttpResponse("Sess\u00e3o inexistente", status=404)
 
     context = {
         "code": code,
-        "players": session["players"],
+        "players": session.players,
+        "default_grid_size": DEFAULT_SIZE,
+        "min_grid_size": MIN_SIZE,
+        "max_grid_size": MAX_SIZE,
     }
     return render(request, "core/lobby.html", context)
 
 
+@room_conditional
 def players_list_partial(request):
     """Return a partial HTML list of connected players."""
     code = request.session.get("code")
-    session = ACTIVE_SESSIONS.get(code)
+    session = get_session_store().get(code)
     if not session:
         return HttpResponse("", status=404)
 
-    items = "".join(f"<li>{p['name']}</li>" for p in session["players"])
+    items = "".join(f"<li>{p.name}</li>" for p in session.players)
     return HttpResponse(f"<ul>{items}</ul>")
 
 
@@ -230,66 +407,60 @@ def start_game_view(request):
 
     """Start the game or redirect players to the correct screen."""
     code = request.session.get("code")
-    session = ACTIVE_SESSIONS.get(code)
+    store = get_session_store()
+    session = store.get(code)
     if not session:
         return HttpResponse("Sessão inexistente", status=404)
 
     player_id = request.session.get("player_id")
-    player = next((p for p in session["players"] if p["id"] == player_id), None)
+    player = session.get_player(player_id)
     if not player:
         return HttpResponseForbidden("Jogador inválido")
 
     # Se o jogo já iniciou, apenas redireciona corretamente cada jogador
-    if session.get("status") == "in_game" and session.get("current_round"):
-        current_round = next(
-            (r for r in session["rounds"] if r["round_number"] == session["current_round"]),
-            None,
-        )
-        explainer_id = current_round["explainer_id"] if current_round else None
+    if session.status == "in_game" and session.current_round:
+        explainer_id = session.current_round.explainer_id
 
         if player_id == explainer_id:
             return redirect("submit_hint", session_code=code)
-        elif player.get("is_host"):
-            return redirect("waiting_hint")
+        elif player.is_host:
+            return redirect("board", code=code)
         else:
             return redirect("waiting_hint")
 
     # Somente o host pode iniciar a primeira rodada
-    if not player.get("is_host"):
+    if not player.is_host:
         return HttpResponseForbidden("Apenas o host pode iniciar a partida")
 
-    round_number = len(session["rounds"]) + 1
-    explainer_id = rotate_explainer(session["players"])
-    grid_size = 5
-    key, color = random.choice(list(GRID_MAP.items()))
-    target_row = ["A", "B", "C", "D", "E"].index(key[0])
-    target_col = ["1", "2", "3", "4", "5"].index(key[1])
-
-    session["rounds"].append(
-        {
-            "round_number": round_number,
-            "explainer_id": explainer_id,
-            "target_color": color,
-            "target_position": {"row": target_row, "col": target_col},
-            "short_hint": "",
-            "long_hint": "",
-            "moves": [],
-        }
-    )
-    session["grid_size"] = grid_size
-    session["current_round"] = round_number
-    session["status"] = "in_game"
-    print("DEBUG ACTIVE_SESSIONS:", ACTIVE_SESSIONS)
-    # Replicando a lógica de player_redirect_status_view
-    current_round = next(
-        (r for r in session["rounds"] if r["round_number"] == session["current_round"]),
-        None,
-    )
-    explainer_id = current_round["explainer_id"] if current_round else None
+    # Tabuleiro quadrado com o tamanho escolhido no lobby
+    try:
+        grid_size = int(request.POST.get("grid_size", DEFAULT_SIZE))
+    except ValueError:
+        grid_size = DEFAULT_SIZE
+    grid_size = min(max(grid_size, MIN_SIZE), MAX_SIZE)
+    # Paleta da sala: uma predefinida ou sorteada para esta partida
+    palette_seed = seed_for(request.POST.get("palette", ROOM_PRESET))
+
+    with store.update(code) as session:
+        if not session:
+            return HttpResponse("Sessão inexistente", status=404)
+
+        # Um segundo clique do host não cria outra rodada
+        first_round = engine.start_game(session, grid_size, palette_seed)
+        if first_round is not None:
+            session.palette.delta_e  # Build the board's distance table now, not on the first guess.
+            log_event(logger, logging.INFO, "game_started", code=code,
+                      players=len(session.players), explainer=first_round.explainer_id)
+
+        # Replicando a lógica de player_redirect_status_view
+        current_round = session.current_round
+        explainer_id = current_round.explainer_id if current_round else None
+    if first_round is not None:
+        room_changed(code)
 
     if player_id == explainer_id:
         return redirect("submit_hint", session_code=code)
-    elif player.get("is_host"):
+    elif player.is_host:
         return redirect("board", code=code)
     else:
         return redirect("waiting_hint")
@@ -299,38 +470,54 @@ def submit_hint_view(request, session_code):
     code = session_code  
     player_id = request.session.get("player_id")
 
-    session = ACTIVE_SESSIONS.get(code)
+    store = get_session_store()
+    session = store.get(code)
     if not session:
         return HttpResponse("Sessão não encontrada", status=404)
 
-    round_number = session.get("current_round")
-    current_round = next((r for r in session["rounds"] if r["round_number"] == round_number), None)
+    current_round = session.current_round
     if not current_round:
         return HttpResponse("Rodada não encontrada", status=404)
+    round_number = current_round.round_number
 
     # Verifica se é o explicador
-    if current_round["explainer_id"] != player_id:
+    if current_round.explainer_id != player_id:
         return HttpResponseForbidden("Apenas o explicador pode enviar dicas.")
 
     if request.method == "POST":
-        short_hint = request.POST.get("short_hint", "").strip()
-        long_hint = request.POST.get("long_hint", "").strip()
-
-        if not short_hint or " " in short_hint:
-            return HttpResponse("A dica curta deve ser uma única palavra.", status=400)
-        if not long_hint or len(long_hint) > 50:
-            return HttpResponse("A dica longa deve ter até 50 caracteres.", status=400)
+        # Dicas reenviadas já estão na rodada
+        key = idempotency_key(request)
+        if key and session.seen_request(key) == player_id:
+            return redirect("waiting_hint")
 
-        current_round["short_hint"] = short_hint
-        current_round["long_hint"] = long_hint
+        try:
+            short_hint, long_hint = engine.check_hints(
+                request.POST.get("short_hint", ""), request.POST.get("long_hint", ""),
+            )
+        except engine.RuleError as exc:
+            return HttpResponse(str(exc), status=400)
+
+        with store.update(code) as session:
+            if not session:
+                return HttpResponse("Sessão não encontrada", status=404)
+            if not session.get_round(round_number):
+                return HttpResponse("Rodada não encontrada", status=404)
+            changed = not key or session.seen_request(key) != player_id
+            if changed:
+                session.set_hints(round_number, short_hint, long_hint)
+                if key:
+                    session.remember_request(key, player_id)
+        if changed:
+            room_changed(code)
 
         return redirect("waiting_hint")
 
     return render(request, "core/submit_hint.html", {
         "code": code,
-        "short_hint": current_round.get("short_hint", ""),
-        "long_hint": current_round.get("long_hint", ""),
-        "target_color": current_round.get("target_color", "")
+        "short_hint": current_round.short_hint,
+        "long_hint": current_round.long_hint,
+        "target_color": current_round.target_color,
+        "idempotency_key": new_idempotency_key(),
     })
 
 
@@ -340,139 +527,116 @@ def submit_move_view(request):
     code = request.session.get("code")
     player_id = request.session.get("player_id")
 
-    session = ACTIVE_SESSIONS.get(code)
+    store = get_session_store()
+    if request.method == "POST":
+        # Um palpite reenviado já foi contado: basta consultar o cache
+        key = idempotency_key(request)
+        session = store.get(code)
+        if player_id and session and session.seen_request(key) == player_id:
+            return redirect("waiting_hint")
+        # Attempt detection and the append must see the same state.
+        with store.update(code) as session:
+            edits = session.edits if session else None
+            response = _handle_move(request, code, player_id, session, key)
+            changed = session is not None and session.edits != edits
+        # Coordenadas inválidas e redirecionamentos não mudam a sala
+        if changed:
+            room_changed(code)
+        return response
+    return _handle_move(request, code, player_id, store.get(code))
+
+
+def _handle_move(request, code, player_id, session, key=None):
     if not session:
         return HttpResponse("Sessão não encontrada", status=404)
 
-    if session.get("status") != "in_game":
+    if session.status != "in_game":
         return HttpResponse("O jogo ainda não começou.", status=400)
 
-    round_number = session.get("current_round")
-    current_round = next((r for r in session["rounds"] if r["round_number"] == round_number), None)
+    current_round = session.current_round
     if not current_round:
         return HttpResponse("Rodada não encontrada", status=404)
 
-    if player_id == current_round["explainer_id"]:
+    if player_id == current_round.explainer_id:
         return redirect("submit_hint", session_code=code)
 
-    moves = current_round.get("moves", [])
-    player_moves = [m for m in moves if m["player_id"] == player_id]
-    attempt_1_done = any(m["attempt_number"] == 1 for m in player_moves)
-    attempt_2_done = any(m["attempt_number"] == 2 for m in player_moves)
-
-    has_short = bool(current_round.get("short_hint"))
-    has_long = bool(current_round.get("long_hint"))
+    # Outro reenvio chegou primeiro, enquanto este esperava a sala
+    if key and session.seen_request(key) == player_id:
+        return redirect("waiting_hint")
 
-    if has_short and not attempt_1_done:
-        current_attempt = 1
-    elif has_long and attempt_1_done and not attempt_2_done:
-        current_attempt = 2
-    else:
-        return redirect("rounds_results", code=code)
+    # Host, palpites esgotados ou rodada já fechada: nada a jogar aqui
+    current_attempt = engine.current_attempt(session, player_id, current_round)
+    if current_attempt is None:
+        if is_round_over(session, current_round):
+            return redirect("rounds_results", code=code)
+        return redirect("waiting_hint")
 
     if request.method == "POST":
         try:
-            guess_row_letter = request.POST.get("row")
-            guess_row = ["A", "B", "C", "D", "E"].index(guess_row_letter)
-            guess_col = int(request.POST.get("col"))
-            guess_col -= 1  # Adjust to zero-based index
+            guess_row, guess_col = session.geometry.parse(request.POST.get("row"), request.POST.get("col"))
         except (TypeError, ValueError):
             return HttpResponse("Coordenadas inválidas.", status=400)
 
-        target = current_round["target_position"]
-        dr = abs(target["row"] - guess_row)
-        dc = abs(target["col"] - guess_col)
-        dist = max(dr, dc)
-
-        if dist == 0:
-            score = 4
-        elif dist == 1:
-            score = 3
-        elif dist == 2:
-            score = 2
-        else:
-            score = 0
-
-        move = {
-            "player_id": player_id,
-            "attempt_number": current_attempt,
-            "row": guess_row,
-            "col": guess_col,
-            "distance": dist,
-            "score": score,
-        }
-
-        current_round["moves"].append(move)
-
-        # Award bonus points to the explainer
-        if score > 0:
-            explainer_id = current_round["explainer_id"]
-            explainer = next((p for p in session["players"] if p["id"] == explainer_id), None)
-            if explainer:
-                explainer_bonus = max(score - 1, 0)
-                explainer["points"] = explainer.get("points", 0) + explainer_bonus
+        # Pontua, dá o bônus ao explicador e fecha a rodada na última jogada
+        engine.play_move(session, player_id, guess_row, guess_col, method=settings.GAME_SCORING["METHOD"])
+        if key:
+            session.remember_request(key, player_id)
 
-        # Redirect based on player role
-        if player_id == current_round["explainer_id"]:
-            return redirect("submit_hint", session_code=code)
-        elif any(
-            len([m for m in current_round["moves"] if m["player_id"] == p["id"]]) < 2
-            for p in session["players"] if p["id"] != current_round["explainer_id"]
-        ):
-            return redirect("waiting_hint")
-        else:
-            return redirect("waiting_hint")
+        # O explicador já foi redirecionado acima; quem palpitou espera
+        return redirect("waiting_hint")
 
+    geometry = session.geometry
     return render(request, "core/submit_move.html", {
         "attempt": current_attempt,
         "code": code,
-        "grid_size": session.get("grid_size", 5)
+        "grid_size": session.grid_size,
+        "last_row": geometry.row_labels[-1],
+        "last_col": geometry.cols,
+        "idempotency_key": new_idempotency_key(),
     })
 
 def rounds_results_view(request, code):
-    session = ACTIVE_SESSIONS.get(code)
+    store = get_session_store()
+    session = store.get(code)
     if not session:
         return HttpResponse("Sessão não encontrada", status=404)
 
-    round_number = session.get("current_round")
-    current_round = next((r for r in session["rounds"] if r["round_number"] == round_number), None)
+    current_round = session.current_round
     if not current_round:
         return HttpResponse("Rodada não encontrada", status=404)
+    round_number = current_round.round_number
 
     if not is_round_over(session, current_round):
         return HttpResponse("A rodada ainda não terminou.", status=400)
 
     player_id = request.session.get("player_id")
-    is_explainer = player_id == current_round["explainer_id"]
-
-    # Organiza ranking da rodada e geral
-    players_data = []
-    for player in session["players"]:
-        player_moves = [m for m in current_round["moves"] if m["player_id"] == player["id"]]
-        round_score = sum(m["score"] for m in player_moves)
-        if not current_round.get("scored", False):
-            player["points"] = player.get("points", 0) + round_score
-        players_data.append({
-            "name": player["name"],
-            "round_score": round_score,
-            "total_score": player["points"],
-        })
-    current_round["scored"] = True
-
-    target_position = current_round["target_position"]
-    row_index = target_position["row"]
-    row_letter = chr(ord("A") + row_index)
-    col_index = target_position["col"]
+    is_explainer = player_id == current_round.explainer_id
+
+    # A rodada é fechada pela última jogada; aqui só se lê o resultado.
+    # Salas recarregadas do banco ainda não têm o resumo em memória.
+    results = current_round.results
+    if results is None:
+        with store.update(code) as session:
+            # A sala pode ter sido descartada desde a leitura acima
+            if not session:
+                return HttpResponse("Sessão não encontrada", status=404)
+            current_round = session.get_round(round_number)
+            edits = session.edits
+            results = engine.round_results(session, current_round)
+            changed = session.edits != edits
+        if changed:
+            room_changed(code, notify=False)
+
     context = {
         "code": code,
-        "target_color": current_round["target_color"],
+        "target_color": current_round.target_color,
         "target_position": {
-            "row": row_letter,
-            "col": col_index + 1,
+            "row": session.geometry.row_labels[current_round.target_row],
+            "col": current_round.target_col + 1,
         },
-        "short_hint": current_round.get("short_hint", ""),
-        "long_hint": current_round.get("long_hint", ""),
-        "players_data": players_data,
+        "short_hint": current_round.short_hint,
+        "long_hint": current_round.long_hint,
+        "players_data": results[:settings.GAME_LARGE_ROOMS["TOP_N"]] if is_large_room(session) else results,
         "is_explainer": is_explainer,
     }
 
@@ -480,49 +644,35 @@ def rounds_results_view(request, code):
 
 def next_round_view(request):
     code = request.session.get("code")
-    session = ACTIVE_SESSIONS.get(code)
+    with get_session_store().update(code) as session:
+        edits = session.edits if session else None
+        response = _start_next_round(request, code, session)
+        changed = session is not None and session.edits != edits
+    if changed:
+        room_changed(code)
+    return response
+
+
+def _start_next_round(request, code, session):
     if not session:
         return HttpResponse("Sessão não encontrada", status=404)
 
-    current_round_number = session.get("current_round", 0)
-    current_round = next((r for r in session["rounds"] if r["round_number"] == current_round_number), None)
+    current_round = session.current_round
     if not current_round:
         return HttpResponse("Rodada atual não encontrada", status=404)
 
-    if request.session.get("player_id") != current_round["explainer_id"]:
+    if request.session.get("player_id") != current_round.explainer_id:
         return HttpResponse("Apenas o explicador pode iniciar a próxima rodada.", status=403)
 
-    # Novo explicador
-    next_explainer_id = rotate_explainer(
-        session["players"], current_round.get("explainer_id")
-    )
-
-    # Nova cor e posição alvo
-    grid_size = session.get("grid_size", 5)
-    key, target_color = random.choice(list(GRID_MAP.items()))
-    target_position = {
-        "row": ["A", "B", "C", "D", "E"].index(key[0]),
-        "col": ["1", "2", "3", "4", "5"].index(key[1])
-    }
-
-    new_round = {
-        "round_number": current_round_number + 1,
-        "explainer_id": next_explainer_id,
-        "target_color": target_color,
-        "target_position": target_position,
-        "short_hint": "",
-        "long_hint": "",
-        "moves": [],
-    }
-
-    session["current_round"] = current_round_number + 1
-    session["rounds"].append(new_round)
+    # Novo explicador, nova cor e posição alvo
+    next_explainer_id = engine.next_round(session).explainer_id
 
     player_id = request.session.get("player_id")
+    player = session.get_player(player_id)
 
     if player_id == next_explainer_id:
         return redirect("submit_hint", session_code=code)
-    elif any(p["id"] == player_id and p.get("is_host") for p in session["players"]):
+    elif player and player.is_host:
         return redirect("board", code=code)
     else:
         return redirect("waiting_hint")
@@ -531,20 +681,20 @@ def next_round_view(request):
 # --- NOVA VIEW: waiting_hint_view ---
 def waiting_hint_view(request):
     code = request.session.get("code")
-    session = ACTIVE_SESSIONS.get(code)
+    session = get_session_store().get(code)
     if not session:
         return HttpResponse("Sessão não encontrada", status=404)
 
-    round_number = session.get("current_round")
-    current_round = next((r for r in session["rounds"] if r["round_number"] == round_number), None)
+    current_round = session.current_round
     if not current_round:
         return HttpResponse("Rodada não encontrada", status=404)
 
-    # Redireciona para submit_move apenas se o jogador não for o explicador
-    # e ambas as dicas (curta e longa) já estiverem presentes.
+    # Redireciona para submit_move apenas quem adivinha nesta rodada (nem o
+    # host, nem o explicador, nem quem entrou depois dela fechada), com ambas
+    # as dicas (curta e longa) já presentes e ainda restando palpite a dar.
     player_id = request.session.get("player_id")
-    if player_id != current_round["explainer_id"]:
-        if current_round.get("short_hint") and current_round.get("long_hint"):
+    if current_round.short_hint and current_round.long_hint:
+        if engine.current_attempt(session, player_id, current_round) is not None:
             return redirect("submit_move")
 
     # Verifica se a rodada acabou e redireciona para rounds_results se necessário
@@ -553,51 +703,165 @@ def waiting_hint_view(request):
 
     return render(request, "core/waiting_hint.html", {"code": code})
 
-def player_redirect_status_view(request, code):
-    player_id = request.session.get("player_id")
+def get_redirect_url(code, player_id):
+    """Return the screen ``player_id`` should be on, or None to stay put."""
     if not player_id:
-        return JsonResponse({"redirect_url": None})
+        return None
 
-    session = ACTIVE_SESSIONS.get(code)
+    session = get_session_store().get(code)
     if not session:
-        return JsonResponse({"redirect_url": None})
-
-    if session.get("status") != "in_game":
-        return JsonResponse({"redirect_url": None})
+        return None
 
-    round_number = session.get("current_round")
-    current_round = next((r for r in session["rounds"] if r["round_number"] == round_number), None)
+    if session.status != "in_game":
+        return None
 
+    current_round = session.current_round
     if not current_round:
-        return JsonResponse({"redirect_url": None})
+        return None
 
-    explainer_id = current_round["explainer_id"]
-    player = next((p for p in session["players"] if p["id"] == player_id), None)
+    explainer_id = current_round.explainer_id
+    player = session.get_player(player_id)
     if not player:
-        return JsonResponse({"redirect_url": None})
+        return None
 
     # 👉 Caso 1: rodada acabou → todos para os resultados
     if is_round_over(session, current_round):
-        redirect_url = reverse("rounds_results", args=[code])
-        return JsonResponse({"redirect_url": redirect_url})
+        return reverse("rounds_results", args=[code])
 
     # 👉 Caso 2: explicador ainda não deu as dicas → todos esperam
-    if not current_round.get("short_hint") or not current_round.get("long_hint"):
-        if player["id"] == explainer_id:
-            redirect_url = reverse("submit_hint", args=[code])
-        elif player.get("is_host"):
-            redirect_url = reverse("board", args=[code])
+    if not current_round.short_hint or not current_round.long_hint:
+        if player.id == explainer_id:
+            return reverse("submit_hint", args=[code])
+        elif player.is_host:
+            return reverse("board", args=[code])
         else:
-            redirect_url = reverse("waiting_hint")
-        return JsonResponse({"redirect_url": redirect_url})
+            return reverse("waiting_hint")
 
     # 👉 Caso 3: dicas já foram dadas → jogadores enviam palpites
-    if player["id"] == explainer_id:
-        redirect_url = reverse("waiting_hint")
-    elif player.get("is_host"):
-        redirect_url = reverse("board", args=[code])
+    if player.id == explainer_id:
+        return reverse("waiting_hint")
+    elif player.is_host:
+        return reverse("board", args=[code])
+    elif session.attempts_of(player.id) >= ATTEMPTS_PER_ROUND:
+        return reverse("waiting_hint")  # já usou os dois palpites
     else:
-        redirect_url = reverse("submit_move")  # jogadores enviam palpite
+        return reverse("submit_move")  # jogadores enviam palpite
 
-    return JsonResponse({"redirect_url": redirect_url})
 
+@room_conditional
+def player_redirect_status_view(request, code):
+    """Polling fallback for clients that cannot keep an event stream open."""
+    player_id = request.session.get("player_id")
+    return JsonResponse({"redirect_url": get_redirect_url(code, player_id)})
+
+
+def get_redirect_state(code, player_id):
+    """Return ``(redirect_url, room version)``, or None if the room is gone."""
+    session = get_session_store().get(code)
+    if session is None:
+        return None
+    return get_redirect_url(code, player_id), session.version
+
+
+async def player_redirect_wait_view(request, code):
+    """Long-poll variant of ``player_redirect_status_view``.
+
+    The request is held until the player has to leave the ``current`` page
+    or, if the client sent the room ``version`` it knows, until the room
+    changes at all (an empty version answers at once). Either way it is
+    answered after LONGPOLL_TIMEOUT_SECONDS.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Holding the request would tie up a WSGI worker: let the page poll.
+        return HttpResponse(status=204)
+
+    player_id = await request.session.aget("player_id")
+    if not player_id:
+        return HttpResponse(status=204)
+
+    since = request.GET.get("version")
+    current = request.GET.get("current")
+    redirect_state = sync_to_async(get_redirect_state, thread_sensitive=False)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LONGPOLL_TIMEOUT_SECONDS
+    # Subscribe before reading so a change in between is not missed.
+    subscription = room_events.subscribe(code)
+    try:
+        while True:
+            state = await redirect_state(code, player_id)
+            if state is None:
+                return JsonResponse({"redirect_url": None}, status=404)
+            redirect_url, version = state
+            remaining = deadline - loop.time()
+            moved = redirect_url and redirect_url != current
+            changed = since is not None and str(version) != since
+            if moved or changed or remaining <= 0:
+                break
+            await subscription.wait(min(remaining, LONGPOLL_RECHECK_SECONDS))
+    finally:
+        room_events.unsubscribe(subscription)
+
+    response = JsonResponse({"redirect_url": redirect_url, "version": version})
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+async def room_events_view(request, code):
+    """Push the player's redirect target as Server-Sent Events.
+
+    A ``state`` event is sent on connect and again every time the room
+    is published to by a mutating view.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Streaming requires the ASGI server; a 204 tells EventSource
+        # not to reconnect, so the page keeps polling instead.
+        return HttpResponse(status=204)
+
+    player_id = await request.session.aget("player_id")
+    if not player_id:
+        return HttpResponse(status=204)
+
+    # The store may do blocking I/O, keep it off the event loop.
+    room_exists = sync_to_async(get_session_store().__contains__, thread_sensitive=False)
+    redirect_url_for = sync_to_async(get_redirect_url, thread_sensitive=False)
+    if not await room_exists(code):
+        return HttpResponse(status=204)
+
+    async def stream():
+        subscription = room_events.subscribe(code)
+        try:
+            yield "retry: 3000\n\n"
+            changed = True
+            last_url = None
+            while True:
+                redirect_url = await redirect_url_for(code, player_id)
+                if redirect_url is None and not await room_exists(code):
+                    break  # Room was evicted.
+                # Changes made by other worker processes never reach this
+                # process' bus, so they are picked up on the keep-alive tick.
+                if changed or redirect_url != last_url:
+                    payload = json.dumps({"redirect_url": redirect_url})
+                    yield f"event: state\ndata: {payload}\n\n"
+                else:
+                    yield ": keep-alive\n\n"
+                last_url = redirect_url
+                changed = await subscription.wait(EVENTS_KEEPALIVE_SECONDS)
+        finally:
+            room_events.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def metrics_view(request):
+    """Metrics of this worker process in the Prometheus text format."""
+    config = settings.GAME_METRICS
+    if not config.get("ENABLED"):
+        return HttpResponse(status=404)
+    allowed = config.get("ALLOWED_IPS")
+    if allowed is not None and request.META.get("REMOTE_ADDR") not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
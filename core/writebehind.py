@@ -0,0 +1,136 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from .persistence import room_writer
+from .store import get_session_store
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------
+# Write-behind persistence.
+# Views only mark a room as dirty; a background thread writes
+# the dirty rooms to the database in one batch every
+# FLUSH_INTERVAL seconds, or sooner once MAX_PENDING rooms are
+# waiting (see GAME_PERSISTENCE). Rooms are written from a
+# snapshot taken under the room's lock, and whatever is still
+# pending is flushed when the process exits.
+# -------------------------------------------------------------
+
+
+class WriteBehindQueue:
+    """Set of rooms changed since the last flush, plus the thread flushing it."""
+
+    def __init__(self, flush_interval=None, max_pending=None, writer=room_writer):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.writer = writer
+        self.counters = {"flushes": 0, "rooms_written": 0, "flush_failed": 0}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def mark_dirty(self, code):
+        with self._lock:
+            self._pending.add(code)
+            full = self.max_pending is not None and len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+        self.start()
+
+    def discard(self, code):
+        with self._lock:
+            self._pending.discard(code)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write every pending room. Return how many were written."""
+        with self._lock:
+            codes, self._pending = self._pending, set()
+        if not codes:
+            return 0
+
+        store = get_session_store()
+        rooms = [(code, room) for code in codes if (room := store.snapshot(code)) is not None]
+        try:
+            self.writer.write(rooms)
+        except Exception:
+            logger.exception("Write-behind flush of %d room(s) failed", len(rooms))
+            with self._lock:
+                self._pending |= codes
+            self.counters["flush_failed"] += 1
+            return 0
+        self.counters["flushes"] += 1
+        self.counters["rooms_written"] += len(rooms)
+        return len(rooms)
+
+    # Background flusher --------------------------------------
+
+    def start(self):
+        if not self.flush_interval or (self._thread and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="room-writer", daemon=True)
+        self._thread.start()
+        atexit.unregister(self.stop)
+        atexit.register(self.stop)
+
+    def stop(self, flush=True):
+        """Stop the flusher thread, then write what is still pending."""
+        atexit.unregister(self.stop)
+        self._stopped.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.flush_interval)
+        if flush:
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_behind():
+    """Return the queue configured by ``GAME_PERSISTENCE``, or None if disabled."""
+    global _queue
+    config = settings.GAME_PERSISTENCE
+    if not config.get("ENABLED"):
+        return None
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteBehindQueue(
+                    flush_interval=config.get("FLUSH_INTERVAL"),
+                    max_pending=config.get("MAX_PENDING"),
+                )
+    return _queue
+
+
+@receiver(setting_changed)
+def _reset_write_behind(setting, **kwargs):
+    global _queue
+    if setting == "GAME_PERSISTENCE" and _queue is not None:
+        _queue.stop(flush=False)
+        _queue = None